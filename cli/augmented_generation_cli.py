@@ -1,10 +1,36 @@
 import argparse
 
 from lib.augmented_generation import rag, summarize, citations, answer_question
+from lib.llm import bypass_cache
+from lib.search_client import SearchClient, get_server_url
+from lib.search_utils import TRACE_FORMATS
+from lib.tracing import start_trace
 
 
 def main():
     parser = argparse.ArgumentParser(description="Retrieval Augmented Generation CLI")
+    parser.add_argument(
+        "--server",
+        type=str,
+        help="URL of a running search server (defaults to $SEARCH_SERVER_URL)",
+    )
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Send every Gemini call to the API without using the response cache",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="PATH",
+        help="Write a timing trace of every pipeline stage to PATH",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="json",
+        help="Span tree (json) or Chrome trace events (chrome)",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     rag_parser = subparsers.add_parser(
@@ -36,11 +62,22 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.no_llm_cache:
+        bypass_cache()
+    if args.trace:
+        start_trace(args.trace, args.trace_format)
+    client = None
+    server_url = get_server_url(args.server)
+    if server_url:
+        client = SearchClient(server_url)
 
     match args.command:
         case "rag":
             query = args.query
-            result = rag(query)
+            if client:
+                result = client.rag(query, "rag")
+            else:
+                result = rag(query)
             print("Search Results:")
             for r in result["search_results"]:
                 print(f"  - {r}")
@@ -49,7 +86,10 @@ def main():
         case "summarize":
             query = args.query
             limit = args.limit
-            result = summarize(query, limit)
+            if client:
+                result = client.rag(query, "summarize", limit)
+            else:
+                result = summarize(query, limit)
             print("Search Results:")
             for r in result["search_results"]:
                 print(f"  - {r}")
@@ -59,7 +99,10 @@ def main():
         case "citations":
             query = args.query
             limit = args.limit
-            result = citations(query, limit)
+            if client:
+                result = client.rag(query, "citations", limit)
+            else:
+                result = citations(query, limit)
             print("Search Results:")
             for i, r in enumerate(result["search_results"], 1):
                 print(f"  {i}. {r[0]} - ID: {r[1]} ")
@@ -69,7 +112,10 @@ def main():
         case "question":
             question = args.question
             limit = args.limit
-            result = answer_question(question, limit)
+            if client:
+                result = client.rag(question, "question", limit)
+            else:
+                result = answer_question(question, limit)
             print("Search Results:")
             for i, r in enumerate(result["search_results"], 1):
                 print(f"  {i}. {r[0]} - ID: {r[1]} ")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+
+from lib.benchmark import benchmark_command
+from lib.search_utils import (
+    BENCHMARK_CHUNKS_PER_DOC,
+    BENCHMARK_EMBEDDING_DIM,
+    BENCHMARK_QUERIES,
+    BENCHMARK_SIZES,
+    DEFAULT_SEARCH_LIMIT,
+    QUANTIZATION_MODES,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark every retrieval path on synthetic corpora"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(BENCHMARK_SIZES),
+        help="Corpus sizes (number of documents) to benchmark",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=BENCHMARK_QUERIES, help="Queries per engine"
+    )
+    parser.add_argument(
+        "--dim",
+        type=int,
+        default=BENCHMARK_EMBEDDING_DIM,
+        help="Dimension of the dummy embeddings",
+    )
+    parser.add_argument(
+        "--chunks-per-doc",
+        type=int,
+        default=BENCHMARK_CHUNKS_PER_DOC,
+        help="Dummy chunk embeddings per document",
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_MODES,
+        help="Benchmark the semantic engines with quantized embeddings",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Results per query"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the full report as JSON instead of text",
+    )
+
+    args = parser.parse_args()
+
+    report = benchmark_command(
+        tuple(args.sizes),
+        args.queries,
+        args.dim,
+        args.chunks_per_doc,
+        args.quantization,
+        args.limit,
+    )
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+
+    for size in report["sizes"]:
+        print(f"{size['documents']} documents (peak RSS {size['peak_rss_mb']:.0f} MB):")
+        for engine in ("keyword", "semantic", "chunked", "hybrid"):
+            stats = size[engine]
+            if "error" in stats:
+                print(f"  - {engine}: failed with {stats['error']}")
+                continue
+            timings = [
+                f"{name}={value:.2f}s"
+                for name, value in stats.items()
+                if name.endswith("_s")
+            ]
+            print(f"  - {engine}: {', '.join(timings)}".rstrip())
+            for name, value in stats.items():
+                if isinstance(value, dict):
+                    print(
+                        f"    - {name}: p50={value['p50_ms']:.2f}ms "
+                        f"p99={value['p99_ms']:.2f}ms {value['qps']:.1f} q/s"
+                    )
+
+
+if __name__ == "__main__":
+    main()
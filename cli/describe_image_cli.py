@@ -1,6 +1,7 @@
 import argparse
 
 from lib.describe_image import describe_image
+from lib.llm import bypass_cache
 
 
 def main(rag_summarize=None):
@@ -8,13 +9,20 @@ def main(rag_summarize=None):
 
     parser.add_argument("--image", required=True, type=str, help="Path to an image")
     parser.add_argument("--query", required=True, type=str, help="a text query to rewrite based on the image")
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Send every Gemini call to the API without using the response cache",
+    )
 
     args = parser.parse_args()
+    if args.no_llm_cache:
+        bypass_cache()
 
     response = describe_image(args.image, args.query)
     print(f"Rewritten query: {response.text.strip()}")
-    if response.usage_metadata is not None:
-        print(f"Total tokens:    {response.usage_metadata.total_token_count}")
+    if response.total_tokens is not None:
+        print(f"Total tokens:    {response.total_tokens}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import argparse
 import json
-from lib.search_utils import GOLDEN_DATASET_PATH, RRF_K
-from lib.hybrid_search import rrf_search_command
+from lib.search_utils import EVALUATION_WORKERS
+from lib.evaluation import evaluation_command
+from lib.search_client import get_server_url
 
 
 def main():
@@ -12,43 +13,55 @@ def main():
         default=5,
         help="Number of results to evaluate (k for precision@k, recall@k)",
     )
+    parser.add_argument(
+        "--server",
+        type=str,
+        help="URL of a running search server (defaults to $SEARCH_SERVER_URL)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=EVALUATION_WORKERS,
+        help="Number of test cases to run concurrently",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the full report as JSON instead of text",
+    )
 
     args = parser.parse_args()
     limit = args.limit
+    server_url = get_server_url(args.server)
+
+    report = evaluation_command(limit, server_url, args.workers)
 
-    with open(GOLDEN_DATASET_PATH, "r", encoding="utf-8") as f:
-        data_set = json.load(f)
-
-    test_runs = []
-    for test in data_set.get("test_cases"):
-        results = rrf_search_command(test["query"], RRF_K, None, None, limit)
-        relevant = 0
-        for movie in results.get("results"):
-            if movie.get("title") in test["relevant_docs"]:
-                relevant += 1
-
-        precision = relevant / len(results.get("results"))
-        recall = relevant / len(test["relevant_docs"])
-        run = {
-            "precision": precision,
-            "recall": recall,
-            "f1": 2 * (precision * recall) / (precision + recall),
-            "query": test["query"],
-            "retrieved": [m["title"] for m in results.get("results")],
-            "relevant": test["relevant_docs"],
-        }
-        test_runs.append(run)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
 
     print(f"k={limit}")
-    for run in test_runs:
+    for run in report["runs"]:
         print(f"  - Query: {run['query']}")
         print(f"    - Precision@{limit}: {run['precision']:.4f}")
         print(f"    - Recall@{limit}: {run['recall']:.4f}")
         print(f"    - F1 Score: {run['f1']:.4f}")
+        print(f"    - MRR: {run['reciprocal_rank']:.4f}")
+        print(f"    - nDCG@{limit}: {run['ndcg']:.4f}")
         print(f"    - Retrieved: {', '.join(run['retrieved'])}")
         print(f"    - Relevant: {', '.join(run['relevant'])}")
 
-    # run evaluation logic here
+    summary = report["summary"]
+    print(f"Mean over {report['test_cases']} queries:")
+    print(f"  - Precision@{limit}: {summary['precision']:.4f}")
+    print(f"  - Recall@{limit}: {summary['recall']:.4f}")
+    print(f"  - F1 Score: {summary['f1']:.4f}")
+    print(f"  - MRR: {summary['mrr']:.4f}")
+    print(f"  - nDCG@{limit}: {summary['ndcg']:.4f}")
+    print(f"Latency (ms), {report['wall_time_s']:.2f}s wall time:")
+    for stage, stats in report["latency_ms"].items():
+        values = ", ".join(f"{name}={value:.1f}" for name, value in stats.items())
+        print(f"  - {stage}: {values}")
 
 
 if __name__ == "__main__":
@@ -6,10 +6,36 @@ from lib.hybrid_search import (
     weighted_search_command,
     llm_evaluate,
 )
+from lib.llm import bypass_cache
+from lib.search_client import SearchClient, get_server_url
+from lib.search_utils import TRACE_FORMATS
+from lib.tracing import start_trace
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Hybrid Search CLI")
+    parser.add_argument(
+        "--server",
+        type=str,
+        help="URL of a running search server (defaults to $SEARCH_SERVER_URL)",
+    )
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Send every Gemini call to the API without using the response cache",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="PATH",
+        help="Write a timing trace of every pipeline stage to PATH",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="json",
+        help="Span tree (json) or Chrome trace events (chrome)",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     normalize_parser = subparsers.add_parser(
@@ -63,6 +89,11 @@ def main() -> None:
     )
 
     args = parser.parse_args()
+    server_url = get_server_url(args.server)
+    if args.no_llm_cache:
+        bypass_cache()
+    if args.trace:
+        start_trace(args.trace, args.trace_format)
 
     match args.command:
         case "normalize":
@@ -70,7 +101,12 @@ def main() -> None:
             for score in normalized:
                 print(f"* {score:.4f}")
         case "weighted-search":
-            result = weighted_search_command(args.query, args.alpha, args.limit)
+            if server_url:
+                result = SearchClient(server_url).weighted(
+                    args.query, args.alpha, args.limit
+                )
+            else:
+                result = weighted_search_command(args.query, args.alpha, args.limit)
 
             print(
                 f"Weighted Hybrid Search Results for '{result['query']}' (alpha={result['alpha']}):"
@@ -89,9 +125,14 @@ def main() -> None:
                 print(f"   {res['document'][:100]}...")
                 print()
         case "rrf-search":
-            result = rrf_search_command(
-                args.query, args.k, args.enhance, args.rerank_method, args.limit
-            )
+            if server_url:
+                result = SearchClient(server_url).rrf(
+                    args.query, args.k, args.enhance, args.rerank_method, args.limit
+                )
+            else:
+                result = rrf_search_command(
+                    args.query, args.k, args.enhance, args.rerank_method, args.limit
+                )
 
             if result["enhanced_query"]:
                 print(
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+
+from lib.ingest import ingest_command
+from lib.search_utils import DATA_PATH, INGEST_BATCH_SIZE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Stream a movie catalog into the keyword index and embedding caches"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=DATA_PATH,
+        help="Catalog as JSON or JSON Lines (.jsonl); defaults to data/movies.json",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=INGEST_BATCH_SIZE,
+        help="Movies tokenized or encoded at a time",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the report as JSON instead of text",
+    )
+
+    args = parser.parse_args()
+
+    report = ingest_command(args.path, args.batch_size)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+
+    print(f"Ingested {report['documents']} movies from {report['path']}")
+    print(f"  - keyword index: {report['indexed_documents']} documents")
+    print(f"  - chunk embeddings: {report['chunks']} chunks")
+    if report["ann_index_removed"]:
+        print("  - ANN index removed as stale; run `build_ann` to rebuild it")
+    print(f"  - peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
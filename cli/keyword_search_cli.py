@@ -7,12 +7,14 @@ from lib.keyword_search import (
     bm25_tf_command,
     bm25search_command,
     build_command,
+    convert_command,
     idf_command,
     search_command,
     tf_command,
     tfidf_command,
 )
 from lib.search_utils import BM25_B, BM25_K1
+from lib.segmented_index import delete_command, merge_command, update_command
 
 
 def main() -> None:
@@ -21,6 +23,19 @@ def main() -> None:
 
     subparsers.add_parser("build", help="Build the inverted index")
 
+    subparsers.add_parser(
+        "convert", help="Convert a pickled inverted index to the mapped format"
+    )
+
+    subparsers.add_parser(
+        "update", help="Re-index only the movies that changed since the last sync"
+    )
+
+    delete_parser = subparsers.add_parser("delete", help="Delete movies from the index")
+    delete_parser.add_argument("doc_ids", type=int, nargs="+", help="Document IDs")
+
+    subparsers.add_parser("merge", help="Compact the index segments into one")
+
     search_parser = subparsers.add_parser("search", help="Search movies using BM25")
     search_parser.add_argument("query", type=str, help="Search query")
 
@@ -64,6 +79,11 @@ def main() -> None:
         "bm25search", help="Search movies using full BM25 scoring"
     )
     bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Skip documents that cannot reach the top results (MaxScore)",
+    )
 
     args = parser.parse_args()
 
@@ -72,6 +92,21 @@ def main() -> None:
             print("Building inverted index...")
             build_command()
             print("Inverted index built successfully.")
+        case "convert":
+            print("Converting pickled inverted index...")
+            convert_command()
+            print("Inverted index converted successfully.")
+        case "update":
+            counts = update_command()
+            print(
+                f"Updated {counts['updated']} and deleted {counts['deleted']} documents."
+            )
+        case "delete":
+            delete_command(args.doc_ids)
+            print(f"Deleted {len(args.doc_ids)} documents.")
+        case "merge":
+            segments = merge_command()
+            print(f"Index merged into {segments} segment(s).")
         case "search":
             print("Searching for:", args.query)
             results = search_command(args.query)
@@ -98,7 +133,7 @@ def main() -> None:
             )
         case "bm25search":
             print("Searching for:", args.query)
-            results = bm25search_command(args.query)
+            results = bm25search_command(args.query, prune=args.prune)
             for i, res in enumerate(results, 1):
                 print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']:.2f}")
         case _:
@@ -0,0 +1,178 @@
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from .search_utils import (
+    ANN_DEFAULT_N_PROBE,
+    ANN_KMEANS_ITERATIONS,
+    ANN_TRAINING_SAMPLE_PER_LIST,
+    top_k_indices,
+)
+
+ASSIGN_BATCH_SIZE = 65536
+
+
+class IVFIndex:
+    """Inverted-file ANN index over unit-length vectors
+
+    A spherical k-means coarse quantizer splits the rows into `n_lists`
+    clusters. A query only scores the rows of its `n_probe` nearest clusters.
+    Probing every list is an exact search.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_members: np.ndarray,
+        n_probe: int = ANN_DEFAULT_N_PROBE,
+    ) -> None:
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_members = list_members
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.list_members)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = ANN_KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        n_rows = len(embeddings)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_rows))
+        n_lists = max(1, min(n_lists, n_rows))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n_rows, n_lists * ANN_TRAINING_SAMPLE_PER_LIST)
+        sample = embeddings[np.sort(rng.choice(n_rows, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            # Empty clusters are reseeded from random sample rows.
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignments = _nearest_centroids(embeddings, centroids)
+        list_members = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        return cls(centroids, list_offsets, list_members)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_members=self.list_members,
+            )
+
+    @classmethod
+    def load(cls, path: str, n_probe: int = ANN_DEFAULT_N_PROBE) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                data["centroids"], data["list_offsets"], data["list_members"], n_probe
+            )
+
+    def candidates(
+        self, query: np.ndarray, n_probe: Optional[int] = None, min_rows: int = 0
+    ) -> Optional[np.ndarray]:
+        """Sorted row ids in the lists nearest to `query`
+
+        More lists are probed until at least `min_rows` rows are covered.
+        Returns None when every list would be probed, so callers can fall back
+        to an exact scan.
+        """
+        n_probe = self.n_probe if n_probe is None else n_probe
+        if n_probe >= self.n_lists or min_rows >= self.n_rows:
+            return None
+        order = np.argsort(-(self.centroids @ query))
+        sizes = np.diff(self.list_offsets)[order]
+        covered = np.cumsum(sizes)
+        n_probe = max(n_probe, int(np.searchsorted(covered, min_rows)) + 1)
+        if n_probe >= self.n_lists:
+            return None
+        rows = [
+            self.list_members[self.list_offsets[i] : self.list_offsets[i + 1]]
+            for i in order[:n_probe]
+        ]
+        return np.sort(np.concatenate(rows))
+
+    def search(
+        self,
+        embeddings: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        n_probe: Optional[int] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k rows of `embeddings` by dot product with `query`"""
+        rows = self.candidates(query, n_probe, min_rows=k)
+        if rows is None:
+            scores = embeddings @ query
+            best = top_k_indices(scores, k)
+            return best, scores[best]
+        scores = embeddings[rows] @ query
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        batch = vectors[start : start + ASSIGN_BATCH_SIZE]
+        assignments[start : start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def recall_report(
+    index: IVFIndex,
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    probes: list[int],
+) -> list[dict]:
+    """Recall@k and mean latency of the index against exhaustive search"""
+    exact = []
+    start = time.perf_counter()
+    for query in queries:
+        exact.append(set(top_k_indices(embeddings @ query, k).tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = [{"n_probe": index.n_lists, "recall": 1.0, "latency_ms": exact_ms}]
+    for n_probe in probes:
+        if n_probe >= index.n_lists:
+            continue
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, exact):
+            rows, _ = index.search(embeddings, query, k, n_probe)
+            hits += len(expected.intersection(rows.tolist()))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        report.append(
+            {
+                "n_probe": n_probe,
+                "recall": hits / (k * len(queries)),
+                "latency_ms": latency_ms,
+            }
+        )
+    return report
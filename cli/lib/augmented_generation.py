@@ -1,23 +1,20 @@
-import os
+from typing import Optional
 
-from dotenv import load_dotenv
-from google import genai
-
-from .hybrid_search import rrf_search_command
+from . import tracing
+from .hybrid_search import HybridSearch, rrf_search_command
+from .llm import GEMINI_MODEL, generate
 from .search_utils import (
     DEFAULT_SEARCH_LIMIT,
     RRF_K,
 )
 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-model = "gemini-2.5-flash"
+model = GEMINI_MODEL
 
 
-def rag(query):
+@tracing.traced("rag")
+def rag(query, searcher: Optional[HybridSearch] = None):
     result = rrf_search_command(
-        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT
+        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT, searcher
     )
 
     formatted_results = result.get("results")
@@ -35,7 +32,7 @@ Documents:
 
 Provide a comprehensive answer that addresses the query:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
 
     return {
         "search_results": [
@@ -44,9 +41,10 @@ Provide a comprehensive answer that addresses the query:"""
         "rag_response": response.text or ""
     }
 
-def summarize(query, limit):
+@tracing.traced("summarize")
+def summarize(query, limit, searcher: Optional[HybridSearch] = None):
     result = rrf_search_command(
-        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT
+        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT, searcher
     )
 
     formatted_results = result.get("results")
@@ -66,7 +64,7 @@ def summarize(query, limit):
     Provide a comprehensive 3–4 sentence answer that combines information from multiple sources:
     """
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
 
     return {
         "search_results": [
@@ -75,9 +73,10 @@ def summarize(query, limit):
         "summary": response.text or ""
     }
 
-def citations(query, limit):
+@tracing.traced("citations")
+def citations(query, limit, searcher: Optional[HybridSearch] = None):
     result = rrf_search_command(
-        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT
+        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT, searcher
     )
 
     formatted_results = result.get("results")
@@ -106,7 +105,7 @@ def citations(query, limit):
 
     Answer:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
 
     return {
         "search_results": [
@@ -115,9 +114,10 @@ def citations(query, limit):
         "citations": response.text or ""
     }
 
-def answer_question(query, limit):
+@tracing.traced("answer_question")
+def answer_question(query, limit, searcher: Optional[HybridSearch] = None):
     result = rrf_search_command(
-        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT
+        query, RRF_K, None, None, DEFAULT_SEARCH_LIMIT, searcher
     )
 
     formatted_results = result.get("results")
@@ -143,7 +143,7 @@ def answer_question(query, limit):
 
     Answer:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
 
     return {
         "search_results": [
@@ -0,0 +1,293 @@
+import hashlib
+import os
+import tempfile
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from .search_utils import (
+    BENCHMARK_CHUNKS_PER_DOC,
+    BENCHMARK_EMBEDDING_DIM,
+    BENCHMARK_QUERIES,
+    BENCHMARK_SIZES,
+    BENCHMARK_VOCABULARY_SIZE,
+    BENCHMARK_WARMUP_QUERIES,
+    DEFAULT_ALPHA,
+    DEFAULT_SEARCH_LIMIT,
+    EVALUATION_LATENCY_PERCENTILES,
+    RRF_K,
+    peak_rss_mb,
+)
+
+_SYLLABLES = [c + v for c in "bdfghklmnprstvz" for v in "aeiou"]
+
+
+class DummyEncoder:
+    """Stands in for a SentenceTransformer: a fixed random vector per text"""
+
+    def __init__(self, dim: int = BENCHMARK_EMBEDDING_DIM) -> None:
+        self.dim = dim
+
+    def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        rows = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+            rows[i] = rng.standard_normal(self.dim, dtype=np.float32)
+        return rows
+
+
+def synthetic_vocabulary(
+    size: int = BENCHMARK_VOCABULARY_SIZE, seed: int = 0
+) -> tuple[list[str], np.ndarray]:
+    """Pronounceable fake words and Zipf-like frequencies to sample them with"""
+    rng = np.random.default_rng(seed)
+    words, seen = [], set()
+    while len(words) < size:
+        syllables = rng.integers(0, len(_SYLLABLES), size=(size, 4))
+        lengths = rng.integers(2, 5, size=size)
+        for row, length in zip(syllables, lengths):
+            word = "".join(_SYLLABLES[i] for i in row[:length])
+            if word not in seen and len(words) < size:
+                seen.add(word)
+                words.append(word)
+    weights = 1 / np.arange(1, size + 1) ** 1.05
+    return words, weights / weights.sum()
+
+
+def synthetic_corpus(n_docs: int, seed: int = 0) -> list[dict]:
+    """`n_docs` movies with 1-3 word titles and 20-120 word descriptions"""
+    words, weights = synthetic_vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    title_lengths = rng.integers(1, 4, size=n_docs)
+    description_lengths = rng.integers(20, 121, size=n_docs)
+    lengths = title_lengths + description_lengths
+    tokens = rng.choice(len(words), size=int(lengths.sum()), p=weights)
+
+    documents = []
+    start = 0
+    for i in range(n_docs):
+        doc_words = [words[t] for t in tokens[start : start + lengths[i]]]
+        start += lengths[i]
+        documents.append(
+            {
+                "id": i + 1,
+                "title": " ".join(doc_words[: title_lengths[i]]).title(),
+                "description": " ".join(doc_words[title_lengths[i] :]) + ".",
+            }
+        )
+    return documents
+
+
+def synthetic_queries(n_queries: int, seed: int = 0) -> list[str]:
+    """Mixes of common and rare vocabulary words, 2-4 per query"""
+    words, weights = synthetic_vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + 2)
+    queries = []
+    for _ in range(n_queries):
+        common = rng.choice(len(words), size=rng.integers(1, 3), p=weights)
+        rare = rng.integers(0, len(words), size=rng.integers(1, 3))
+        queries.append(" ".join(words[t] for t in np.concatenate([common, rare])))
+    return queries
+
+
+def write_dummy_embeddings(path: str, n_rows: int, dim: int, seed: int = 0) -> None:
+    """Random float32 rows written in blocks, so the whole matrix is never in memory"""
+    rng = np.random.default_rng(seed)
+    array = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(n_rows, dim)
+    )
+    block = 65536
+    for start in range(0, n_rows, block):
+        stop = min(start + block, n_rows)
+        array[start:stop] = rng.standard_normal((stop - start, dim), dtype=np.float32)
+    array.flush()
+    del array
+
+
+def latency_stats(search: Callable[[str], object], queries: list[str]) -> dict:
+    """Per-query latency percentiles (ms) and sequential throughput"""
+    for query in queries[:BENCHMARK_WARMUP_QUERIES]:
+        search(query)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    percentiles = np.percentile(latencies, EVALUATION_LATENCY_PERCENTILES)
+    stats = {
+        f"p{p}_ms": float(value)
+        for p, value in zip(EVALUATION_LATENCY_PERCENTILES, percentiles)
+    }
+    stats["mean_ms"] = float(np.mean(latencies))
+    stats["qps"] = len(queries) / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def _timed(fn: Callable[[], object]) -> tuple[object, float]:
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def _measure(report: dict, name: str, fn: Callable[[], dict]) -> None:
+    # One engine falling over (e.g. MemoryError at 1M docs) is a result too.
+    try:
+        report[name] = fn()
+    except Exception as e:
+        report[name] = {"error": f"{type(e).__name__}: {e}"}
+
+
+def benchmark_size(
+    n_docs: int,
+    queries: list[str],
+    workdir: str,
+    dim: int = BENCHMARK_EMBEDDING_DIM,
+    chunks_per_doc: int = BENCHMARK_CHUNKS_PER_DOC,
+    quantization: Optional[str] = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+) -> dict:
+    """Build, load and query every engine over one synthetic corpus"""
+    from .hybrid_search import HybridSearch
+    from .keyword_search import InvertedIndex, search_command
+    from .semantic_search import ChunkedSemanticSearch, SemanticSearch
+
+    documents, generate_s = _timed(lambda: synthetic_corpus(n_docs))
+    report: dict = {"documents": n_docs, "corpus_generation_s": generate_s}
+    engines: dict = {}
+
+    def keyword() -> dict:
+        index_path = os.path.join(workdir, "index.bin")
+        idx = InvertedIndex(index_path)
+        _, build_s = _timed(lambda: idx.build(documents))
+        _, save_s = _timed(idx.save)
+        loaded = InvertedIndex(index_path)
+        _, load_s = _timed(loaded.load)
+        engines["keyword"] = loaded
+        return {
+            "build_s": build_s,
+            "save_s": save_s,
+            "load_s": load_s,
+            "index_bytes": os.path.getsize(index_path),
+            "search_command": latency_stats(
+                lambda q: search_command(q, limit, loaded), queries
+            ),
+            "bm25_search": latency_stats(
+                lambda q: loaded.bm25_search(q, limit), queries
+            ),
+            "bm25_search_pruned": latency_stats(
+                lambda q: loaded.bm25_search(q, limit, prune=True), queries
+            ),
+        }
+
+    def semantic() -> dict:
+        path = os.path.join(workdir, "movie_embeddings.npy")
+        _, write_s = _timed(lambda: write_dummy_embeddings(path, n_docs, dim))
+        searcher = SemanticSearch(f"benchmark-dummy-{dim}", quantization)
+        searcher.model = DummyEncoder(dim)
+        searcher.documents = documents
+        (searcher.embeddings, searcher.quantized), load_s = _timed(
+            lambda: searcher._prepare_embeddings(path)
+        )
+        in_memory = searcher.quantized if quantization else searcher.embeddings
+        return {
+            "write_s": write_s,
+            "load_s": load_s,
+            "embedding_bytes": int(in_memory.nbytes),
+            "search": latency_stats(lambda q: searcher.search(q, limit), queries),
+        }
+
+    def chunked() -> dict:
+        path = os.path.join(workdir, "chunk_embeddings.npy")
+        n_chunks = n_docs * chunks_per_doc
+        _, write_s = _timed(lambda: write_dummy_embeddings(path, n_chunks, dim, seed=1))
+        searcher = ChunkedSemanticSearch(f"benchmark-dummy-{dim}", quantization)
+        searcher.model = DummyEncoder(dim)
+        searcher.documents = documents
+
+        def load() -> None:
+            searcher.chunk_embeddings, searcher.chunk_quantized = (
+                searcher._prepare_embeddings(path)
+            )
+            searcher._set_chunk_movie_index(
+                np.repeat(np.arange(n_docs, dtype=np.int32), chunks_per_doc)
+            )
+            # Only checked for presence; per-chunk dicts would dominate memory.
+            searcher.chunk_metadata = []
+
+        _, load_s = _timed(load)
+        engines["chunked"] = searcher
+        in_memory = searcher.chunk_embeddings
+        if quantization:
+            in_memory = searcher.chunk_quantized
+        return {
+            "chunks": n_chunks,
+            "write_s": write_s,
+            "load_s": load_s,
+            "embedding_bytes": int(in_memory.nbytes),
+            "search_chunks": latency_stats(
+                lambda q: searcher.search_chunks(q, limit), queries
+            ),
+        }
+
+    def hybrid() -> dict:
+        if "keyword" not in engines or "chunked" not in engines:
+            raise RuntimeError("needs both the keyword and chunked engines")
+        # No leg timeout: a slow leg should show up as latency, not be dropped.
+        searcher = HybridSearch.from_components(
+            documents, engines["chunked"], engines["keyword"], leg_timeout=None
+        )
+        return {
+            "weighted_search": latency_stats(
+                lambda q: searcher.weighted_search(q, DEFAULT_ALPHA, limit), queries
+            ),
+            "rrf_search": latency_stats(
+                lambda q: searcher.rrf_search(q, RRF_K, limit), queries
+            ),
+        }
+
+    _measure(report, "keyword", keyword)
+    _measure(report, "semantic", semantic)
+    _measure(report, "chunked", chunked)
+    _measure(report, "hybrid", hybrid)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def benchmark_command(
+    sizes: tuple[int, ...] = BENCHMARK_SIZES,
+    n_queries: int = BENCHMARK_QUERIES,
+    dim: int = BENCHMARK_EMBEDDING_DIM,
+    chunks_per_doc: int = BENCHMARK_CHUNKS_PER_DOC,
+    quantization: Optional[str] = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+) -> dict:
+    """Benchmark every retrieval path on synthetic corpora of each size
+
+    Embeddings are random and queries are encoded by DummyEncoder, so no
+    model is downloaded; the numbers cover indexing, loading and scoring,
+    not the transformer. Files go to a temporary directory, so the real
+    caches are left alone. peak_rss_mb is the process peak so far, so it
+    only grows across sizes; run one size per process to isolate it.
+    """
+    queries = synthetic_queries(n_queries)
+    results = []
+    for n_docs in sizes:
+        with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as workdir:
+            results.append(
+                benchmark_size(
+                    n_docs, queries, workdir, dim, chunks_per_doc, quantization, limit
+                )
+            )
+    return {
+        "queries": n_queries,
+        "limit": limit,
+        "embedding_dim": dim,
+        "chunks_per_doc": chunks_per_doc,
+        "quantization": quantization,
+        "sizes": results,
+    }
@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .search_utils import DISK_CACHE_EVICT_TO, DISK_CACHE_RESYNC_SECONDS
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used cache with hit/miss counters"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DirectoryBudget:
+    """Caps the total size of the files ending in `suffix` in a directory
+
+    A running byte total follows every write and removal, so the directory
+    is only listed when the cap is exceeded, or when the total is unknown or
+    older than DISK_CACHE_RESYNC_SECONDS (other processes may share the
+    directory). Eviction removes the least recently used files, by mtime,
+    until DISK_CACHE_EVICT_TO of the cap is used.
+    """
+
+    def __init__(self, directory: str, suffix: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.scans = 0
+        self._total: Optional[int] = None
+        self._synced = 0.0
+        self._lock = threading.Lock()
+
+    def added(self, path: str, replaced: int = 0) -> None:
+        """Count the file just written to `path` over `replaced` bytes"""
+        size = file_size(path)
+        with self._lock:
+            if self._total is not None and (
+                time.monotonic() - self._synced <= DISK_CACHE_RESYNC_SECONDS
+            ):
+                self._total += size - replaced
+                if self._total <= self.max_bytes:
+                    return
+        self._evict()
+
+    def remove(self, path: str) -> None:
+        size = file_size(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total is not None:
+                self._total -= size
+
+    def reset(self) -> None:
+        """Forget the total, e.g. after the directory was cleared"""
+        with self._lock:
+            self._total = None
+
+    def total_bytes(self) -> Optional[int]:
+        with self._lock:
+            return self._total
+
+    def _evict(self) -> None:
+        entries = []
+        try:
+            listing = list(os.scandir(self.directory))
+        except OSError:
+            listing = []
+        for entry in listing:
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            # Evicting below the cap leaves room, so the next scan is many
+            # writes away rather than on the very next one.
+            target = self.max_bytes * DISK_CACHE_EVICT_TO
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        with self._lock:
+            self._total = total
+            self._synced = time.monotonic()
+            self.scans += 1
+
+
+class DiskCache:
+    """JSON values stored one file per key, with a TTL and a total size cap
+
+    Reads refresh a file's mtime, so eviction drops the least recently used
+    entries first. Writes are atomic, so processes can share a directory.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float, max_bytes: int) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.budget = DirectoryBudget(directory, ".json", max_bytes)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            if time.time() - entry["created"] > self.ttl_seconds:
+                self.budget.remove(path)
+                entry = None
+            else:
+                os.utime(path)
+        except (OSError, ValueError, KeyError):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry["value"]
+
+    def put(self, key: str, value: Any) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": time.time(), "value": value}, f)
+        replaced = file_size(path)
+        os.replace(tmp_path, path)
+        self.budget.added(path, replaced)
+
+    def clear(self) -> None:
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+        self.budget.reset()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self.budget.total_bytes(),
+            }
+
+
+def file_size(path: str) -> int:
+    """Size of the file at `path`, or 0 if there is none"""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
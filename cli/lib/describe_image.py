@@ -1,21 +1,12 @@
 import mimetypes
-import os
-
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from .hybrid_search import rrf_search_command
-from .search_utils import (
-    DEFAULT_SEARCH_LIMIT,
-    RRF_K,
-)
-
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-model = "gemini-2.5-flash"
+
+from .llm import GEMINI_MODEL, generate
+
+model = GEMINI_MODEL
 
 def describe_image(image_path, user_query):
+    from google.genai import types
+
     mime, _ = mimetypes.guess_type(image_path)
     mime = mime or "image/jpeg"
     with open(image_path, "rb") as f:
@@ -33,9 +24,6 @@ def describe_image(image_path, user_query):
         user_query.strip(),
     ]
 
-    response = client.models.generate_content(
-        model=model,
-        contents=parts
-    )
+    response = generate(parts, model)
 
     return response
\ No newline at end of file
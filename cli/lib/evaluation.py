@@ -0,0 +1,174 @@
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+from .search_utils import (
+    EVALUATION_LATENCY_PERCENTILES,
+    EVALUATION_WORKERS,
+    GOLDEN_DATASET_PATH,
+    RRF_K,
+    load_movies,
+)
+
+# A search function takes a query and returns its results plus the seconds
+# spent in each stage it reports.
+SearchFunction = Callable[[str], tuple[list[dict], dict]]
+
+
+def load_test_cases(path: str = GOLDEN_DATASET_PATH) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data_set = json.load(f)
+    return data_set.get("test_cases", [])
+
+
+def precision_at_k(retrieved: list[str], relevant: set[str]) -> float:
+    if not retrieved:
+        return 0.0
+    return sum(title in relevant for title in retrieved) / len(retrieved)
+
+
+def recall_at_k(retrieved: list[str], relevant: set[str]) -> float:
+    if not relevant:
+        return 0.0
+    return sum(title in relevant for title in retrieved) / len(relevant)
+
+
+def f1_score(precision: float, recall: float) -> float:
+    if precision + recall == 0:
+        return 0.0
+    return 2 * (precision * recall) / (precision + recall)
+
+
+def reciprocal_rank(retrieved: list[str], relevant: set[str]) -> float:
+    for rank, title in enumerate(retrieved, start=1):
+        if title in relevant:
+            return 1 / rank
+    return 0.0
+
+
+def ndcg_at_k(retrieved: list[str], relevant: set[str], k: int) -> float:
+    """Normalized DCG with binary gains: a relevant title at rank r adds 1/log2(r+1)"""
+    dcg = sum(
+        1 / math.log2(rank + 1)
+        for rank, title in enumerate(retrieved[:k], start=1)
+        if title in relevant
+    )
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def evaluate_case(test: dict, search: SearchFunction, limit: int) -> dict:
+    start = time.perf_counter()
+    results, timings = search(test["query"])
+    latencies = {**timings, "total": time.perf_counter() - start}
+
+    retrieved = [movie["title"] for movie in results]
+    relevant = set(test["relevant_docs"])
+    precision = precision_at_k(retrieved, relevant)
+    recall = recall_at_k(retrieved, relevant)
+    return {
+        "query": test["query"],
+        "precision": precision,
+        "recall": recall,
+        "f1": f1_score(precision, recall),
+        "reciprocal_rank": reciprocal_rank(retrieved, relevant),
+        "ndcg": ndcg_at_k(retrieved, relevant, limit),
+        "retrieved": retrieved,
+        "relevant": test["relevant_docs"],
+        "latency_ms": {stage: seconds * 1000 for stage, seconds in latencies.items()},
+    }
+
+
+def latency_percentiles(runs: list[dict]) -> dict:
+    """Percentiles (in ms) of every stage's latency across the runs"""
+    stages: dict[str, list[float]] = {}
+    for run in runs:
+        for stage, ms in run["latency_ms"].items():
+            stages.setdefault(stage, []).append(ms)
+    report = {}
+    for stage, values in sorted(stages.items()):
+        percentiles = np.percentile(values, EVALUATION_LATENCY_PERCENTILES)
+        report[stage] = {
+            f"p{p}": float(value)
+            for p, value in zip(EVALUATION_LATENCY_PERCENTILES, percentiles)
+        }
+        report[stage]["mean"] = float(np.mean(values))
+    return report
+
+
+def evaluate(
+    test_cases: list[dict],
+    search: SearchFunction,
+    limit: int,
+    workers: int = EVALUATION_WORKERS,
+) -> dict:
+    """Run every test case through `search`, `workers` at a time
+
+    Runs are reported in test-case order whatever order they finish in, so
+    the metrics of two builds can be diffed directly.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        runs = list(
+            executor.map(lambda test: evaluate_case(test, search, limit), test_cases)
+        )
+    elapsed = time.perf_counter() - start
+
+    metrics = ("precision", "recall", "f1", "reciprocal_rank", "ndcg")
+    summary = {
+        metric: sum(run[metric] for run in runs) / len(runs) if runs else 0.0
+        for metric in metrics
+    }
+    summary["mrr"] = summary.pop("reciprocal_rank")
+    return {
+        "k": limit,
+        "test_cases": len(runs),
+        "workers": workers,
+        "summary": summary,
+        "latency_ms": latency_percentiles(runs),
+        "wall_time_s": elapsed,
+        "runs": runs,
+    }
+
+
+def local_rrf_search(limit: int, k: int = RRF_K) -> SearchFunction:
+    """RRF search over one in-process searcher shared by every test case"""
+    from .hybrid_search import HybridSearch
+
+    searcher = HybridSearch(load_movies())
+
+    def search(query: str) -> tuple[list[dict], dict]:
+        timings: dict = {}
+        results = searcher.rrf_search(query, k, limit, timings)
+        return results, timings
+
+    return search
+
+
+def server_rrf_search(url: str, limit: int, k: int = RRF_K) -> SearchFunction:
+    """RRF search through a running search server; only total latency is known"""
+    from .search_client import SearchClient
+
+    client = SearchClient(url)
+
+    def search(query: str) -> tuple[list[dict], dict]:
+        return client.rrf(query, k, None, None, limit)["results"], {}
+
+    return search
+
+
+def evaluation_command(
+    limit: int,
+    server_url: Optional[str] = None,
+    workers: int = EVALUATION_WORKERS,
+) -> dict:
+    test_cases = load_test_cases()
+    if server_url:
+        search = server_rrf_search(server_url, limit)
+    else:
+        search = local_rrf_search(limit)
+    return evaluate(test_cases, search, limit, workers)
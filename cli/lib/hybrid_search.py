@@ -1,57 +1,260 @@
 import json
-import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
 
-from dotenv import load_dotenv
-from google import genai
-
-from .keyword_search import InvertedIndex
+from . import tracing
+from .llm import GEMINI_MODEL, generate
 from .query_enhancement import enhance_query
 from .reranking import rerank
 from .search_utils import (
     DEFAULT_ALPHA,
     DEFAULT_SEARCH_LIMIT,
+    HYBRID_LEG_TIMEOUT_SECONDS,
+    HYBRID_SEARCH_WORKERS,
     RRF_K,
     SEARCH_MULTIPLIER,
     format_search_result,
     load_movies,
 )
-from .semantic_search import ChunkedSemanticSearch
 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-model = "gemini-2.5-flash"
+model = GEMINI_MODEL
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Pool shared by every searcher to run the BM25 and semantic legs"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=HYBRID_SEARCH_WORKERS, thread_name_prefix="hybrid-leg"
+            )
+    return _executor
 
 
 class HybridSearch:
-    def __init__(self, documents: list[dict]) -> None:
+    def __init__(
+        self,
+        documents: list[dict],
+        quantization: Optional[str] = None,
+        leg_timeout: Optional[float] = HYBRID_LEG_TIMEOUT_SECONDS,
+    ) -> None:
+        # Imported here so commands that never search (e.g. normalize) don't
+        # pay for numpy and the index modules at startup.
+        from .semantic_search import ChunkedSemanticSearch
+
         self.documents = documents
-        self.semantic_search = ChunkedSemanticSearch()
+        self.leg_timeout = leg_timeout
+        self._init_legs()
+        self.semantic_search = ChunkedSemanticSearch(quantization=quantization)
         self.semantic_search.load_or_create_chunk_embeddings(documents)
-
-        self.idx = InvertedIndex()
-        if not os.path.exists(self.idx.index_path):
-            self.idx.build()
-            self.idx.save()
+        # Loaded up front: the first query would otherwise spend its semantic
+        # leg's timeout on the model load and fall back to BM25 alone.
+        self.semantic_search.model
+
+        self.idx = self._open_index()
+
+    @classmethod
+    def from_components(
+        cls,
+        documents: list[dict],
+        semantic_search,
+        idx,
+        leg_timeout: Optional[float] = HYBRID_LEG_TIMEOUT_SECONDS,
+    ) -> "HybridSearch":
+        """Searcher over engines that are already loaded, e.g. synthetic ones"""
+        searcher = cls.__new__(cls)
+        searcher.documents = documents
+        searcher.leg_timeout = leg_timeout
+        searcher._init_legs()
+        searcher.semantic_search = semantic_search
+        searcher.idx = idx
+        return searcher
+
+    def _init_legs(self) -> None:
+        # The still-running future of each leg whose last run timed out.
+        self._overdue: dict[str, Future] = {}
+        self._overdue_lock = threading.Lock()
+
+    def _open_index(self):
+        from .segmented_index import SegmentedIndex
+
+        idx = SegmentedIndex()
+        if idx.exists():
+            try:
+                idx.load()
+                # Only the documents that changed since the last sync are
+                # re-indexed, into a new segment.
+                if not idx.is_current(self.documents):
+                    idx.apply(self.documents)
+                return idx
+            except (ValueError, KeyError, OSError):
+                # A corrupt, stale or partly missing index is rebuilt.
+                pass
+        idx.build(self.documents)
+        return idx
+
+    def reload(self) -> None:
+        """Re-open the index from disk, e.g. after another process rebuilt it"""
+        self.idx = self._open_index()
+
+    def refresh(self, documents: Optional[list[dict]] = None) -> None:
+        """Point the searcher at a new corpus, rebuilding whatever is stale"""
+        if documents is not None:
+            self.documents = documents
+        self.semantic_search.load_or_create_chunk_embeddings(self.documents)
+        self.idx = self._open_index()
 
     def _bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        self.idx.load()
-        return self.idx.bm25_search(query, limit)
-
-    def weighted_search(self, query: str, alpha: float, limit: int = 5) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * 500)
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
-
-        combined = combine_search_results(bm25_results, semantic_results, alpha)
-        return combined[:limit]
+        with tracing.span("bm25_search", limit=limit) as span:
+            results = self.idx.bm25_search(query, limit, prune=True)
+            span.set(results=len(results))
+            return results
+
+    def _retrieve(
+        self, query: str, limit: int, timings: Optional[dict] = None
+    ) -> tuple[list[dict], list[dict]]:
+        """Run the BM25 and semantic legs concurrently
+
+        Each leg gets `leg_timeout` seconds. A leg that fails or times out is
+        reported and replaced by no results, so the query is answered by the
+        other leg alone; only when both fail is the error raised. The seconds
+        each finished leg took are stored in `timings` under its name.
+
+        A timed-out leg can't be stopped and keeps its pool thread. Until it
+        finishes, that leg fails at once instead of being queued again, so a
+        hung backend holds one thread rather than one per query. The pool's
+        threads are joined at interpreter exit, so the CLI still waits for a
+        hung leg before it exits.
+        """
+        # A model that isn't loaded yet is loaded here, outside the timed legs.
+        self.semantic_search.model
+        return self._run_legs(
+            lambda: self._bm25_search(query, limit),
+            lambda: self.semantic_search.search_chunks(query, limit),
+            [],
+            self.leg_timeout,
+            timings,
+        )
 
-    def rrf_search(self, query: str, k: int, limit: int = 10) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * 500)
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
+    def _retrieve_many(
+        self, queries: list[str], limit: int
+    ) -> tuple[list[list[dict]], list[list[dict]]]:
+        # Batches are offline work, so the legs are not timed out.
+        return self._run_legs(
+            lambda: self.idx.search_many(queries, limit, prune=True),
+            lambda: self.semantic_search.search_chunks_many(queries, limit),
+            [[] for _ in queries],
+            None,
+        )
 
-        fused = reciprocal_rank_fusion(bm25_results, semantic_results, k)
-        return fused[:limit]
+    def _run_legs(self, bm25_leg, semantic_leg, empty, leg_timeout, timings=None):
+        executor = get_executor()
+        results = {}
+        errors = {}
+        futures = {}
+        with self._overdue_lock:
+            for leg, run in [("bm25", bm25_leg), ("semantic", semantic_leg)]:
+                overdue = self._overdue.get(leg)
+                if overdue is not None and not overdue.done():
+                    errors[leg] = TimeoutError("still running from an earlier query")
+                    results[leg] = empty
+                    continue
+                self._overdue.pop(leg, None)
+                futures[leg] = executor.submit(_timed, tracing.propagate(run))
+        deadline = None
+        if leg_timeout is not None:
+            deadline = time.monotonic() + leg_timeout
+
+        for leg, future in futures.items():
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                results[leg], elapsed = future.result(timeout=timeout)
+                if timings is not None:
+                    timings[leg] = elapsed
+            except Exception as e:
+                # A timed-out leg keeps running in the pool; its result is
+                # simply not waited for.
+                if not future.cancel() and not future.done():
+                    with self._overdue_lock:
+                        self._overdue[leg] = future
+                errors[leg] = e
+                results[leg] = empty
+
+        if len(errors) == len(results):
+            raise errors["bm25"]
+        if errors:
+            tracing.annotate(degraded=sorted(errors))
+        for leg, error in errors.items():
+            reason = "timed out" if isinstance(error, TimeoutError) else repr(error)
+            print(
+                f"Warning: {leg} search {reason}; using the other leg only",
+                file=sys.stderr,
+            )
+        return results["bm25"], results["semantic"]
+
+    def weighted_search(
+        self, query: str, alpha: float, limit: int = 5, timings: Optional[dict] = None
+    ) -> list[dict]:
+        with tracing.span("weighted_search", alpha=alpha, limit=limit):
+            bm25_results, semantic_results = self._retrieve(query, limit * 500, timings)
+
+            start = time.perf_counter()
+            with tracing.span(
+                "fusion", candidates=len(bm25_results) + len(semantic_results)
+            ):
+                combined = combine_search_results(bm25_results, semantic_results, alpha)
+            if timings is not None:
+                timings["fusion"] = time.perf_counter() - start
+            return combined[:limit]
+
+    def rrf_search(
+        self, query: str, k: int, limit: int = 10, timings: Optional[dict] = None
+    ) -> list[dict]:
+        with tracing.span("rrf_search", k=k, limit=limit):
+            bm25_results, semantic_results = self._retrieve(query, limit * 500, timings)
+
+            start = time.perf_counter()
+            with tracing.span(
+                "fusion", candidates=len(bm25_results) + len(semantic_results)
+            ):
+                fused = reciprocal_rank_fusion(bm25_results, semantic_results, k)
+            if timings is not None:
+                timings["fusion"] = time.perf_counter() - start
+            return fused[:limit]
+
+    def weighted_search_many(
+        self, queries: list[str], alpha: float, limit: int = 5
+    ) -> list[list[dict]]:
+        """`weighted_search` for a batch of queries, each leg run as one batch"""
+        bm25_batches, semantic_batches = self._retrieve_many(queries, limit * 500)
+        return [
+            combine_search_results(bm25_results, semantic_results, alpha)[:limit]
+            for bm25_results, semantic_results in zip(bm25_batches, semantic_batches)
+        ]
+
+    def rrf_search_many(
+        self, queries: list[str], k: int, limit: int = 10
+    ) -> list[list[dict]]:
+        """`rrf_search` for a batch of queries, each leg run as one batch"""
+        bm25_batches, semantic_batches = self._retrieve_many(queries, limit * 500)
+        return [
+            reciprocal_rank_fusion(bm25_results, semantic_results, k)[:limit]
+            for bm25_results, semantic_results in zip(bm25_batches, semantic_batches)
+        ]
+
+
+def _timed(leg):
+    start = time.perf_counter()
+    result = leg()
+    return result, time.perf_counter() - start
 
 
 def normalize_scores(scores: list[float]) -> list[float]:
@@ -193,11 +396,16 @@ def reciprocal_rank_fusion(
     return rrf_results
 
 
+@tracing.traced("weighted_search_command")
 def weighted_search_command(
-        query: str, alpha: float = DEFAULT_ALPHA, limit: int = DEFAULT_SEARCH_LIMIT
+        query: str,
+        alpha: float = DEFAULT_ALPHA,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        searcher: Optional[HybridSearch] = None,
 ) -> dict:
-    movies = load_movies()
-    searcher = HybridSearch(movies)
+    if searcher is None:
+        with tracing.span("open_searcher"):
+            searcher = HybridSearch(load_movies())
 
     original_query = query
 
@@ -237,7 +445,7 @@ Do NOT give any numbers out than 0, 1, 2, or 3.
 Return ONLY the scores in the same order you were given the documents. Return a valid JSON list, nothing else. For example:
 
 [2, 0, 3, 2, 0, 1]"""
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
     evaluated = response.text.strip()
     if "json" in evaluated.lower():
         evaluated = evaluated.lower().replace("json", "")
@@ -257,15 +465,18 @@ Return ONLY the scores in the same order you were given the documents. Return a
     return results['results']
 
 
+@tracing.traced("rrf_search_command")
 def rrf_search_command(
         query: str,
         k: int = RRF_K,
         enhance: Optional[str] = None,
         rerank_method: Optional[str] = None,
         limit: int = DEFAULT_SEARCH_LIMIT,
+        searcher: Optional[HybridSearch] = None,
 ) -> dict:
-    movies = load_movies()
-    searcher = HybridSearch(movies)
+    if searcher is None:
+        with tracing.span("open_searcher"):
+            searcher = HybridSearch(load_movies())
 
     original_query = query
     print("Original query:", original_query)
@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Any, Iterator
+
+import numpy as np
+
+INDEX_MAGIC = b"RAGIDX01"
+INDEX_FORMAT_VERSION = 1
+SECTION_ALIGNMENT = 8
+
+
+def write_sections(path: str, sections: dict[str, np.ndarray], meta: dict) -> None:
+    """Write named arrays into a single file that `open_sections` can mmap
+
+    Layout: magic, header length (u64), JSON header, then each array's raw
+    bytes aligned to SECTION_ALIGNMENT. The file is written next to `path`
+    and swapped in with os.replace, so readers that still map the old file
+    keep a consistent view.
+
+    Args:
+        path: Destination file
+        sections: Arrays to store, keyed by section name
+        meta: JSON-serializable metadata stored in the header
+    """
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        offset = _align(offset)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "offset": offset,
+            "count": int(array.size),
+        }
+        offset += array.nbytes
+
+    header = json.dumps(
+        {"version": INDEX_FORMAT_VERSION, "meta": meta, "sections": layout}
+    ).encode("utf-8")
+    data_start = _align(len(INDEX_MAGIC) + 8 + len(header))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+def open_sections(path: str) -> tuple[dict[str, np.ndarray], dict]:
+    """Memory-map a file written by `write_sections`
+
+    Returns:
+        Read-only arrays backed by the mapping, and the header metadata
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError(f"{path} is not a search index file")
+    header_start = len(INDEX_MAGIC) + 8
+    header_length = int.from_bytes(buffer[len(INDEX_MAGIC) : header_start], "little")
+    header = json.loads(buffer[header_start : header_start + header_length])
+    if header["version"] != INDEX_FORMAT_VERSION:
+        raise ValueError(
+            f"{path} uses index format {header['version']}, expected {INDEX_FORMAT_VERSION}"
+        )
+    data_start = _align(header_start + header_length)
+
+    sections = {}
+    for name, section in header["sections"].items():
+        if section["count"] == 0:
+            sections[name] = np.empty(0, dtype=np.dtype(section["dtype"]))
+            continue
+        sections[name] = np.frombuffer(
+            buffer,
+            dtype=np.dtype(section["dtype"]),
+            count=section["count"],
+            offset=data_start + section["offset"],
+        )
+    return sections, header["meta"]
+
+
+def pack_strings(values: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(v) for v in values], dtype=np.int64)
+    blob = np.frombuffer(b"".join(values), dtype=np.uint8)
+    return offsets, blob
+
+
+class MappedDocuments(Mapping):
+    """Read-only `doc_id -> document` mapping decoded lazily from an index file
+
+    Iteration follows corpus order, like the dict it replaces.
+    """
+
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        doc_id_order: np.ndarray,
+        offsets: np.ndarray,
+        blob: np.ndarray,
+    ) -> None:
+        self.doc_ids = doc_ids
+        self.doc_id_order = doc_id_order
+        self.offsets = offsets
+        self.blob = blob
+
+    def position(self, doc_id: Any) -> int:
+        """Position of `doc_id` in corpus order, or -1 if it is not indexed"""
+        if len(self.doc_ids) == 0:
+            return -1
+        try:
+            i = int(np.searchsorted(self.doc_ids, doc_id, sorter=self.doc_id_order))
+        except TypeError:
+            return -1
+        if i < len(self.doc_ids):
+            position = int(self.doc_id_order[i])
+            if self.doc_ids[position] == doc_id:
+                return position
+        return -1
+
+    def positions(self, doc_ids: np.ndarray) -> np.ndarray:
+        """Vectorized `position`, with -1 for every id that is not indexed"""
+        doc_ids = np.asarray(doc_ids, dtype=self.doc_ids.dtype)
+        positions = np.full(len(doc_ids), -1, dtype=np.int64)
+        if len(self.doc_ids) == 0:
+            return positions
+        found = np.searchsorted(self.doc_ids, doc_ids, sorter=self.doc_id_order)
+        candidates = self.doc_id_order[np.minimum(found, len(self.doc_ids) - 1)]
+        match = self.doc_ids[candidates] == doc_ids
+        positions[match] = candidates[match]
+        return positions
+
+    def document_at(self, position: int) -> dict:
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return json.loads(self.blob[start:end].tobytes())
+
+    def __getitem__(self, doc_id: Any) -> dict:
+        position = self.position(doc_id)
+        if position < 0:
+            raise KeyError(doc_id)
+        return self.document_at(position)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return self.position(doc_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+def _align(offset: int) -> int:
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
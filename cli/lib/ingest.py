@@ -0,0 +1,53 @@
+import gc
+import os
+
+from .search_utils import (
+    CHUNK_ANN_INDEX_PATH,
+    DATA_PATH,
+    INGEST_BATCH_SIZE,
+    iter_movies,
+    peak_rss_mb,
+)
+from .segmented_index import SegmentedIndex
+from .semantic_search import ChunkedSemanticSearch, SemanticSearch
+
+
+def ingest_command(path: str = DATA_PATH, batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """Build the keyword index and embedding caches by streaming a catalog
+
+    The catalog, JSON or JSON Lines, is read once per cache and handled
+    `batch_size` movies at a time, so memory grows only with the packed
+    keyword index and one content key per movie, not with the documents.
+    Movies already in the embedding caches are not re-encoded.
+    """
+    indexed_documents = _build_keyword_index(path, batch_size)
+    # The segmented index refers to itself through its docmap, so only the
+    # cycle collector frees it, and it should not outlive this step.
+    gc.collect()
+
+    searcher = SemanticSearch()
+    keys = searcher.write_embeddings(
+        iter_movies(path), searcher._read_embedding_cache(), batch_size
+    )
+
+    chunked = ChunkedSemanticSearch()
+    had_ann_index = os.path.exists(CHUNK_ANN_INDEX_PATH)
+    _, previous = chunked._read_chunk_cache(with_metadata=False) or (None, None)
+    chunk_movie_index = chunked.write_chunk_embeddings(
+        iter_movies(path), previous, batch_size
+    )
+
+    return {
+        "path": path,
+        "documents": len(keys),
+        "indexed_documents": indexed_documents,
+        "chunks": len(chunk_movie_index),
+        "ann_index_removed": had_ann_index,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _build_keyword_index(path: str, batch_size: int) -> int:
+    idx = SegmentedIndex()
+    idx.build(iter_movies(path), batch_size)
+    return idx.doc_count
@@ -1,109 +1,295 @@
+import copy
+import hashlib
+import heapq
+import json
 import math
 import os
 import pickle
 import string
 from collections import Counter, defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterable, Optional
 
-from nltk.stem import PorterStemmer
+import numpy as np
 
+from . import tracing
+from .index_store import MappedDocuments, open_sections, pack_strings, write_sections
 from .search_utils import (
     BM25_B,
     BM25_K1,
     CACHE_DIR,
     DEFAULT_SEARCH_LIMIT,
+    INGEST_BATCH_SIZE,
+    INGEST_MERGE_FANIN,
+    MAX_SCORE_BLOCK_SIZE,
+    MAX_SCORE_EPSILON,
+    STEM_CACHE_SIZE,
+    batched,
+    corpus_fingerprint,
     format_search_result,
     load_movies,
     load_stopwords,
+    top_k_indices,
+    update_fingerprint,
 )
 
 
 class InvertedIndex:
-    def __init__(self) -> None:
-        self.index = defaultdict(set)
-        self.docmap: dict[int, dict] = {}
-        self.index_path = os.path.join(CACHE_DIR, "index.pkl")
-        self.docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
-        self.tf_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
-        self.doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
-        self.term_frequencies = defaultdict(Counter)
-        self.doc_lengths = {}
-
-    def build(self) -> None:
-        movies = load_movies()
-        for m in movies:
-            doc_id = m["id"]
-            doc_description = f"{m['title']} {m['description']}"
-            self.docmap[doc_id] = m
-            self.__add_document(doc_id, doc_description)
+    def __init__(self, index_path: Optional[str] = None) -> None:
+        self.docmap: Mapping[int, dict] = {}
+        self.index_path = index_path or os.path.join(CACHE_DIR, "index.bin")
+        self.legacy_index_path = os.path.join(CACHE_DIR, "index.pkl")
+        self.legacy_docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
+        self.legacy_tf_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
+        self.legacy_doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
+        self.sections: dict[str, np.ndarray] = {}
+        self.doc_count = 0
+        self.collection_doc_count = 0
+        self.avg_doc_length = 0.0
+        self.corpus_fingerprint = None
+
+    def build(
+        self,
+        documents: Optional[Iterable[dict]] = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+    ) -> None:
+        """Index the documents (movies.json by default) `batch_size` at a time
+
+        Each batch is tokenized and packed into arrays on its own, and packed
+        batches are merged INGEST_MERGE_FANIN at a time, so only one batch's
+        postings are ever held as Python objects. `documents` may be any
+        iterable, such as `iter_movies` over a catalog export.
+        """
+        movies = load_movies() if documents is None else documents
+        digest = hashlib.sha256()
+        # (merge level, index) pairs; merging equal levels keeps each document
+        # from being copied more than log(batches) times.
+        parts: list[tuple[int, InvertedIndex]] = []
+        for batch in batched(movies, batch_size):
+            update_fingerprint(digest, batch)
+            parts.append((0, InvertedIndex.from_sections(_pack_batch(batch))))
+            while len(parts) >= INGEST_MERGE_FANIN and all(
+                level == parts[-1][0] for level, _ in parts[-INGEST_MERGE_FANIN:]
+            ):
+                level = parts[-1][0]
+                merged = _merge_indexes([idx for _, idx in parts[-INGEST_MERGE_FANIN:]])
+                del parts[-INGEST_MERGE_FANIN:]
+                parts.append((level + 1, merged))
+
+        if not parts:
+            sections = _pack_index([], [], [], {})
+        else:
+            sections = _merge_indexes([idx for _, idx in parts]).sections
+        self.__set_sections(sections)
+        self.corpus_fingerprint = digest.hexdigest()
 
     def save(self) -> None:
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(self.index_path, "wb") as f:
-            pickle.dump(self.index, f)
-        with open(self.docmap_path, "wb") as f:
-            pickle.dump(self.docmap, f)
-        with open(self.tf_path, "wb") as f:
-            pickle.dump(self.term_frequencies, f)
-        with open(self.doc_lengths_path, "wb") as f:
-            pickle.dump(self.doc_lengths, f)
+        write_sections(
+            self.index_path,
+            self.sections,
+            {
+                "doc_count": self.doc_count,
+                "avg_doc_length": self.avg_doc_length,
+                "corpus_fingerprint": self.corpus_fingerprint,
+            },
+        )
 
     def load(self) -> None:
-        with open(self.index_path, "rb") as f:
-            self.index = pickle.load(f)
-        with open(self.docmap_path, "rb") as f:
-            self.docmap = pickle.load(f)
-        with open(self.tf_path, "rb") as f:
-            self.term_frequencies = pickle.load(f)
-        with open(self.doc_lengths_path, "rb") as f:
-            self.doc_lengths = pickle.load(f)
-
-    def get_documents(self, term: str) -> list[int]:
-        doc_ids = self.index.get(term, set())
-        return sorted(list(doc_ids))
-
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokens = tokenize_text(text)
-        for token in set(tokens):
-            self.index[token].add(doc_id)
-        self.term_frequencies[doc_id].update(tokens)
-        self.doc_lengths[doc_id] = len(tokens)
+        sections, meta = open_sections(self.index_path)
+        self.__set_sections(sections, meta["avg_doc_length"])
+        self.corpus_fingerprint = meta.get("corpus_fingerprint")
+
+    @classmethod
+    def from_sections(
+        cls, sections: dict[str, np.ndarray], index_path: Optional[str] = None
+    ) -> "InvertedIndex":
+        """Wrap arrays laid out like `_pack_index` output, e.g. a merged index"""
+        idx = cls(index_path)
+        idx.__set_sections(sections)
+        return idx
+
+    def with_collection_stats(
+        self, doc_count: int, avg_doc_length: float, doc_freqs: np.ndarray
+    ) -> "InvertedIndex":
+        """A view of this index that scores BM25 against a larger collection
+
+        Used for segments: `doc_count`, `avg_doc_length` and the per-term
+        `doc_freqs` describe every live document across all segments.
+        """
+        view = copy.copy(self)
+        view.collection_doc_count = doc_count
+        view.avg_doc_length = avg_doc_length
+        view.bm25_idfs = _bm25_idfs(doc_count, doc_freqs)
+        return view
+
+    def doc_freqs(self, live: Optional[np.ndarray] = None) -> np.ndarray:
+        """Documents per term, counting only positions where `live` is True"""
+        if live is None:
+            return np.diff(self.postings_offsets)
+        counts = np.zeros(len(self.postings_docs) + 1, dtype=np.int64)
+        np.cumsum(live[self.postings_docs], out=counts[1:])
+        return counts[self.postings_offsets[1:]] - counts[self.postings_offsets[:-1]]
+
+    def term_keys(self) -> np.ndarray:
+        """The term dictionary as a sorted array of UTF-8 byte strings"""
+        if self.__term_keys is None:
+            offsets, blob = self.term_offsets.tolist(), self.term_blob.tobytes()
+            self.__term_keys = np.array(
+                [blob[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)],
+                dtype=np.bytes_,
+            )
+        return self.__term_keys
+
+    def is_current(self, documents: list[dict]) -> bool:
+        """Whether the loaded index was built from exactly these documents"""
+        return (
+            self.corpus_fingerprint is not None
+            and self.corpus_fingerprint == corpus_fingerprint(documents)
+        )
+
+    def convert_legacy(self) -> None:
+        """Rebuild this index from the pickles written by older versions"""
+        with open(self.legacy_index_path, "rb") as f:
+            index = pickle.load(f)
+        with open(self.legacy_docmap_path, "rb") as f:
+            docmap = pickle.load(f)
+        with open(self.legacy_tf_path, "rb") as f:
+            term_frequencies = pickle.load(f)
+        with open(self.legacy_doc_lengths_path, "rb") as f:
+            legacy_doc_lengths = pickle.load(f)
+
+        positions = {doc_id: i for i, doc_id in enumerate(docmap)}
+        postings = defaultdict(list)
+        for term, doc_ids in index.items():
+            for doc_id in sorted(doc_ids, key=positions.__getitem__):
+                postings[term].append((positions[doc_id], term_frequencies[doc_id][term]))
+        doc_lengths = [legacy_doc_lengths.get(doc_id, 0) for doc_id in docmap]
+        self.__set_sections(
+            _pack_index(list(docmap), list(docmap.values()), doc_lengths, postings)
+        )
+        self.corpus_fingerprint = corpus_fingerprint(list(docmap.values()))
+
+    def __set_sections(
+        self, sections: dict[str, np.ndarray], avg_doc_length: Optional[float] = None
+    ) -> None:
+        self.sections = sections
+        self.doc_lengths = sections["doc_lengths"]
+        self.term_offsets = sections["term_offsets"]
+        self.term_blob = sections["term_blob"]
+        self.postings_offsets = sections["postings_offsets"]
+        self.postings_docs = sections["postings_docs"]
+        self.postings_tfs = sections["postings_tfs"]
+        self.bm25_idfs = sections["bm25_idfs"]
+        if "term_max_tfs" not in sections:
+            sections.update(
+                _term_bound_sections(
+                    self.doc_lengths,
+                    self.postings_offsets,
+                    self.postings_docs,
+                    self.postings_tfs,
+                )
+            )
+        self.term_max_tfs = sections["term_max_tfs"]
+        self.term_min_doc_lengths = sections["term_min_doc_lengths"]
+        self.docmap = MappedDocuments(
+            sections["doc_ids"],
+            sections["doc_id_order"],
+            sections["doc_offsets"],
+            sections["doc_blob"],
+        )
+        self.doc_count = len(self.doc_lengths)
+        self.collection_doc_count = self.doc_count
+        self.__term_keys = None
+        if avg_doc_length is None:
+            avg_doc_length = self.__get_avg_doc_length()
+        self.avg_doc_length = avg_doc_length
+
+    def term_id(self, term: str) -> int:
+        """Position of `term` in the term dictionary, or -1 if it is not indexed"""
+        # The term dictionary is sorted by UTF-8 bytes, so a binary search over
+        # the mapped blob avoids materializing a dict on load.
+        key = term.encode("utf-8")
+        offsets, blob = self.term_offsets, self.term_blob
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid] : offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and blob[offsets[lo] : offsets[lo + 1]].tobytes() == key:
+            return lo
+        return -1
+
+    def __postings(self, token: str) -> tuple[int, np.ndarray, np.ndarray]:
+        term_id = self.term_id(token)
+        if term_id < 0:
+            empty = np.empty(0, dtype=np.int32)
+            return term_id, empty, empty
+        return (term_id, *self.__term_postings(term_id))
+
+    def __term_postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return self.postings_docs[start:end], self.postings_tfs[start:end]
+
+    def get_documents(self, term: str, live: Optional[np.ndarray] = None) -> list[int]:
+        _, positions, _ = self.__postings(term)
+        if live is not None:
+            positions = positions[live[positions]]
+        return sorted(self.docmap.doc_ids[positions].tolist())
+
+    def __bm25_idf(self, term_doc_count: int) -> float:
+        doc_count = self.collection_doc_count
+        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+
+    def __bm25_tf(self, tf, doc_length, k1: float = BM25_K1, b: float = BM25_B):
+        # Accepts scalars or numpy arrays; the arithmetic is kept in this exact
+        # order so both paths produce bit-identical scores.
+        avg_doc_length = self.avg_doc_length
+        if avg_doc_length > 0:
+            length_norm = 1 - b + b * (doc_length / avg_doc_length)
+        else:
+            length_norm = 1
+        return (tf * (k1 + 1)) / (tf + k1 * length_norm)
 
     def get_tf(self, doc_id: int, term: str) -> int:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        return self.term_frequencies[doc_id][token]
+        position = self.docmap.position(doc_id)
+        _, positions, tfs = self.__postings(token)
+        i = int(np.searchsorted(positions, position))
+        if position < 0 or i == len(positions) or positions[i] != position:
+            return 0
+        return int(tfs[i])
 
     def get_idf(self, term: str) -> float:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
+        doc_count = self.doc_count
+        term_doc_count = len(self.__postings(token)[1])
         return math.log((doc_count + 1) / (term_doc_count + 1))
 
     def get_bm25_idf(self, term: str) -> float:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
-        token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
-        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+        term_id = self.term_id(tokens[0])
+        if term_id >= 0:
+            return float(self.bm25_idfs[term_id])
+        return self.__bm25_idf(0)
 
     def get_bm25_tf(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
     ) -> float:
         tf = self.get_tf(doc_id, term)
-        doc_length = self.doc_lengths.get(doc_id, 0)
-        avg_doc_length = self.__get_avg_doc_length()
-        if avg_doc_length > 0:
-            length_norm = 1 - b + b * (doc_length / avg_doc_length)
-        else:
-            length_norm = 1
-        return (tf * (k1 + 1)) / (tf + k1 * length_norm)
+        position = self.docmap.position(doc_id)
+        doc_length = int(self.doc_lengths[position]) if position >= 0 else 0
+        return self.__bm25_tf(tf, doc_length, k1, b)
 
     def get_tf_idf(self, doc_id: int, term: str) -> float:
         tf = self.get_tf(doc_id, term)
@@ -111,53 +297,524 @@ class InvertedIndex:
         return tf * idf
 
     def __get_avg_doc_length(self) -> float:
-        if not self.doc_lengths or len(self.doc_lengths) == 0:
+        if len(self.doc_lengths) == 0:
             return 0.0
-        total_length = 0
-        for length in self.doc_lengths.values():
-            total_length += length
-        return total_length / len(self.doc_lengths)
+        return int(self.doc_lengths.sum(dtype=np.int64)) / len(self.doc_lengths)
 
     def bm25(self, doc_id: int, term: str) -> float:
         tf_component = self.get_bm25_tf(doc_id, term)
         idf_component = self.get_bm25_idf(term)
         return tf_component * idf_component
 
-    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        query_tokens = tokenize_text(query)
-
-        scores = {}
-        for doc_id in self.docmap:
-            score = 0.0
-            for token in query_tokens:
-                score += self.bm25(doc_id, token)
-            scores[doc_id] = score
-
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-
+    def __term_score(self, term_id: int, positions: np.ndarray, tfs: np.ndarray):
+        tf_components = self.__bm25_tf(tfs.astype(np.float64), self.doc_lengths[positions])
+        return tf_components * self.bm25_idfs[term_id]
+
+    def __term_upper_bound(self, term_id: int) -> float:
+        # The BM25 tf component grows with tf and shrinks with document
+        # length, so no posting can beat the highest tf in the shortest doc.
+        max_tf = float(self.term_max_tfs[term_id])
+        min_doc_length = int(self.term_min_doc_lengths[term_id])
+        return self.__bm25_tf(max_tf, min_doc_length) * float(self.bm25_idfs[term_id])
+
+    def __score_exhaustive(
+        self, term_ids: list[int], term_scores: Optional[dict] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Term-at-a-time: only documents in a token's postings list get a
+        # non-zero contribution, so nothing else needs to be visited.
+        scores = np.zeros(self.doc_count, dtype=np.float64)
+        for term_id in term_ids:
+            if term_scores is not None and term_id in term_scores:
+                positions, contributions = term_scores[term_id]
+            else:
+                positions, tfs = self.__term_postings(term_id)
+                contributions = self.__term_score(term_id, positions, tfs)
+            scores[positions] += contributions
+        return np.arange(self.doc_count), scores
+
+    def __score_max_score(
+        self, term_ids: list[int], limit: int, live: Optional[np.ndarray] = None
+    ) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """MaxScore pruning: fully score only documents that can reach the top-k
+
+        Documents are visited in blocks of positions, starting at
+        MAX_SCORE_BLOCK_SIZE and growing fourfold, and a heap keeps the k best
+        scores seen; its smallest is the threshold. Once the upper bounds of the
+        lowest-bound terms add up to less than the threshold, a document
+        matching only those terms can't make the top-k, so their (usually
+        very long) postings lists are no longer scanned, only probed for the
+        documents the other terms matched. Returns None when fewer than
+        `limit` documents match, leaving the zero-score fill to the
+        exhaustive scorer.
+        """
+        if self.doc_count <= MAX_SCORE_BLOCK_SIZE:
+            # A single block has nothing to skip.
+            return None
+        multiplicity = Counter(term_ids)
+        bounds = {
+            term_id: count * self.__term_upper_bound(term_id)
+            for term_id, count in multiplicity.items()
+        }
+        # Ascending, so the non-essential terms are always a prefix.
+        by_bound = sorted(bounds, key=bounds.__getitem__)
+        prefix_bounds = np.cumsum([bounds[term_id] for term_id in by_bound])
+        weights = np.array(
+            [multiplicity[term_id] * self.bm25_idfs[term_id] for term_id in by_bound]
+        )
+        postings = {term_id: self.__term_postings(term_id) for term_id in by_bound}
+        # Scores are summed in bound order here but in query order by the
+        # exact scorer, so every comparison gets a small rounding margin.
+        low, high = 1 - MAX_SCORE_EPSILON, 1 + MAX_SCORE_EPSILON
+
+        top: list[float] = []
+        threshold = 0.0
+        essential = 0
+        kept = []
+        postings_scored = 0
+        lo, size = 0, MAX_SCORE_BLOCK_SIZE
+        while lo < self.doc_count:
+            hi, size = lo + size, size * 4
+            while essential < len(by_bound) and (
+                prefix_bounds[essential] * high < threshold * low
+            ):
+                essential += 1
+            if essential == len(by_bound):
+                break
+
+            # The essential terms' postings in the block are scored together.
+            block_positions, block_tfs, lengths = [], [], []
+            for term_id in by_bound[essential:]:
+                positions, tfs = postings[term_id]
+                start, end = np.searchsorted(positions, (lo, hi))
+                block_positions.append(positions[start:end])
+                block_tfs.append(tfs[start:end])
+                lengths.append(end - start)
+            lo = hi
+            positions = np.concatenate(block_positions)
+            if len(positions) == 0:
+                continue
+            postings_scored += len(positions)
+            tfs = np.concatenate(block_tfs).astype(np.float64)
+            contributions = self.__bm25_tf(tfs, self.doc_lengths[positions])
+            contributions *= np.repeat(weights[essential:], lengths)
+            candidates, inverse = np.unique(positions, return_inverse=True)
+            scores = np.bincount(inverse, contributions, minlength=len(candidates))
+            # Deleted documents must not raise the threshold.
+            if live is not None:
+                scores[~live[candidates]] = -np.inf
+
+            # Non-essential terms are probed from the highest bound down, and
+            # a document drops out once even their remaining bounds can't
+            # lift it to the threshold.
+            for i in range(essential - 1, -1, -1):
+                keep = scores + prefix_bounds[i] * high >= threshold * low
+                candidates, scores = candidates[keep], scores[keep]
+                term_id = by_bound[i]
+                positions, tfs = postings[term_id]
+                found = np.searchsorted(positions, candidates)
+                found[found == len(positions)] = 0
+                match = positions[found] == candidates
+                matched = found[match]
+                scores[match] += multiplicity[term_id] * self.__term_score(
+                    term_id, positions[matched], tfs[matched]
+                )
+                postings_scored += len(matched)
+
+            for score in scores[top_k_indices(scores, limit)].tolist():
+                if score == -np.inf:
+                    break
+                if len(top) < limit:
+                    heapq.heappush(top, score)
+                elif score > top[0]:
+                    heapq.heapreplace(top, score)
+            if len(top) == limit:
+                threshold = top[0]
+            best = scores >= threshold * low
+            kept.append((candidates[best], scores[best]))
+
+        tracing.annotate(
+            postings=sum(len(positions) for positions, _ in postings.values()),
+            postings_scored=postings_scored,
+        )
+        if len(top) < limit:
+            return None
+        # Documents kept early, against a lower threshold, mostly drop out.
+        candidates = np.concatenate([positions for positions, _ in kept])
+        scores = np.concatenate([scores for _, scores in kept])
+        candidates = candidates[scores >= threshold * low]
+        return candidates, self.__score_candidates(term_ids, candidates)
+
+    def __score_candidates(self, term_ids: list[int], candidates: np.ndarray) -> np.ndarray:
+        # Same arithmetic and order as the exhaustive scorer, so the scores of
+        # the candidates are bit-identical to it.
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        for term_id in term_ids:
+            positions, tfs = self.__term_postings(term_id)
+            if len(positions) == 0:
+                continue
+            found = np.searchsorted(positions, candidates)
+            found[found == len(positions)] = 0
+            match = positions[found] == candidates
+            matched = found[match]
+            scores[match] += self.__term_score(term_id, positions[matched], tfs[matched])
+        return scores
+
+    def top_matches(
+        self,
+        tokens: list[str],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        prune: bool = False,
+        live: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and BM25 scores of the best `limit` documents for `tokens`
+
+        Ties keep corpus order, and documents without any match fill the
+        remaining slots with a zero score, exactly like scoring every doc.
+        Positions that are False in `live` (deleted documents) get -inf.
+        """
+        return self.top_matches_many([tokens], limit, prune, live)[0]
+
+    def top_matches_many(
+        self,
+        token_lists: list[list[str]],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        prune: bool = False,
+        live: Optional[np.ndarray] = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """`top_matches` for a batch of queries
+
+        Each distinct token is looked up once, and the per-document scores of
+        a term used by several queries are computed once and shared.
+        """
+        term_ids: dict[str, int] = {}
+        for tokens in token_lists:
+            for token in tokens:
+                if token not in term_ids:
+                    term_ids[token] = self.term_id(token)
+        query_term_ids = [
+            [term_ids[token] for token in tokens if term_ids[token] >= 0]
+            for tokens in token_lists
+        ]
+
+        usage = Counter(t for ids in query_term_ids for t in set(ids))
+        term_scores = {}
+        for term_id, count in usage.items():
+            if count > 1:
+                positions, tfs = self.__term_postings(term_id)
+                term_scores[term_id] = (
+                    positions,
+                    self.__term_score(term_id, positions, tfs),
+                )
+
+        matches = []
+        for ids in query_term_ids:
+            scored = None
+            if prune and len(set(ids)) > 1:
+                candidates = sum(len(self.__term_postings(t)[0]) for t in set(ids))
+                if candidates > limit:
+                    scored = self.__score_max_score(ids, limit, live)
+            if scored is None:
+                scored = self.__score_exhaustive(ids, term_scores)
+            positions, scores = scored
+            if live is not None:
+                scores = np.where(live[positions], scores, -np.inf)
+
+            best = top_k_indices(scores, limit)
+            matches.append((positions[best], scores[best]))
+        return matches
+
+    def bm25_search(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, prune: bool = False
+    ) -> list[dict]:
+        return self.search_many([query], limit, prune)[0]
+
+    def search_many(
+        self, queries: list[str], limit: int = DEFAULT_SEARCH_LIMIT, prune: bool = False
+    ) -> list[list[dict]]:
+        """`bm25_search` for a batch of queries, sharing tokens and term scores"""
+        token_lists = get_tokenizer().tokenize_many(queries)
+        return [
+            self.__format_matches(positions, scores)
+            for positions, scores in self.top_matches_many(token_lists, limit, prune)
+        ]
+
+    def __format_matches(self, positions: np.ndarray, scores: np.ndarray) -> list[dict]:
         results = []
-        for doc_id, score in sorted_docs[:limit]:
-            doc = self.docmap[doc_id]
+        for position, score in zip(positions, scores):
+            doc = self.docmap.document_at(position)
             formatted_result = format_search_result(
                 doc_id=doc["id"],
                 title=doc["title"],
                 document=doc["description"],
-                score=score,
+                score=float(score),
             )
             results.append(formatted_result)
 
         return results
 
 
+def _pack_batch(documents: list[dict]) -> dict[str, np.ndarray]:
+    # Same layout as `_pack_index`, but postings are collected as flat
+    # (term, position, tf) columns and grouped by one stable sort.
+    texts = [f"{m['title']} {m['description']}" for m in documents]
+    term_ids: dict[str, int] = {}
+    posting_terms, posting_docs, posting_tfs = [], [], []
+    doc_lengths = []
+    for position, tokens in enumerate(get_tokenizer().tokenize_many(texts)):
+        for token, tf in Counter(tokens).items():
+            posting_terms.append(term_ids.setdefault(token, len(term_ids)))
+            posting_docs.append(position)
+            posting_tfs.append(tf)
+        doc_lengths.append(len(tokens))
+
+    terms = sorted(term_ids, key=lambda term: term.encode("utf-8"))
+    ranks = np.empty(len(terms), dtype=np.int64)
+    ranks[[term_ids[term] for term in terms]] = np.arange(len(terms))
+    posting_ranks = ranks[np.array(posting_terms, dtype=np.int64)]
+    order = np.argsort(posting_ranks, kind="stable")
+    postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    postings_offsets[1:] = np.cumsum(np.bincount(posting_ranks, minlength=len(terms)))
+
+    return _pack_arrays(
+        np.array([m["id"] for m in documents], dtype=np.int64),
+        np.array(doc_lengths, dtype=np.int32),
+        [json.dumps(doc).encode("utf-8") for doc in documents],
+        [term.encode("utf-8") for term in terms],
+        postings_offsets,
+        np.array(posting_docs, dtype=np.int32)[order],
+        np.array(posting_tfs, dtype=np.int32)[order],
+    )
+
+
+def _merge_indexes(indexes: list["InvertedIndex"]) -> "InvertedIndex":
+    if len(indexes) == 1:
+        return indexes[0]
+    sections, _ = merge_sections(indexes, [None] * len(indexes))
+    return InvertedIndex.from_sections(sections)
+
+
+def _pack_index(
+    doc_ids: list[int],
+    documents: list[dict],
+    doc_lengths: list[int],
+    postings: dict[str, list[tuple[int, int]]],
+) -> dict[str, np.ndarray]:
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    postings_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    postings_docs = np.empty(postings_offsets[-1], dtype=np.int32)
+    postings_tfs = np.empty(postings_offsets[-1], dtype=np.int32)
+    for i, term in enumerate(terms):
+        start, end = postings_offsets[i], postings_offsets[i + 1]
+        postings_docs[start:end] = [position for position, _ in postings[term]]
+        postings_tfs[start:end] = [tf for _, tf in postings[term]]
+
+    return _pack_arrays(
+        np.array(doc_ids, dtype=np.int64),
+        np.array(doc_lengths, dtype=np.int32),
+        [json.dumps(doc).encode("utf-8") for doc in documents],
+        [term.encode("utf-8") for term in terms],
+        postings_offsets,
+        postings_docs,
+        postings_tfs,
+    )
+
+
+def merge_sections(
+    indexes: list[InvertedIndex],
+    lives: list[Optional[np.ndarray]],
+    orders: Optional[list[np.ndarray]] = None,
+) -> tuple[dict[str, np.ndarray], list[np.ndarray]]:
+    """Pack the live documents of several indexes into one, in index order
+
+    With `orders`, a sort key for every position of each index, the merged
+    documents are placed in ascending key order instead. Postings are merged
+    directly, so nothing is re-tokenized.
+
+    Returns:
+        The merged sections, and for each index an array mapping its old
+        positions to merged ones (-1 for documents that were dropped)
+    """
+    all_keys = [idx.term_keys() for idx in indexes]
+    union = np.unique(np.concatenate(all_keys))
+    kept_lists = [
+        np.arange(idx.doc_count) if live is None else np.flatnonzero(live)
+        for idx, live in zip(indexes, lives)
+    ]
+
+    # Where each kept document lands, counted across every index in order.
+    ranks = None
+    if orders is not None:
+        sort_keys = np.concatenate(
+            [order[kept] for order, kept in zip(orders, kept_lists)]
+        )
+        if np.any(np.diff(sort_keys) < 0):
+            ranks = np.empty(len(sort_keys), dtype=np.int64)
+            ranks[np.argsort(sort_keys, kind="stable")] = np.arange(len(sort_keys))
+
+    remaps, doc_ids, doc_lengths, document_bytes = [], [], [], []
+    posting_terms, posting_docs, posting_tfs = [], [], []
+    offset = 0
+    for idx, keys, live, kept in zip(indexes, all_keys, lives, kept_lists):
+        start = offset
+        remap = np.full(idx.doc_count, -1, dtype=np.int64)
+        if ranks is None:
+            remap[kept] = np.arange(offset, offset + len(kept))
+        else:
+            remap[kept] = ranks[offset : offset + len(kept)]
+        offset += len(kept)
+        remaps.append(remap)
+
+        doc_ids.append(idx.docmap.doc_ids[kept])
+        doc_lengths.append(idx.doc_lengths[kept])
+        doc_offsets, doc_blob = idx.docmap.offsets, idx.docmap.blob
+        document_bytes.extend(
+            doc_blob[doc_offsets[p] : doc_offsets[p + 1]].tobytes() for p in kept.tolist()
+        )
+
+        # Postings are kept as int32 and copied only when documents were
+        # dropped or moved, which halves the peak when a build merges a whole
+        # catalog.
+        terms = np.repeat(
+            np.searchsorted(union, keys).astype(np.int32), np.diff(idx.postings_offsets)
+        )
+        if live is None and ranks is None:
+            posting_terms.append(terms)
+            posting_docs.append(idx.postings_docs + np.int32(start))
+            posting_tfs.append(idx.postings_tfs)
+        elif live is None:
+            posting_terms.append(terms)
+            posting_docs.append(remap[idx.postings_docs].astype(np.int32))
+            posting_tfs.append(idx.postings_tfs)
+        else:
+            keep = live[idx.postings_docs]
+            posting_terms.append(terms[keep])
+            posting_docs.append(remap[idx.postings_docs[keep]].astype(np.int32))
+            posting_tfs.append(idx.postings_tfs[keep])
+
+    terms = np.concatenate(posting_terms)
+    posting_terms.clear()
+    docs = np.concatenate(posting_docs)
+    posting_docs.clear()
+    if ranks is None:
+        # Each index's postings are sorted by position and later indexes get
+        # later positions, so a stable sort by term keeps every list sorted.
+        order = np.argsort(terms, kind="stable")
+    else:
+        # Sorted by (term, position) as one key; much faster than lexsort.
+        order = np.argsort(terms.astype(np.int64) * offset + docs, kind="stable")
+        placed = np.argsort(ranks)
+        doc_ids = [np.concatenate(doc_ids)[placed]]
+        doc_lengths = [np.concatenate(doc_lengths)[placed]]
+        document_bytes = [document_bytes[i] for i in placed.tolist()]
+    counts = np.bincount(terms, minlength=len(union))
+    del terms
+    used = counts > 0
+    postings_offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+    postings_offsets[1:] = np.cumsum(counts[used])
+
+    sections = _pack_arrays(
+        np.concatenate(doc_ids).astype(np.int64),
+        np.concatenate(doc_lengths).astype(np.int32),
+        document_bytes,
+        union[used].tolist(),
+        postings_offsets,
+        docs[order].astype(np.int32, copy=False),
+        np.concatenate(posting_tfs)[order].astype(np.int32, copy=False),
+    )
+    return sections, remaps
+
+
+def _pack_arrays(
+    doc_ids_array: np.ndarray,
+    doc_lengths_array: np.ndarray,
+    document_bytes: list[bytes],
+    term_bytes: list[bytes],
+    postings_offsets: np.ndarray,
+    postings_docs: np.ndarray,
+    postings_tfs: np.ndarray,
+) -> dict[str, np.ndarray]:
+    # Terms must already be sorted by their UTF-8 bytes and each postings
+    # list sorted by position.
+    doc_offsets, doc_blob = pack_strings(document_bytes)
+    term_offsets, term_blob = pack_strings(term_bytes)
+    bm25_idfs = _bm25_idfs(len(doc_ids_array), np.diff(postings_offsets))
+
+    return {
+        **_term_bound_sections(
+            doc_lengths_array, postings_offsets, postings_docs, postings_tfs
+        ),
+        "doc_ids": doc_ids_array,
+        "doc_id_order": np.argsort(doc_ids_array, kind="stable"),
+        "doc_lengths": doc_lengths_array,
+        "doc_offsets": doc_offsets,
+        "doc_blob": doc_blob,
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "postings_offsets": postings_offsets,
+        "postings_docs": postings_docs,
+        "postings_tfs": postings_tfs,
+        "bm25_idfs": bm25_idfs,
+    }
+
+
+def _bm25_idfs(doc_count: int, doc_freqs: np.ndarray) -> np.ndarray:
+    # math.log rather than np.log, so every index agrees to the last bit.
+    return np.array(
+        [
+            math.log((doc_count - df + 0.5) / (df + 0.5) + 1)
+            for df in doc_freqs.tolist()
+        ],
+        dtype=np.float64,
+    )
+
+
+def _term_bound_sections(
+    doc_lengths: np.ndarray,
+    postings_offsets: np.ndarray,
+    postings_docs: np.ndarray,
+    postings_tfs: np.ndarray,
+) -> dict[str, np.ndarray]:
+    # Per-term max tf and min document length bound every BM25 term score
+    # without depending on the corpus statistics they are combined with.
+    if len(postings_docs) == 0:
+        empty = np.zeros(len(postings_offsets) - 1, dtype=np.int32)
+        return {"term_max_tfs": empty, "term_min_doc_lengths": empty}
+    starts = postings_offsets[:-1]
+    return {
+        "term_max_tfs": np.maximum.reduceat(postings_tfs, starts).astype(np.int32),
+        "term_min_doc_lengths": np.minimum.reduceat(
+            doc_lengths[postings_docs], starts
+        ).astype(np.int32),
+    }
+
+
+def _open_index():
+    # Segments are built on top of this module, hence the late import.
+    from .segmented_index import SegmentedIndex
+
+    return SegmentedIndex()
+
+
+def _load_index():
+    idx = _open_index()
+    idx.load()
+    return idx
+
+
 def build_command() -> None:
-    idx = InvertedIndex()
-    idx.build()
-    idx.save()
+    _open_index().build()
 
 
-def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-    idx = InvertedIndex()
-    idx.load()
+def convert_command() -> None:
+    _open_index().convert_legacy()
+
+
+def search_command(
+    query: str, limit: int = DEFAULT_SEARCH_LIMIT, idx=None
+) -> list[dict]:
+    if idx is None:
+        idx = _load_index()
     query_tokens = tokenize_text(query)
     seen, results = set(), []
     for query_token in query_tokens:
@@ -180,58 +837,76 @@ def preprocess_text(text: str) -> str:
     return text
 
 
+class Tokenizer:
+    def __init__(
+        self,
+        stopwords: Optional[Iterable[str]] = None,
+        stem_cache_size: int = STEM_CACHE_SIZE,
+    ) -> None:
+        if stopwords is None:
+            stopwords = load_stopwords()
+        self.stopwords = frozenset(stopwords)
+        from nltk.stem.porter import PorterStemmer
+
+        self.stemmer = PorterStemmer()
+        # Movie text has a small vocabulary compared to its token count, so
+        # memoizing the stemmer removes most of the tokenization cost.
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+        self.punctuation_table = str.maketrans("", "", string.punctuation)
+
+    def tokenize(self, text: str) -> list[str]:
+        words = text.lower().translate(self.punctuation_table).split()
+        stopwords = self.stopwords
+        stem = self.stem
+        return [stem(word) for word in words if word not in stopwords]
+
+    def tokenize_many(self, texts: Iterable[str]) -> list[list[str]]:
+        return [self.tokenize(text) for text in texts]
+
+
+_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer()
+    return _tokenizer
+
+
 def tokenize_text(text: str) -> list[str]:
-    text = preprocess_text(text)
-    tokens = text.split()
-    valid_tokens = []
-    for token in tokens:
-        if token:
-            valid_tokens.append(token)
-    stop_words = load_stopwords()
-    filtered_words = []
-    for word in valid_tokens:
-        if word not in stop_words:
-            filtered_words.append(word)
-    stemmer = PorterStemmer()
-    stemmed_words = []
-    for word in filtered_words:
-        stemmed_words.append(stemmer.stem(word))
-    return stemmed_words
+    return get_tokenizer().tokenize(text)
 
 
 def tf_command(doc_id: int, term: str) -> int:
-    idx = InvertedIndex()
-    idx.load()
+    idx = _load_index()
     return idx.get_tf(doc_id, term)
 
 
 def bm25_tf_command(
     doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
 ) -> float:
-    idx = InvertedIndex()
-    idx.load()
+    idx = _load_index()
     return idx.get_bm25_tf(doc_id, term, k1, b)
 
 
 def idf_command(term: str) -> float:
-    idx = InvertedIndex()
-    idx.load()
+    idx = _load_index()
     return idx.get_idf(term)
 
 
 def bm25_idf_command(term: str) -> float:
-    idx = InvertedIndex()
-    idx.load()
+    idx = _load_index()
     return idx.get_bm25_idf(term)
 
 
 def tfidf_command(doc_id: int, term: str) -> float:
-    idx = InvertedIndex()
-    idx.load()
+    idx = _load_index()
     return idx.get_tf_idf(doc_id, term)
 
 
-def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-    idx = InvertedIndex()
-    idx.load()
-    return idx.bm25_search(query, limit)
\ No newline at end of file
+def bm25search_command(
+    query: str, limit: int = DEFAULT_SEARCH_LIMIT, prune: bool = False
+) -> list[dict]:
+    idx = _load_index()
+    return idx.bm25_search(query, limit, prune)
\ No newline at end of file
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from . import tracing
+from .caching import DiskCache
+from .search_utils import (
+    LLM_BACKOFF_SECONDS,
+    LLM_CACHE_BYPASS_ENV,
+    LLM_CACHE_DIR,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_MAX_BACKOFF_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_REQUEST_BURST,
+    LLM_REQUESTS_PER_SECOND,
+    LLM_RETRY_STATUS_CODES,
+)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+_client = None
+_client_lock = threading.Lock()
+
+llm_cache = DiskCache(LLM_CACHE_DIR, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES)
+_cache_bypassed = os.environ.get(LLM_CACHE_BYPASS_ENV, "") not in ("", "0")
+
+
+def get_client():
+    """Create the Gemini client on first use so importing a module stays cheap"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from google import genai
+
+            load_dotenv()
+            _client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return _client
+
+
+def set_client(client) -> None:
+    """Use `client` for every call, e.g. a local fake that mimics `models`"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second on average, bursts of `burst`"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the wait"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+rate_limiter = RateLimiter(LLM_REQUESTS_PER_SECOND, LLM_REQUEST_BURST)
+
+
+def bypass_cache(bypass: bool = True) -> None:
+    """Send every following call to Gemini without reading or writing the cache"""
+    global _cache_bypassed
+    _cache_bypassed = bypass
+
+
+class LLMResponse:
+    """The parts of a Gemini response callers use, in a form that can be cached"""
+
+    def __init__(
+        self, text: Optional[str], total_tokens: Optional[int] = None, cached: bool = False
+    ) -> None:
+        self.text = text
+        self.total_tokens = total_tokens
+        self.cached = cached
+
+
+def generate(
+    contents: Any, model: str = GEMINI_MODEL, config: Optional[dict] = None
+) -> LLMResponse:
+    """`generate_content`, answered from the on-disk cache when possible
+
+    Prompts are deterministic, so the same model, contents and config give
+    the same key and are only sent to Gemini once per LLM_CACHE_TTL_SECONDS.
+    """
+    with tracing.span("llm.generate", model=model) as span:
+        key = None
+        if not _cache_bypassed:
+            key = _cache_key(model, contents, config)
+            cached = llm_cache.get(key)
+            if cached is not None:
+                span.set(cached=True, total_tokens=cached["total_tokens"])
+                return LLMResponse(cached["text"], cached["total_tokens"], cached=True)
+
+        kwargs = {} if config is None else {"config": config}
+        throttled = 0.0
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            throttled += rate_limiter.acquire()
+            try:
+                response = get_client().models.generate_content(
+                    model=model, contents=contents, **kwargs
+                )
+                break
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                # Exponential backoff with jitter, so concurrent callers that
+                # were throttled together don't retry together.
+                delay = min(LLM_MAX_BACKOFF_SECONDS, LLM_BACKOFF_SECONDS * 2**attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        usage = response.usage_metadata
+        result = LLMResponse(response.text, usage.total_token_count if usage else None)
+        span.set(
+            cached=False,
+            attempts=attempt + 1,
+            throttled_s=throttled,
+            total_tokens=result.total_tokens,
+        )
+        if key is not None and result.text is not None:
+            llm_cache.put(key, {"text": result.text, "total_tokens": result.total_tokens})
+        return result
+
+
+def _is_retryable(error: Exception) -> bool:
+    # google.genai's APIError carries the HTTP status as `code`.
+    return getattr(error, "code", None) in LLM_RETRY_STATUS_CODES
+
+
+def _cache_key(model: str, contents: Any, config: Optional[dict]) -> str:
+    parts = contents if isinstance(contents, list) else [contents]
+    payload = {
+        "model": model,
+        "contents": [_part_key(part) for part in parts],
+        "config": config,
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=repr).encode("utf-8")
+    ).hexdigest()
+
+
+def _part_key(part: Any) -> Any:
+    if isinstance(part, str):
+        return part
+    # Inline images are keyed by a digest of their bytes.
+    inline = getattr(part, "inline_data", None)
+    if inline is not None and inline.data is not None:
+        return {
+            "mime_type": inline.mime_type,
+            "sha256": hashlib.sha256(inline.data).hexdigest(),
+        }
+    return repr(part)
@@ -1,31 +1,204 @@
-from PIL import Image
-from sentence_transformers import SentenceTransformer
-from .semantic_search import cosine_similarity
-from .search_utils import DEFAULT_SEARCH_LIMIT, load_movies
+import hashlib
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from . import tracing
+from .semantic_search import (
+    QueryEmbeddingCache,
+    embedding_key,
+    get_sentence_transformer,
+    normalize_embeddings,
+    read_keyed_embeddings,
+    write_keyed_embeddings,
+)
+from .search_utils import (
+    CLIP_IMAGE_EMBEDDINGS_DIR,
+    CLIP_IMAGE_SIZE,
+    CLIP_TEXT_EMBEDDING_KEYS_PATH,
+    CLIP_TEXT_EMBEDDINGS_PATH,
+    DEFAULT_SEARCH_LIMIT,
+    IMAGE_DECODE_WORKERS,
+    IMAGE_EMBEDDING_CACHE_MAX_BYTES,
+    IMAGE_EMBEDDING_CACHE_SIZE,
+    IMAGE_ENCODE_BATCH_SIZE,
+    IMAGE_EXTENSIONS,
+    SEARCH_MANY_BATCH_SIZE,
+    load_movies,
+    top_k_indices,
+)
+
+# Image embeddings keyed by model and a hash of the file's bytes, so a poster
+# is only encoded once however it is named or wherever it is moved.
+image_embedding_cache = QueryEmbeddingCache(
+    IMAGE_EMBEDDING_CACHE_SIZE,
+    CLIP_IMAGE_EMBEDDINGS_DIR,
+    IMAGE_EMBEDDING_CACHE_MAX_BYTES,
+)
+
 
 class MultimodalSearch:
-    def __init__(self,documents = list[dict], model_name="clip-ViT-B-32"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self, documents: Optional[list[dict]] = None, model_name="clip-ViT-B-32"
+    ):
+        self.model_name = model_name
+        self._model = None
+        self.documents = None
+        self.text_embeddings = None
+        if documents is not None:
+            self.load_or_create_text_embeddings(documents)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_sentence_transformer(self.model_name)
+        return self._model
+
+    def load_or_create_text_embeddings(self, documents: list[dict]) -> np.ndarray:
+        """Unit-length CLIP embeddings of every `title: description`, cached on disk
+
+        Each row is stored with a hash of its text and the model, so only
+        movies that were added or edited since the last run are re-encoded.
+        """
         self.documents = documents
-        self.texts = [f"{d['title']}: {d['description']}" for d in self.documents]
-        self.text_embeddings = self.model.encode(self.texts, show_progress_bar=True)
-    def embed_image(self, path):
-        img = Image.open(path)
-        embedding = self.model.encode([img])[0]
+        texts = [f"{d['title']}: {d['description']}" for d in documents]
+        keys = [embedding_key(text, self.model_name) for text in texts]
+
+        previous = read_keyed_embeddings(
+            CLIP_TEXT_EMBEDDINGS_PATH, CLIP_TEXT_EMBEDDING_KEYS_PATH
+        )
+        if previous is None or previous[0] != keys:
+            write_keyed_embeddings(
+                lambda batch: self.model.encode(batch),
+                self.model_name,
+                texts,
+                CLIP_TEXT_EMBEDDINGS_PATH,
+                CLIP_TEXT_EMBEDDING_KEYS_PATH,
+                previous,
+            )
+
+        embeddings = np.load(CLIP_TEXT_EMBEDDINGS_PATH, mmap_mode="r")
+        self.text_embeddings = normalize_embeddings(embeddings)
+        return self.text_embeddings
+
+    def embed_image(self, path, persist: bool = False):
+        """CLIP embedding of one image, cached in memory (and on disk if `persist`)
+
+        One-off lookups stay off the disk tier by default, so ad hoc images
+        don't fill it; `embed_images` batches always use it.
+        """
+        key, embedding, img = _decode_image(path, self.model_name, persist)
+        if embedding is None:
+            embedding = image_embedding_cache.put(
+                key, self.model.encode([img])[0], disk=persist
+            )
         return embedding
-    def search_with_image(self, image_path):
-        image_embedding = self.embed_image(image_path)
-        similarity = []
-        for i, text_embedding in enumerate(self.text_embeddings):
-            similarity.append((cosine_similarity(text_embedding, image_embedding), self.documents[i]))
 
-        similarity.sort(key=lambda x: x[0], reverse=True)
+    def embed_images(
+        self,
+        paths: list[str],
+        batch_size: int = IMAGE_ENCODE_BATCH_SIZE,
+        workers: int = IMAGE_DECODE_WORKERS,
+    ) -> tuple[list[Optional[np.ndarray]], list[Optional[str]]]:
+        """CLIP embeddings of `paths` plus, for each, an error message or None
+
+        Files are read, hashed and decoded on a thread pool that runs at most
+        two batches ahead of the encoder, so memory stays bounded however many
+        images there are. Cached images skip decoding and the model entirely.
+        A file that cannot be read or decoded gets an error and no embedding.
+        """
+        embeddings: list[Optional[np.ndarray]] = [None] * len(paths)
+        errors: list[Optional[str]] = [None] * len(paths)
+        batch: list[tuple[int, str, object]] = []
+
+        def encode_batch() -> None:
+            encoded = self.model.encode(
+                [img for _, _, img in batch], batch_size=batch_size
+            )
+            for (i, key, _), embedding in zip(batch, encoded):
+                embeddings[i] = image_embedding_cache.put(key, embedding)
+            batch.clear()
+
+        with tracing.span("embed_images", images=len(paths)) as span:
+            decode = tracing.propagate(lambda p: _decode_image(p, self.model_name))
+            window = 2 * max(batch_size, workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque(executor.submit(decode, p) for p in paths[:window])
+                for i in range(len(paths)):
+                    if i + window < len(paths):
+                        pending.append(executor.submit(decode, paths[i + window]))
+                    try:
+                        key, embedding, img = pending.popleft().result()
+                    except Exception as e:
+                        errors[i] = f"{type(e).__name__}: {e}"
+                        continue
+                    if embedding is not None:
+                        embeddings[i] = embedding
+                        continue
+                    batch.append((i, key, img))
+                    if len(batch) >= batch_size:
+                        encode_batch()
+                if batch:
+                    encode_batch()
+            span.set(errors=sum(error is not None for error in errors))
+        return embeddings, errors
+
+    def search_with_image(self, image_path, limit=DEFAULT_SEARCH_LIMIT):
+        if self.text_embeddings is None:
+            raise ValueError(
+                "No text embeddings loaded. Call load_or_create_text_embeddings first."
+            )
+        image_embedding = normalize_embeddings(self.embed_image(image_path))
+        # Both sides are unit length, so one matrix-vector product gives the
+        # cosine similarity to every movie.
+        scores = self.text_embeddings @ image_embedding
+        return self._format_results(scores, limit)
+
+    def search_with_images(
+        self,
+        image_paths: list[str],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        batch_size: int = IMAGE_ENCODE_BATCH_SIZE,
+        workers: int = IMAGE_DECODE_WORKERS,
+    ) -> list[dict]:
+        """`search_with_image` for every image in `image_paths` and directories
 
+        Returns one `{"image", "results"}` entry per image, in order, or
+        `{"image", "error"}` for images that could not be read. Scores are one
+        matrix product per SEARCH_MANY_BATCH_SIZE images.
+        """
+        if self.text_embeddings is None:
+            raise ValueError(
+                "No text embeddings loaded. Call load_or_create_text_embeddings first."
+            )
+        paths = list_images(image_paths)
+        embeddings, errors = self.embed_images(paths, batch_size, workers)
+        found = [i for i, error in enumerate(errors) if error is None]
+
+        results = [
+            {"image": path, "error": error} for path, error in zip(paths, errors)
+        ]
+        for start in range(0, len(found), SEARCH_MANY_BATCH_SIZE):
+            rows = found[start : start + SEARCH_MANY_BATCH_SIZE]
+            block = normalize_embeddings(np.stack([embeddings[i] for i in rows]))
+            for i, scores in zip(rows, block @ self.text_embeddings.T):
+                results[i] = {
+                    "image": paths[i],
+                    "results": self._format_results(scores, limit),
+                }
+        return results
+
+    def _format_results(self, scores: np.ndarray, limit: int) -> list[dict]:
         results = []
-        for score, doc in similarity[:DEFAULT_SEARCH_LIMIT]:
+        for i in top_k_indices(scores, limit):
+            doc = self.documents[i]
             results.append(
                 {
-                    "score": score,
+                    "score": float(scores[i]),
                     "id": doc['id'],
                     "title": doc["title"],
                     "description": doc["description"],
@@ -34,6 +207,50 @@ class MultimodalSearch:
 
         return results
 
+
+def list_images(paths: list[str]) -> list[str]:
+    """`paths` with each directory replaced by the image files under it, sorted"""
+    images = []
+    for path in paths:
+        if not os.path.isdir(path):
+            images.append(path)
+            continue
+        found = []
+        for root, _, files in os.walk(path):
+            found.extend(
+                os.path.join(root, name)
+                for name in files
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        images.extend(sorted(found))
+    return images
+
+
+def _decode_image(
+    path: str, model_name: str, disk: bool = True
+) -> tuple[str, Optional[np.ndarray], object]:
+    """Cache key of the file, and its cached embedding or else the decoded image"""
+    with open(path, "rb") as f:
+        data = f.read()
+    key = embedding_key(hashlib.sha256(data).hexdigest(), model_name)
+    embedding = image_embedding_cache.get(key, disk)
+    if embedding is not None:
+        return key, embedding, None
+
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    scale = CLIP_IMAGE_SIZE / min(img.size)
+    if scale < 1:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        # Lets the JPEG decoder skip straight to a reduced scale.
+        img.draft("RGB", size)
+        img = img.convert("RGB").resize(size, Image.BICUBIC)
+    else:
+        img = img.convert("RGB")
+    return key, None, img
+
+
 def verify_image_embedding(image_path):
     ms = MultimodalSearch()
     embedding = ms.embed_image(image_path)
@@ -43,3 +260,13 @@ def image_search_command(image_path):
     ms = MultimodalSearch(load_movies())
     result = ms.search_with_image(image_path)
     return result
+
+
+def batch_image_search_command(
+    image_paths: list[str],
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    batch_size: int = IMAGE_ENCODE_BATCH_SIZE,
+    workers: int = IMAGE_DECODE_WORKERS,
+) -> list[dict]:
+    ms = MultimodalSearch(load_movies())
+    return ms.search_with_images(image_paths, limit, batch_size, workers)
@@ -0,0 +1,131 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from .search_utils import QUANTIZATION_MODES
+
+QUANTIZE_BATCH_SIZE = 65536
+
+
+class QuantizedEmbeddings:
+    """Compact copy of a unit-normalized embedding matrix for first-pass scoring
+
+    "float16" halves the memory of float32 vectors. "int8" quarters it and
+    stores one scale per dimension, so that row ~= codes * scale.
+    """
+
+    def __init__(
+        self, mode: str, codes: np.ndarray, scale: Optional[np.ndarray] = None
+    ) -> None:
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"unknown quantization mode: {mode}")
+        self.mode = mode
+        self.codes = codes
+        self.scale = scale
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (0 if self.scale is None else self.scale.nbytes)
+
+    @classmethod
+    def from_embeddings(
+        cls, embeddings: np.ndarray, mode: str
+    ) -> "QuantizedEmbeddings":
+        """Quantize raw (possibly memory-mapped) vectors, normalizing batch by batch"""
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"unknown quantization mode: {mode}")
+        n_rows, dims = embeddings.shape
+        if mode == "float16":
+            codes = np.empty((n_rows, dims), dtype=np.float16)
+            for start, batch in _normalized_batches(embeddings):
+                codes[start : start + len(batch)] = batch
+            return cls(mode, codes)
+
+        max_abs = np.zeros(dims, dtype=np.float32)
+        for _, batch in _normalized_batches(embeddings):
+            np.maximum(max_abs, np.abs(batch).max(axis=0), out=max_abs)
+        scale = np.where(max_abs > 0, max_abs / 127, 1.0).astype(np.float32)
+        codes = np.empty((n_rows, dims), dtype=np.int8)
+        for start, batch in _normalized_batches(embeddings):
+            codes[start : start + len(batch)] = np.clip(np.rint(batch / scale), -127, 127)
+        return cls(mode, codes, scale)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of `query` with every row, or with `rows`"""
+        codes = self.codes if rows is None else self.codes[rows]
+        # Folding the per-dimension scale into the query keeps the codes as is.
+        query = query if self.scale is None else query * self.scale
+        query = query.astype(np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), QUANTIZE_BATCH_SIZE):
+            batch = codes[start : start + QUANTIZE_BATCH_SIZE].astype(np.float32)
+            scores[start : start + len(batch)] = batch @ query
+        return scores
+
+    def save(self, path: str, source_rows: int) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {"codes": self.codes, "source_rows": np.array(source_rows)}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(
+        cls, path: str, mode: str, source_rows: int
+    ) -> Optional["QuantizedEmbeddings"]:
+        """Load a saved matrix, or None if it was built from a different source"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data["source_rows"]) != source_rows:
+                return None
+            scale = data["scale"] if "scale" in data else None
+            return cls(mode, data["codes"], scale)
+
+
+def quantized_path(embeddings_path: str, mode: str) -> str:
+    root, _ = os.path.splitext(embeddings_path)
+    return f"{root}.{mode}.npz"
+
+
+def load_or_quantize(
+    embeddings_path: str, mode: str, full_embeddings: np.ndarray
+) -> QuantizedEmbeddings:
+    path = quantized_path(embeddings_path, mode)
+    quantized = QuantizedEmbeddings.load(path, mode, len(full_embeddings))
+    if quantized is None:
+        quantized = QuantizedEmbeddings.from_embeddings(full_embeddings, mode)
+        quantized.save(path, len(full_embeddings))
+    return quantized
+
+
+def remove_quantized(embeddings_path: str) -> None:
+    for mode in QUANTIZATION_MODES:
+        path = quantized_path(embeddings_path, mode)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def rescore(
+    full_embeddings: np.ndarray, rows: np.ndarray, query: np.ndarray
+) -> np.ndarray:
+    """Exact cosine similarity of `query` (unit length) with the given raw rows"""
+    vectors = np.asarray(full_embeddings[rows], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    return (vectors @ query) / norms
+
+
+def _normalized_batches(embeddings: np.ndarray):
+    for start in range(0, len(embeddings), QUANTIZE_BATCH_SIZE):
+        batch = np.asarray(
+            embeddings[start : start + QUANTIZE_BATCH_SIZE], dtype=np.float32
+        )
+        norms = np.linalg.norm(batch, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        yield start, batch / norms
@@ -1,14 +1,9 @@
-import os
 from typing import Optional
 
-from dotenv import load_dotenv
-from google import genai
+from . import tracing
+from .llm import GEMINI_MODEL, generate
 
-
-load_dotenv()
-api_key = os.environ.get("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-model = "gemini-2.5-flash"
+model = GEMINI_MODEL
 
 
 def spell_correct(query: str) -> str:
@@ -20,7 +15,7 @@ Query: "{query}"
 
 If no errors, return the original query.
 Corrected:"""
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
     corrected = (response.text or "").strip().strip('"')
     return corrected if corrected else query
 
@@ -45,7 +40,7 @@ Examples:
 
 Rewritten query:"""
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
     rewritten = (response.text or "").strip().strip('"')
     return rewritten if rewritten else query
 
@@ -65,12 +60,14 @@ Examples:
 Query: "{query}"
 """
 
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
     expanded_terms = (response.text or "").strip().strip('"')
 
     return f"{query} {expanded_terms}"
 
+@tracing.traced("query_enhancement")
 def enhance_query(query: str, method: Optional[str] = None) -> str:
+    tracing.annotate(method=method)
     match method:
         case "spell":
             return spell_correct(query)
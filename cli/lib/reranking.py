@@ -1,24 +1,45 @@
-import os
 import json
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
-from google import genai
-from sentence_transformers import  CrossEncoder
+from . import tracing
+from .caching import LRUCache
+from .llm import GEMINI_MODEL, generate
+from .search_utils import (
+    CROSS_ENCODER_BATCH_SIZE,
+    CROSS_ENCODER_CACHE_SIZE,
+    LLM_MAX_CONCURRENCY,
+)
 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-model = "gemini-2.5-flash"
+model = GEMINI_MODEL
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-TinyBERT-L2-v2"
 
 
 def llm_rerank_individual(
-    query: str, documents: list[dict], limit: int = 5
+    query: str,
+    documents: list[dict],
+    limit: int = 5,
+    max_concurrency: int = LLM_MAX_CONCURRENCY,
 ) -> list[dict]:
-    scored_docs = []
+    """Score each document with its own LLM request, several in flight at once
+
+    Pacing and 429 retries happen in `generate`. A document whose request or
+    score fails gets a score of 0 and a `rerank_error` instead of failing the
+    whole rerank.
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        scored_docs = list(
+            executor.map(
+                tracing.propagate(lambda doc: _score_individual(query, doc)), documents
+            )
+        )
+
+    scored_docs.sort(key=lambda x: x["individual_score"], reverse=True)
+    return scored_docs[:limit]
 
-    for doc in documents:
-        prompt = f"""Rate how well this movie matches the search query.
+
+def _score_individual(query: str, doc: dict) -> dict:
+    prompt = f"""Rate how well this movie matches the search query.
 
 Query: "{query}"
 Movie: {doc.get("title", "")} - {doc.get("document", "")}
@@ -33,14 +54,14 @@ Give me ONLY the number in your response, no other text or explanation.
 
 Score:"""
 
-        response = client.models.generate_content(model=model, contents=prompt)
+    try:
+        response = generate(prompt, model)
         score_text = response.text or 0
         score = int(score_text)
-        scored_docs.append({**doc, "individual_score": score})
-        sleep(3)
-
-    scored_docs.sort(key=lambda x: x["individual_score"], reverse=True)
-    return scored_docs[:limit]
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return {**doc, "individual_score": 0, "rerank_error": error}
+    return {**doc, "individual_score": score}
 
 
 def llm_rerank_batch(query: str, documents: list[dict], limit: int = 5) -> list[dict]:
@@ -58,7 +79,7 @@ Return ONLY the IDs in order of relevance (best match first). Return a valid JSO
 
 [75, 12, 34, 2, 1]
 """
-    response = client.models.generate_content(model=model, contents=prompt)
+    response = generate(prompt, model)
     ranking = response.text.strip()
     if "json" in ranking.lower():
         ranking = ranking.lower().replace("json", "")
@@ -81,25 +102,60 @@ Return ONLY the IDs in order of relevance (best match first). Return a valid JSO
                 scored_docs.append(doc)
     return scored_docs[:limit]
 
-def cross_encoder_rerank(query: str, documents: list[dict], limit: int = 5):
-    pairs = []
-    cross_encoder = CrossEncoder("cross-encoder/ms-marco-TinyBERT-L2-v2")
-    for doc in documents:
-        pairs.append([query, f"{doc.get('title', '')} - {doc.get('document', '')}"])
-    # scores is a list of numbers, one for each pair
-    scores = cross_encoder.predict(pairs)
-    
-    scored_docs = []
-    for index,score in enumerate(scores):        
-        scored_docs.append({**documents[index], 'cross_encoder_score': score})
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+# (query, doc id, pair text) -> score; the text keeps edited documents from
+# reusing a stale score.
+cross_encoder_cache = LRUCache(CROSS_ENCODER_CACHE_SIZE)
+
 
-        
+def get_cross_encoder():
+    global _cross_encoder
+    with _cross_encoder_lock:
+        if _cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+
+            _cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL)
+    return _cross_encoder
+
+
+def cross_encoder_rerank(query: str, documents: list[dict], limit: int = 5):
+    """Rerank with the shared cross-encoder, predicting only unseen pairs
+
+    The pairs left after the cache lookup are sorted by length before being
+    predicted in CROSS_ENCODER_BATCH_SIZE batches, so each batch is padded to
+    about the length of its own pairs rather than the longest one overall.
+    """
+    query = " ".join(query.split())
+    texts = [f"{doc.get('title', '')} - {doc.get('document', '')}" for doc in documents]
+    keys = [(query, doc.get("id"), text) for doc, text in zip(documents, texts)]
+    scores = [cross_encoder_cache.get(key) for key in keys]
+
+    missing = sorted(
+        (i for i, score in enumerate(scores) if score is None),
+        key=lambda i: len(texts[i]),
+    )
+    tracing.annotate(cached_scores=len(documents) - len(missing))
+    if missing:
+        predicted = get_cross_encoder().predict(
+            [[query, texts[i]] for i in missing], batch_size=CROSS_ENCODER_BATCH_SIZE
+        )
+        for i, score in zip(missing, predicted):
+            scores[i] = float(score)
+            cross_encoder_cache.put(keys[i], scores[i])
+
+    scored_docs = [
+        {**doc, "cross_encoder_score": score} for doc, score in zip(documents, scores)
+    ]
     scored_docs.sort(key=lambda x: x["cross_encoder_score"], reverse=True)
     return scored_docs[:limit]
 
+@tracing.traced("rerank")
 def rerank(
     query: str, documents: list[dict], method: str = "batch", limit: int = 5
 ) -> list[dict]:
+    tracing.annotate(method=method, candidates=len(documents))
     match method:
         case "individual":
             return llm_rerank_individual(query, documents, limit)
@@ -0,0 +1,89 @@
+import json
+import os
+from typing import Any, Optional
+
+from .search_utils import (
+    DEFAULT_ALPHA,
+    DEFAULT_SEARCH_LIMIT,
+    IMAGE_DECODE_WORKERS,
+    IMAGE_ENCODE_BATCH_SIZE,
+    RRF_K,
+    SEARCH_SERVER_URL_ENV,
+)
+
+
+class SearchClient:
+    """Thin client for a running search server, mirroring the *_command results"""
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+
+    def keyword(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        return self._post("/keyword", query=query, limit=limit)
+
+    def semantic(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        return self._post("/semantic", query=query, limit=limit)
+
+    def weighted(
+        self, query: str, alpha: float = DEFAULT_ALPHA, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> dict:
+        return self._post("/weighted", query=query, alpha=alpha, limit=limit)
+
+    def rrf(
+        self,
+        query: str,
+        k: int = RRF_K,
+        enhance: Optional[str] = None,
+        rerank_method: Optional[str] = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> dict:
+        return self._post(
+            "/rrf",
+            query=query,
+            k=k,
+            enhance=enhance,
+            rerank_method=rerank_method,
+            limit=limit,
+        )
+
+    def rag(self, query: str, mode: str = "rag", limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        return self._post("/rag", query=query, mode=mode, limit=limit)
+
+    def image(self, image_path: str) -> dict:
+        return self._post("/image", image_path=os.path.abspath(image_path))
+
+    def images(
+        self,
+        image_paths: list[str],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        batch_size: int = IMAGE_ENCODE_BATCH_SIZE,
+        workers: int = IMAGE_DECODE_WORKERS,
+    ) -> dict:
+        return self._post(
+            "/images",
+            image_paths=[os.path.abspath(path) for path in image_paths],
+            limit=limit,
+            batch_size=batch_size,
+            workers=workers,
+        )
+
+    def _post(self, endpoint: str, **payload: Any) -> dict:
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.url + endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise RuntimeError(f"search server error ({e.code}): {message}") from e
+
+
+def get_server_url(url: Optional[str] = None) -> Optional[str]:
+    return url or os.environ.get(SEARCH_SERVER_URL_ENV) or None
@@ -0,0 +1,162 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+import numpy as np
+
+from .augmented_generation import answer_question, citations, rag, summarize
+from .hybrid_search import HybridSearch, rrf_search_command, weighted_search_command
+from .llm import llm_cache
+from .multimodal_search import MultimodalSearch, image_embedding_cache
+from .reranking import cross_encoder_cache, get_cross_encoder
+from .semantic_search import query_embedding_cache
+from .search_utils import (
+    DEFAULT_ALPHA,
+    DEFAULT_SEARCH_LIMIT,
+    IMAGE_DECODE_WORKERS,
+    IMAGE_ENCODE_BATCH_SIZE,
+    RRF_K,
+    SEARCH_SERVER_HOST,
+    SEARCH_SERVER_PORT,
+    load_movies,
+)
+
+
+class SearchService:
+    """Keeps the indexes and models resident so each request only pays for the query"""
+
+    def __init__(self, documents: list[dict]) -> None:
+        self.hybrid = HybridSearch(documents)
+        self.multimodal = MultimodalSearch(documents)
+        # Every model is loaded before the first request, so no request pays
+        # for a load (or times out its semantic leg waiting on one).
+        self.hybrid.semantic_search.model
+        self.multimodal.model
+        get_cross_encoder()
+
+    def keyword(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        return {"query": query, "results": self.hybrid._bm25_search(query, limit)}
+
+    def semantic(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        results = self.hybrid.semantic_search.search_chunks(query, limit)
+        return {"query": query, "results": results}
+
+    def weighted(
+        self, query: str, alpha: float = DEFAULT_ALPHA, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> dict:
+        return weighted_search_command(query, alpha, limit, self.hybrid)
+
+    def rrf(
+        self,
+        query: str,
+        k: int = RRF_K,
+        enhance: Optional[str] = None,
+        rerank_method: Optional[str] = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> dict:
+        return rrf_search_command(query, k, enhance, rerank_method, limit, self.hybrid)
+
+    def rag(self, query: str, mode: str = "rag", limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+        match mode:
+            case "rag":
+                return rag(query, self.hybrid)
+            case "summarize":
+                return summarize(query, limit, self.hybrid)
+            case "citations":
+                return citations(query, limit, self.hybrid)
+            case "question":
+                return answer_question(query, limit, self.hybrid)
+            case _:
+                raise ValueError(f"unknown RAG mode: {mode}")
+
+    def image(self, image_path: str) -> dict:
+        return {"results": self.multimodal.search_with_image(image_path)}
+
+    def images(
+        self,
+        image_paths: list[str],
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        batch_size: int = IMAGE_ENCODE_BATCH_SIZE,
+        workers: int = IMAGE_DECODE_WORKERS,
+    ) -> dict:
+        results = self.multimodal.search_with_images(
+            image_paths, limit, batch_size, workers
+        )
+        return {"images": results}
+
+
+ENDPOINTS = {
+    "/keyword": SearchService.keyword,
+    "/semantic": SearchService.semantic,
+    "/weighted": SearchService.weighted,
+    "/rrf": SearchService.rrf,
+    "/rag": SearchService.rag,
+    "/image": SearchService.image,
+    "/images": SearchService.images,
+}
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    service: SearchService
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(
+                200,
+                {
+                    "status": "ok",
+                    "query_embedding_cache": query_embedding_cache.stats(),
+                    "llm_cache": llm_cache.stats(),
+                    "cross_encoder_cache": cross_encoder_cache.stats(),
+                    "image_embedding_cache": image_embedding_cache.stats(),
+                },
+            )
+        else:
+            self._send_json(404, {"error": f"unknown endpoint: {self.path}"})
+
+    def do_POST(self) -> None:
+        endpoint = ENDPOINTS.get(self.path)
+        if endpoint is None:
+            self._send_json(404, {"error": f"unknown endpoint: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            result = endpoint(self.service, **payload)
+        except (ValueError, TypeError, FileNotFoundError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status: int, body: Any) -> None:
+        data = json.dumps(body, default=_to_json).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def serve_command(host: str = SEARCH_SERVER_HOST, port: int = SEARCH_SERVER_PORT) -> None:
+    print("Loading indexes and models...")
+    SearchRequestHandler.service = SearchService(load_movies())
+    server = ThreadingHTTPServer((host, port), SearchRequestHandler)
+    print(f"Search server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,39 +1,239 @@
+import hashlib
+import itertools
 import json
 import os
-from typing import Any
+import re
+from typing import IO, TYPE_CHECKING, Any, Iterable, Iterator
+
+if TYPE_CHECKING:
+    import numpy as np
 
 DEFAULT_ALPHA = 0.5
 RRF_K = 60
 SEARCH_MULTIPLIER = 5
+HYBRID_LEG_TIMEOUT_SECONDS = 10.0
+HYBRID_SEARCH_WORKERS = 8
 
 DEFAULT_SEARCH_LIMIT = 5
+SEARCH_MANY_BATCH_SIZE = 256
 DOCUMENT_PREVIEW_LENGTH = 100
 SCORE_PRECISION = 3
 
 BM25_K1 = 1.5
 BM25_B = 0.75
+STEM_CACHE_SIZE = 100_000
+MAX_SCORE_EPSILON = 1e-9
+MAX_SCORE_BLOCK_SIZE = 4096
+INDEX_MAX_SEGMENTS = 8
+INDEX_MAX_DELETED_RATIO = 0.25
+
+INGEST_BATCH_SIZE = 1024
+INGEST_MERGE_FANIN = 8
+INGEST_READ_SIZE = 1 << 16
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "movies.json")
 
 STOPWORDS_PATH = os.path.join(PROJECT_ROOT, "data", "stopwords.txt")
 GOLDEN_DATASET_PATH = os.path.join(PROJECT_ROOT, "data", "golden_dataset.json")
+EVALUATION_WORKERS = 4
+EVALUATION_LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+BENCHMARK_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+BENCHMARK_QUERIES = 100
+BENCHMARK_WARMUP_QUERIES = 5
+BENCHMARK_EMBEDDING_DIM = 384
+BENCHMARK_CHUNKS_PER_DOC = 3
+BENCHMARK_VOCABULARY_SIZE = 50_000
  
 CACHE_DIR = os.path.join(PROJECT_ROOT, "cache")
 
+SEARCH_SERVER_HOST = "127.0.0.1"
+SEARCH_SERVER_PORT = 8765
+SEARCH_SERVER_URL_ENV = "SEARCH_SERVER_URL"
+
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+QUERY_EMBEDDING_CACHE_DIR_ENV = "QUERY_EMBEDDING_CACHE_DIR"
+QUERY_EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DISK_CACHE_RESYNC_SECONDS = 60.0
+DISK_CACHE_EVICT_TO = 0.9
+
+LLM_CACHE_DIR = os.path.join(CACHE_DIR, "llm")
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_BYPASS_ENV = "LLM_CACHE_BYPASS"
+LLM_MAX_CONCURRENCY = 4
+LLM_REQUESTS_PER_SECOND = 1.0
+LLM_REQUEST_BURST = 4
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_SECONDS = 1.0
+LLM_MAX_BACKOFF_SECONDS = 30.0
+LLM_RETRY_STATUS_CODES = (429, 503)
+
+CROSS_ENCODER_BATCH_SIZE = 32
+CROSS_ENCODER_CACHE_SIZE = 10_000
+
+IMAGE_EXTENSIONS = (".bmp", ".gif", ".jpeg", ".jpg", ".png", ".webp")
+IMAGE_DECODE_WORKERS = 8
+IMAGE_ENCODE_BATCH_SIZE = 32
+IMAGE_EMBEDDING_CACHE_SIZE = 4096
+IMAGE_EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# CLIP ViT-B/32 sees a 224px center crop; bigger decodes are only resized down.
+CLIP_IMAGE_SIZE = 224
+
 DEFAULT_CHUNK_SIZE = 200
 DEFAULT_CHUNK_OVERLAP = 1
 DEFAULT_SEMANTIC_CHUNK_SIZE = 4
 
 MOVIE_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "movie_embeddings.npy")
+MOVIE_EMBEDDING_KEYS_PATH = os.path.join(CACHE_DIR, "movie_embedding_keys.json")
 CHUNK_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "chunk_embeddings.npy")
 CHUNK_METADATA_PATH = os.path.join(CACHE_DIR, "chunk_metadata.json")
+CHUNK_MOVIE_INDEX_PATH = os.path.join(CACHE_DIR, "chunk_movie_index.npy")
+CHUNK_ANN_INDEX_PATH = os.path.join(CACHE_DIR, "chunk_ivf_index.npz")
+CLIP_TEXT_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "clip_text_embeddings.npy")
+CLIP_TEXT_EMBEDDING_KEYS_PATH = os.path.join(CACHE_DIR, "clip_text_embedding_keys.json")
+CLIP_IMAGE_EMBEDDINGS_DIR = os.path.join(CACHE_DIR, "clip_image_embeddings")
+
+ANN_DEFAULT_N_PROBE = 8
+ANN_KMEANS_ITERATIONS = 10
+ANN_TRAINING_SAMPLE_PER_LIST = 64
+ANN_REPORT_PROBES = [1, 2, 4, 8, 16, 32]
+
+QUANTIZATION_MODES = ("float16", "int8")
+QUANTIZED_RESCORE_FACTOR = 4
+
+TRACE_FORMATS = ("json", "chrome")
 
 
-def load_movies() -> list[dict]:
-    with open(DATA_PATH, "r") as f:
+def load_movies(path: str = DATA_PATH) -> list[dict]:
+    if path.endswith(".jsonl"):
+        return list(iter_movies(path))
+    with open(path, "r") as f:
         data = json.load(f)
-    return data["movies"]
+    return data["movies"] if isinstance(data, dict) else data
+
+
+def iter_movies(path: str = DATA_PATH) -> Iterator[dict]:
+    """Yield a catalog's movies one at a time, never holding the whole file
+
+    `.jsonl` files hold one movie per line. Anything else is parsed
+    incrementally as JSON: either a list of movies or an object with a
+    "movies" list, like movies.json.
+    """
+    if not path.endswith(".jsonl"):
+        yield from iter_json_list(path, "movies")
+        return
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_list(path: str, key: str) -> Iterator[Any]:
+    """Yield the items of a JSON file's top-level list, or of its `key` list
+
+    The file is decoded incrementally, one item at a time.
+    """
+    with open(path, "r") as f:
+        yield from _JsonStream(f).items(key)
+
+
+class _JsonStream:
+    """Decodes JSON values one at a time from a file read in blocks"""
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f: IO[str]) -> None:
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def items(self, key: str) -> Iterator[Any]:
+        if self.peek() == "{":
+            self.pos += 1
+            while True:
+                if self.peek() == "}":
+                    raise ValueError(f"no {key!r} list in the file")
+                name = self.value()
+                self.expect(":")
+                if name == key:
+                    break
+                self.value()
+                if self.peek() == ",":
+                    self.pos += 1
+
+        self.expect("[")
+        if self.peek() == "]":
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                return
+            self.expect(",")
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or "" at the end of the file"""
+        while True:
+            self.pos = self._WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} in the file, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Usually a value cut off by the end of the block.
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the block may continue in the next.
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _fill(self) -> bool:
+        # Reading at least as much as is buffered keeps a value that spans
+        # many blocks from being re-parsed once per block.
+        block = self.f.read(max(INGEST_READ_SIZE, len(self.buffer) - self.pos))
+        if not block:
+            return False
+        self.buffer = self.buffer[self.pos :] + block
+        self.pos = 0
+        return True
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Consecutive lists of `size` items; the last one may be shorter"""
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def corpus_fingerprint(documents: Iterable[dict]) -> str:
+    """Hash of every document's content, used to detect stale caches"""
+    digest = hashlib.sha256()
+    update_fingerprint(digest, documents)
+    return digest.hexdigest()
+
+
+def update_fingerprint(digest: Any, documents: Iterable[dict]) -> None:
+    """Feed documents into a `corpus_fingerprint` hash, e.g. one batch at a time"""
+    for doc in documents:
+        digest.update(json.dumps(doc, sort_keys=True).encode("utf-8"))
+        digest.update(b"\n")
 
 
 def load_stopwords() -> list[str]:
@@ -85,4 +285,33 @@ def format_chunked_search_result(
         "document": document[:100],
         "score": round(score, SCORE_PRECISION),
         "metadata": metadata if metadata else {},
-    }
\ No newline at end of file
+    }
+
+
+def top_k_indices(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """Indices of the `k` highest scores, best first; ties keep the lower index."""
+    import numpy as np
+
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    # argpartition picks an arbitrary subset of the values tied at the cut, so
+    # take everything above it and then the lowest-index ties.
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[: k - len(above)]
+    candidates = np.concatenate([above, ties])
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB"""
+    # Unix only, and only needed by the commands that report memory.
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
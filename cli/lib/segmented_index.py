@@ -0,0 +1,629 @@
+import json
+import math
+import os
+import threading
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+
+from .keyword_search import InvertedIndex, get_tokenizer, merge_sections, tokenize_text
+from .search_utils import (
+    BM25_B,
+    BM25_K1,
+    CACHE_DIR,
+    DEFAULT_SEARCH_LIMIT,
+    INDEX_MAX_DELETED_RATIO,
+    INGEST_BATCH_SIZE,
+    INDEX_MAX_SEGMENTS,
+    corpus_fingerprint,
+    format_search_result,
+    load_movies,
+    top_k_indices,
+)
+
+SEGMENT_PREFIX = "index-segment-"
+
+
+class _Segment:
+    """One immutable index file plus the positions deleted from it since
+
+    `ordinals` place each position in catalog order across all segments and
+    increase with position; None means the position itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        index: InvertedIndex,
+        deleted: Optional[Iterable[int]] = None,
+        ordinals: Optional[Iterable[float]] = None,
+    ) -> None:
+        self.name = name
+        self.index = index
+        self.ordinals = None
+        if ordinals is not None:
+            self.ordinals = np.asarray(list(ordinals), dtype=np.float64)
+        self.deleted = np.unique(np.asarray(list(deleted or []), dtype=np.int64))
+        self.live = None
+        if len(self.deleted):
+            self.live = np.ones(index.doc_count, dtype=bool)
+            self.live[self.deleted] = False
+        self.live_count = index.doc_count - len(self.deleted)
+        self.doc_freqs = index.doc_freqs(self.live)
+
+    def live_positions(self) -> np.ndarray:
+        if self.live is None:
+            return np.arange(self.index.doc_count)
+        return np.flatnonzero(self.live)
+
+    def ordinals_at(self, positions: np.ndarray) -> np.ndarray:
+        if self.ordinals is None:
+            return np.asarray(positions, dtype=np.float64)
+        return self.ordinals[positions]
+
+    def max_ordinal(self) -> float:
+        if self.index.doc_count == 0:
+            return -1.0
+        return float(self.ordinals_at(np.array([self.index.doc_count - 1]))[0])
+
+    def with_deleted(self, positions: np.ndarray) -> "_Segment":
+        deleted = np.concatenate([self.deleted, positions])
+        return _Segment(self.name, self.index, deleted.tolist(), self.ordinals)
+
+    def with_ordinals(self, ordinals: np.ndarray) -> "_Segment":
+        return _Segment(self.name, self.index, self.deleted.tolist(), ordinals)
+
+
+class SegmentedIndex:
+    """BM25 index made of immutable segments, so updates skip a full rebuild
+
+    The base segment is the regular `index.bin`. Added or edited documents go
+    into a new small segment, and the copies they replace are only marked as
+    deleted, like deleted documents. Scores use the document count, average
+    length and document frequencies of the live documents across every
+    segment, and equal scores are ordered by each document's place in the
+    catalog, so results match an index built from scratch. That order is
+    carried over from the copy a document replaces, so it holds as long as
+    an update doesn't reorder existing documents; a rebuild restores it.
+    `merge` compacts the segments back into one, and runs on a background
+    thread once there are more than INDEX_MAX_SEGMENTS of them or too many
+    tombstones.
+    """
+
+    def __init__(self) -> None:
+        self.base_path = os.path.join(CACHE_DIR, "index.bin")
+        self.manifest_path = os.path.join(CACHE_DIR, "index_manifest.json")
+        self.corpus_fingerprint = None
+        self.next_segment = 1
+        self.doc_count = 0
+        self.avg_doc_length = 0.0
+        self.docmap = SegmentedDocuments(self)
+        # Segments and their scoring views are swapped together, so a search
+        # never mixes two generations of collection statistics.
+        self._state: tuple[list[_Segment], list[InvertedIndex]] = ([], [])
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+
+    @property
+    def segments(self) -> list[_Segment]:
+        return self._state[0]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path) or os.path.exists(self.base_path)
+
+    def build(
+        self,
+        documents: Optional[Iterable[dict]] = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+    ) -> None:
+        """Index every document into a single new base segment"""
+        base = InvertedIndex(self.base_path)
+        base.build(documents, batch_size)
+        base.save()
+        self.__reset(base)
+
+    def convert_legacy(self) -> None:
+        base = InvertedIndex(self.base_path)
+        base.convert_legacy()
+        base.save()
+        self.__reset(base)
+
+    def __reset(self, base: InvertedIndex) -> None:
+        with self._lock:
+            self.corpus_fingerprint = base.corpus_fingerprint
+            self.__set_segments([_Segment(os.path.basename(base.index_path), base)])
+            self.save()
+        self.__remove_unused_segments()
+
+    def load(self) -> None:
+        if not os.path.exists(self.manifest_path):
+            base = InvertedIndex(self.base_path)
+            base.load()
+            self.corpus_fingerprint = base.corpus_fingerprint
+            self.__set_segments([_Segment(os.path.basename(self.base_path), base)])
+            return
+
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        segments = []
+        for entry in manifest["segments"]:
+            index = InvertedIndex(os.path.join(CACHE_DIR, entry["name"]))
+            index.load()
+            if index.doc_count != entry["doc_count"]:
+                raise ValueError(f"{entry['name']} does not match the index manifest")
+            segments.append(
+                _Segment(entry["name"], index, entry["deleted"], entry.get("ordinals"))
+            )
+        self.corpus_fingerprint = manifest.get("corpus_fingerprint")
+        self.next_segment = manifest["next_segment"]
+        self.__set_segments(segments)
+
+    def save(self) -> None:
+        manifest = {
+            "segments": [
+                {
+                    "name": segment.name,
+                    "doc_count": segment.index.doc_count,
+                    "deleted": segment.deleted.tolist(),
+                    "ordinals": (
+                        None if segment.ordinals is None else segment.ordinals.tolist()
+                    ),
+                }
+                for segment in self.segments
+            ],
+            "next_segment": self.next_segment,
+            "corpus_fingerprint": self.corpus_fingerprint,
+        }
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_current(self, documents: list[dict]) -> bool:
+        """Whether the index was last synced with exactly these documents"""
+        return (
+            self.corpus_fingerprint is not None
+            and self.corpus_fingerprint == corpus_fingerprint(documents)
+        )
+
+    def add_documents(self, documents: list[dict]) -> None:
+        """Index new documents, replacing any live ones with the same ids"""
+        self.__update(documents, [])
+
+    def delete_documents(self, doc_ids: Iterable[int]) -> None:
+        self.__update([], list(doc_ids))
+
+    def apply(self, documents: list[dict]) -> dict:
+        """Sync the index with `documents`, re-indexing only what changed
+
+        Returns:
+            How many documents were added or updated, and how many deleted
+        """
+        stored = {}
+        for segment in self.segments:
+            positions = segment.live_positions()
+            doc_ids = segment.index.docmap.doc_ids[positions]
+            for doc_id, position in zip(doc_ids.tolist(), positions.tolist()):
+                stored[doc_id] = (segment, position)
+
+        changed = []
+        for doc in documents:
+            entry = stored.pop(doc["id"], None)
+            if entry is None or entry[0].index.docmap.document_at(entry[1]) != doc:
+                changed.append(doc)
+        deleted = list(stored)
+
+        self.__update(
+            changed,
+            deleted,
+            corpus_fingerprint(documents),
+            [doc["id"] for doc in documents],
+        )
+        return {"updated": len(changed), "deleted": len(deleted)}
+
+    def __update(
+        self,
+        documents: list[dict],
+        deleted_ids: list[int],
+        fingerprint: Optional[str] = None,
+        catalog: Optional[list[int]] = None,
+    ) -> None:
+        with self._lock:
+            if documents:
+                ordinals = self.__ordinals(documents, catalog)
+                order = np.argsort(ordinals, kind="stable")
+                documents = [documents[i] for i in order.tolist()]
+                ordinals = np.asarray(ordinals)[order]
+            doc_ids = [doc["id"] for doc in documents] + deleted_ids
+            segments = self.__tombstone(self.segments, doc_ids)
+            if documents:
+                name = f"{SEGMENT_PREFIX}{self.next_segment:06d}.bin"
+                self.next_segment += 1
+                index = InvertedIndex(os.path.join(CACHE_DIR, name))
+                index.build(documents)
+                index.save()
+                segments.append(_Segment(name, index, ordinals=ordinals))
+            self.corpus_fingerprint = fingerprint
+            self.__set_segments(segments)
+            self.save()
+
+        deleted = sum(len(segment.deleted) for segment in segments)
+        total = sum(segment.index.doc_count for segment in segments)
+        if len(segments) > INDEX_MAX_SEGMENTS or (
+            total and deleted / total > INDEX_MAX_DELETED_RATIO
+        ):
+            self.start_merge()
+
+    def __ordinals(
+        self, documents: list[dict], catalog: Optional[list[int]]
+    ) -> list[float]:
+        """Catalog-order sort keys for `documents` about to be (re)indexed
+
+        An edited document keeps the key of the copy it replaces. A new one
+        is placed between its neighbours in `catalog` (the ids of the whole
+        catalog, in order) or, without a catalog, after everything indexed.
+        """
+        if catalog is None:
+            top = max(
+                (segment.max_ordinal() for segment in self.segments), default=-1.0
+            )
+            ordinals = []
+            for doc in documents:
+                ordinal = self.__live_ordinal(doc["id"])
+                if ordinal is None:
+                    top += 1
+                    ordinal = top
+                ordinals.append(ordinal)
+            return ordinals
+
+        known = {}
+        for segment in self.segments:
+            positions = segment.live_positions()
+            doc_ids = segment.index.docmap.doc_ids[positions].tolist()
+            known.update(zip(doc_ids, segment.ordinals_at(positions).tolist()))
+        by_id = dict(zip(catalog, _fill_ordinals([known.get(i) for i in catalog])))
+        return [by_id[doc["id"]] for doc in documents]
+
+    def __live_ordinal(self, doc_id: int) -> Optional[float]:
+        for segment in reversed(self.segments):
+            position = segment.index.docmap.position(doc_id)
+            if position >= 0 and (segment.live is None or segment.live[position]):
+                return float(segment.ordinals_at(np.array([position]))[0])
+        return None
+
+    def __tombstone(self, segments: list[_Segment], doc_ids: list[int]) -> list[_Segment]:
+        if not doc_ids:
+            return list(segments)
+        result = []
+        for segment in segments:
+            positions = segment.index.docmap.positions(doc_ids)
+            positions = positions[positions >= 0]
+            if segment.live is not None:
+                positions = positions[segment.live[positions]]
+            result.append(segment.with_deleted(positions) if len(positions) else segment)
+        return result
+
+    def start_merge(self) -> threading.Thread:
+        """Merge on a background thread; searches keep using the old segments"""
+        with self._lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(
+                    target=self.merge, name="index-merge"
+                )
+                self._merge_thread.start()
+            return self._merge_thread
+
+    def merge(self) -> None:
+        """Compact every segment into one, dropping deleted documents"""
+        with self._merge_lock:
+            snapshot = self.segments
+            if len(snapshot) == 1 and snapshot[0].live is None:
+                return
+            sections, remaps = merge_sections(
+                [segment.index for segment in snapshot],
+                [segment.live for segment in snapshot],
+                [
+                    segment.ordinals_at(np.arange(segment.index.doc_count))
+                    for segment in snapshot
+                ],
+            )
+            # The merged documents are laid out in catalog order, so their
+            # positions become the ordinals.
+            merged_ordinals = np.sort(
+                np.concatenate(
+                    [
+                        segment.ordinals_at(segment.live_positions())
+                        for segment in snapshot
+                    ]
+                )
+            )
+            with self._lock:
+                name = f"{SEGMENT_PREFIX}{self.next_segment:06d}.bin"
+                self.next_segment += 1
+            merged = InvertedIndex.from_sections(sections, os.path.join(CACHE_DIR, name))
+            merged.save()
+            merged.load()
+
+            with self._lock:
+                current = self.segments
+                # Updates only tombstone segments (sharing their index) and
+                # append new ones, so the merged segments must still lead the
+                # list. Anything else, e.g. a rebuild or a reload while
+                # merging, makes the merge stale; its file is cleaned up below.
+                if len(current) >= len(snapshot) and all(
+                    now.index is then.index for now, then in zip(current, snapshot)
+                ):
+                    # Deletions that landed while merging carry over to the
+                    # merged segment; segments added meanwhile are kept after it.
+                    late = [
+                        remaps[i][np.setdiff1d(now.deleted, then.deleted)]
+                        for i, (now, then) in enumerate(zip(current, snapshot))
+                    ]
+                    merged_segment = _Segment(
+                        name, merged, np.concatenate(late).tolist()
+                    )
+                    later = [
+                        segment.with_ordinals(
+                            _renumber(
+                                segment.ordinals_at(np.arange(segment.index.doc_count)),
+                                merged_ordinals,
+                            )
+                        )
+                        for segment in current[len(snapshot) :]
+                    ]
+                    self.__set_segments([merged_segment] + later)
+                    self.save()
+        self.__remove_unused_segments()
+
+    def __set_segments(self, segments: list[_Segment]) -> None:
+        doc_count = sum(segment.live_count for segment in segments)
+        total_length = sum(
+            int(segment.index.doc_lengths[segment.live_positions()].sum(dtype=np.int64))
+            for segment in segments
+        )
+        avg_doc_length = total_length / doc_count if doc_count else 0.0
+
+        if len(segments) == 1 and segments[0].live is None:
+            views = [segments[0].index]
+        else:
+            views = []
+            for segment in segments:
+                keys = segment.index.term_keys()
+                doc_freqs = segment.doc_freqs.astype(np.int64)
+                for other in segments:
+                    other_keys = other.index.term_keys()
+                    if other is segment or len(keys) == 0 or len(other_keys) == 0:
+                        continue
+                    found = np.minimum(np.searchsorted(keys, other_keys), len(keys) - 1)
+                    match = keys[found] == other_keys
+                    doc_freqs[found[match]] += other.doc_freqs[match]
+                views.append(
+                    segment.index.with_collection_stats(
+                        doc_count, avg_doc_length, doc_freqs
+                    )
+                )
+
+        self._state = (segments, views)
+        self.doc_count = doc_count
+        self.avg_doc_length = avg_doc_length
+
+    def __remove_unused_segments(self) -> None:
+        used = {segment.name for segment in self.segments}
+        for name in os.listdir(CACHE_DIR):
+            if name.startswith(SEGMENT_PREFIX) and name not in used:
+                try:
+                    os.remove(os.path.join(CACHE_DIR, name))
+                except OSError:
+                    # Still mapped by a reader on platforms that lock it;
+                    # the next merge tries again.
+                    pass
+
+    def locate(self, doc_id: int) -> Optional[tuple[InvertedIndex, int]]:
+        """Scoring view and position of the live copy of `doc_id`, if any"""
+        segments, views = self._state
+        for segment, view in zip(reversed(segments), reversed(views)):
+            position = segment.index.docmap.position(doc_id)
+            if position >= 0 and (segment.live is None or segment.live[position]):
+                return view, position
+        return None
+
+    def __doc_freq(self, token: str) -> int:
+        doc_freq = 0
+        for segment in self.segments:
+            term_id = segment.index.term_id(token)
+            if term_id >= 0:
+                doc_freq += int(segment.doc_freqs[term_id])
+        return doc_freq
+
+    def get_documents(self, term: str) -> list[int]:
+        segments, views = self._state
+        doc_ids = []
+        for segment, view in zip(segments, views):
+            doc_ids.extend(view.get_documents(term, segment.live))
+        return sorted(doc_ids)
+
+    def get_tf(self, doc_id: int, term: str) -> int:
+        located = self.locate(doc_id)
+        if located is None:
+            _single_token(term)
+            return 0
+        return located[0].get_tf(doc_id, term)
+
+    def get_idf(self, term: str) -> float:
+        term_doc_count = self.__doc_freq(_single_token(term))
+        return math.log((self.doc_count + 1) / (term_doc_count + 1))
+
+    def get_bm25_idf(self, term: str) -> float:
+        term_doc_count = self.__doc_freq(_single_token(term))
+        doc_count = self.doc_count
+        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+
+    def get_bm25_tf(
+        self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
+    ) -> float:
+        located = self.locate(doc_id)
+        if located is None:
+            _single_token(term)
+            return 0.0
+        return located[0].get_bm25_tf(doc_id, term, k1, b)
+
+    def get_tf_idf(self, doc_id: int, term: str) -> float:
+        return self.get_tf(doc_id, term) * self.get_idf(term)
+
+    def bm25(self, doc_id: int, term: str) -> float:
+        located = self.locate(doc_id)
+        tf_component = 0.0 if located is None else located[0].get_bm25_tf(doc_id, term)
+        return tf_component * self.get_bm25_idf(term)
+
+    def bm25_search(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, prune: bool = False
+    ) -> list[dict]:
+        return self.search_many([query], limit, prune)[0]
+
+    def search_many(
+        self, queries: list[str], limit: int = DEFAULT_SEARCH_LIMIT, prune: bool = False
+    ) -> list[list[dict]]:
+        """`bm25_search` for a batch of queries, sharing tokens and term scores"""
+        segments, views = self._state
+        token_lists = get_tokenizer().tokenize_many(queries)
+        per_segment = [
+            view.top_matches_many(token_lists, limit, prune, segment.live)
+            for segment, view in zip(segments, views)
+        ]
+        return [
+            self.__merge_matches(
+                segments, views, [matches[q] for matches in per_segment], limit
+            )
+            for q in range(len(queries))
+        ]
+
+    def __merge_matches(
+        self,
+        segments: list[_Segment],
+        views: list[InvertedIndex],
+        matches: list[tuple[np.ndarray, np.ndarray]],
+        limit: int,
+    ) -> list[dict]:
+        owners = np.concatenate(
+            [np.full(len(positions), i) for i, (positions, _) in enumerate(matches)]
+        )
+        positions = np.concatenate([positions for positions, _ in matches])
+        scores = np.concatenate([scores for _, scores in matches])
+
+        # Within a segment ties are already in catalog order, since ordinals
+        # increase with position; across segments they are sorted into it.
+        ordinals = np.concatenate(
+            [
+                segment.ordinals_at(segment_positions)
+                for segment, (segment_positions, _) in zip(segments, matches)
+            ]
+        )
+        first = np.argsort(ordinals, kind="stable")
+        owners, positions, scores = owners[first], positions[first], scores[first]
+
+        results = []
+        for i in top_k_indices(scores, limit):
+            if scores[i] == -np.inf:
+                break
+            doc = views[owners[i]].docmap.document_at(positions[i])
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=float(scores[i]),
+                )
+            )
+        return results
+
+
+class SegmentedDocuments(Mapping):
+    """Live `doc_id -> document` view across every segment of an index"""
+
+    def __init__(self, index: SegmentedIndex) -> None:
+        self.index = index
+
+    def __getitem__(self, doc_id: Any) -> dict:
+        located = self.index.locate(doc_id)
+        if located is None:
+            raise KeyError(doc_id)
+        view, position = located
+        return view.docmap.document_at(position)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return self.index.locate(doc_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for segment in self.index.segments:
+            yield from segment.index.docmap.doc_ids[segment.live_positions()].tolist()
+
+    def __len__(self) -> int:
+        return self.index.doc_count
+
+
+def _fill_ordinals(known: list[Optional[float]]) -> list[float]:
+    """`known` with each run of Nones spread evenly between its neighbours"""
+    filled = list(known)
+    i = 0
+    while i < len(filled):
+        if filled[i] is not None:
+            i += 1
+            continue
+        j = i
+        while j < len(filled) and filled[j] is None:
+            j += 1
+        low = filled[i - 1] if i > 0 else None
+        high = filled[j] if j < len(filled) else None
+        step = 1.0
+        if low is None:
+            low = -1.0 if high is None else high - (j - i) - 1
+        elif high is not None:
+            step = (high - low) / (j - i + 1)
+        for k in range(i, j):
+            filled[k] = low + step * (k - i + 1)
+        i = j
+    return filled
+
+
+def _renumber(ordinals: np.ndarray, merged: np.ndarray) -> np.ndarray:
+    """`ordinals` moved onto the positions of the sorted `merged` ordinals
+
+    Values between two merged ordinals land between their positions, so the
+    relative order of everything is unchanged.
+    """
+    if len(merged) == 0:
+        return ordinals
+    renumbered = np.interp(ordinals, merged, np.arange(len(merged), dtype=np.float64))
+    below, above = ordinals < merged[0], ordinals > merged[-1]
+    renumbered[below] = ordinals[below] - merged[0]
+    renumbered[above] = ordinals[above] - merged[-1] + len(merged) - 1
+    return renumbered
+
+
+def _single_token(term: str) -> str:
+    tokens = tokenize_text(term)
+    if len(tokens) != 1:
+        raise ValueError("term must be a single token")
+    return tokens[0]
+
+
+def update_command() -> dict:
+    idx = SegmentedIndex()
+    idx.load()
+    return idx.apply(load_movies())
+
+
+def delete_command(doc_ids: list[int]) -> None:
+    idx = SegmentedIndex()
+    idx.load()
+    idx.delete_documents(doc_ids)
+
+
+def merge_command() -> int:
+    idx = SegmentedIndex()
+    idx.load()
+    idx.merge()
+    return len(idx.segments)
@@ -1,63 +1,267 @@
+import hashlib
 import json
 import os
 import re
+import shutil
+import threading
+from typing import Callable, Iterable, Optional
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+from . import tracing
+from .ann_index import IVFIndex, recall_report
+from .caching import DirectoryBudget, LRUCache, file_size
+from .quantization import load_or_quantize, remove_quantized, rescore
 from .search_utils import (
+    ANN_REPORT_PROBES,
+    CHUNK_ANN_INDEX_PATH,
     CHUNK_EMBEDDINGS_PATH,
     CHUNK_METADATA_PATH,
+    CHUNK_MOVIE_INDEX_PATH,
     DEFAULT_CHUNK_OVERLAP,
     DEFAULT_CHUNK_SIZE,
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_SEMANTIC_CHUNK_SIZE,
     DOCUMENT_PREVIEW_LENGTH,
+    INGEST_BATCH_SIZE,
+    INGEST_READ_SIZE,
     MOVIE_EMBEDDINGS_PATH,
+    MOVIE_EMBEDDING_KEYS_PATH,
+    QUERY_EMBEDDING_CACHE_DIR_ENV,
+    QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUANTIZED_RESCORE_FACTOR,
+    SEARCH_MANY_BATCH_SIZE,
+    SEARCH_MULTIPLIER,
+    batched,
     format_search_result,
+    iter_json_list,
     load_movies,
+    top_k_indices,
+)
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_sentence_transformer(model_name):
+    """Load a SentenceTransformer once per process and share it between searchers"""
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+
+            _models[model_name] = SentenceTransformer(model_name)
+    return _models[model_name]
+
+
+class QueryEmbeddingCache:
+    """Query embeddings keyed by model and whitespace-normalized text
+
+    An in-memory LRU sits in front of an optional directory of .npy files,
+    capped at `max_bytes`, which lets repeated queries skip the model across
+    processes too. `disk=False` keeps a lookup or store in memory.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = QUERY_EMBEDDING_CACHE_SIZE,
+        directory: Optional[str] = None,
+        max_bytes: int = QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    ) -> None:
+        self.memory = LRUCache(maxsize)
+        self.directory = directory
+        self.budget = None
+        if directory is not None:
+            self.budget = DirectoryBudget(directory, ".npy", max_bytes)
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def key(self, text: str, model_name: str) -> str:
+        return embedding_key(" ".join(text.split()), model_name)
+
+    def get(self, key: str, disk: bool = True) -> Optional[np.ndarray]:
+        embedding = self.memory.get(key)
+        if embedding is None and disk and self.directory is not None:
+            path = os.path.join(self.directory, f"{key}.npy")
+            try:
+                embedding = np.load(path)
+                # Marks the file as recently used for eviction.
+                os.utime(path)
+            except (OSError, ValueError, EOFError):
+                # Missing, or truncated by a crash: re-encode and overwrite.
+                return None
+            embedding.setflags(write=False)
+            with self._lock:
+                self.disk_hits += 1
+            self.memory.put(key, embedding)
+        return embedding
+
+    def put(self, key: str, embedding: np.ndarray, disk: bool = True) -> np.ndarray:
+        # Cached arrays are shared between callers, so nobody may mutate them.
+        embedding = np.array(embedding)
+        embedding.setflags(write=False)
+        self.memory.put(key, embedding)
+        if disk and self.directory is not None:
+            path = os.path.join(self.directory, f"{key}.npy")
+            replaced = file_size(path)
+            _save_array(path, embedding)
+            self.budget.added(path, replaced)
+        return embedding
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {**self.memory.stats(), "disk_hits": self.disk_hits}
+        if self.budget is not None:
+            stats["disk_bytes"] = self.budget.total_bytes()
+        return stats
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    directory=os.environ.get(QUERY_EMBEDDING_CACHE_DIR_ENV)
 )
 
 
 class SemanticSearch:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="all-MiniLM-L6-v2", quantization=None):
+        self.model_name = model_name
+        self._model = None
+        # With quantization set ("float16" or "int8") the full-precision
+        # embeddings stay memory-mapped on disk and are only read to rescore
+        # the shortlist picked from the compact in-memory copy.
+        self.quantization = quantization
+        self.quantized = None
         self.embeddings = None
         self.documents = None
         self.document_map = {}
 
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_sentence_transformer(self.model_name)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
     def generate_embedding(self, text):
         if not text or not text.strip():
             raise ValueError("cannot generate embedding for empty text")
-        return self.model.encode([text])[0]
-
-    def build_embeddings(self, documents):
+        with tracing.span("embed_query") as span:
+            key = query_embedding_cache.key(text, self.model_name)
+            embedding = query_embedding_cache.get(key)
+            span.set(cache_hit=embedding is not None)
+            if embedding is None:
+                embedding = query_embedding_cache.put(
+                    key, self.model.encode([" ".join(text.split())])[0]
+                )
+            return embedding
+
+    def generate_embeddings(self, texts):
+        """Embeddings of several texts; the uncached ones are encoded in one batch"""
+        keys = []
+        for text in texts:
+            if not text or not text.strip():
+                raise ValueError("cannot generate embedding for empty text")
+            keys.append(query_embedding_cache.key(text, self.model_name))
+        embeddings = [query_embedding_cache.get(key) for key in keys]
+
+        missing = {}
+        for text, key, embedding in zip(texts, keys, embeddings):
+            if embedding is None and key not in missing:
+                missing[key] = " ".join(text.split())
+        if missing:
+            with tracing.span("embed_queries", queries=len(keys), encoded=len(missing)):
+                encoded = self.model.encode(list(missing.values()))
+            fresh = {
+                key: query_embedding_cache.put(key, embedding)
+                for key, embedding in zip(missing, encoded)
+            }
+            embeddings = [
+                fresh[key] if embedding is None else embedding
+                for key, embedding in zip(keys, embeddings)
+            ]
+        return np.stack(embeddings)
+
+    def build_embeddings(self, documents, previous=None):
+        """Encode the documents and cache the vectors with their content keys
+
+        `previous` is the cached (keys, embeddings) pair. Rows whose key is
+        still present are copied over instead of being re-encoded.
+        """
         self.documents = documents
         self.document_map = {}
-        movie_strings = []
         for doc in documents:
             self.document_map[doc["id"]] = doc
-            movie_strings.append(f"{doc['title']}: {doc['description']}")
-        self.embeddings = self.model.encode(movie_strings, show_progress_bar=True)
 
-        os.makedirs(os.path.dirname(MOVIE_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(MOVIE_EMBEDDINGS_PATH, self.embeddings)
+        self.write_embeddings(documents, previous)
+        self.embeddings, self.quantized = self._prepare_embeddings(
+            MOVIE_EMBEDDINGS_PATH
+        )
         return self.embeddings
 
+    def write_embeddings(
+        self,
+        documents: Iterable[dict],
+        previous: Optional[tuple[list[str], np.ndarray]] = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+    ) -> list[str]:
+        """Encode the documents into the cache `batch_size` at a time
+
+        `documents` may be a stream; see `write_keyed_embeddings`. Returns the
+        content keys.
+        """
+        return write_keyed_embeddings(
+            lambda texts: self.model.encode(texts),
+            self.model_name,
+            (f"{doc['title']}: {doc['description']}" for doc in documents),
+            MOVIE_EMBEDDINGS_PATH,
+            MOVIE_EMBEDDING_KEYS_PATH,
+            previous,
+            batch_size,
+        )
+
+    def _prepare_embeddings(self, path, embeddings=None):
+        if self.quantization is None:
+            if embeddings is None:
+                embeddings = np.load(path)
+            return normalize_embeddings(embeddings), None
+        full_embeddings = np.load(path, mmap_mode="r")
+        return full_embeddings, load_or_quantize(path, self.quantization, full_embeddings)
+
+    def _rescored_top_k(self, quantized, full_embeddings, query_embedding, limit):
+        coarse = quantized.scores(query_embedding)
+        shortlist = np.sort(top_k_indices(coarse, limit * QUANTIZED_RESCORE_FACTOR))
+        exact = rescore(full_embeddings, shortlist, query_embedding)
+        best = top_k_indices(exact, limit)
+        return shortlist[best], exact[best]
+
     def load_or_create_embeddings(self, documents):
         self.documents = documents
         self.document_map = {}
         for doc in documents:
             self.document_map[doc["id"]] = doc
 
-        if os.path.exists(MOVIE_EMBEDDINGS_PATH):
-            self.embeddings = np.load(MOVIE_EMBEDDINGS_PATH)
-            if len(self.embeddings) == len(documents):
-                return self.embeddings
+        previous = self._read_embedding_cache()
+        if previous is None:
+            return self.build_embeddings(documents)
+
+        keys = [
+            embedding_key(f"{doc['title']}: {doc['description']}", self.model_name)
+            for doc in documents
+        ]
+        if previous[0] == keys:
+            self.embeddings, self.quantized = self._prepare_embeddings(
+                MOVIE_EMBEDDINGS_PATH
+            )
+            return self.embeddings
+        return self.build_embeddings(documents, previous)
 
-        return self.build_embeddings(documents)
+    def _read_embedding_cache(self) -> Optional[tuple[list[str], np.ndarray]]:
+        return read_keyed_embeddings(MOVIE_EMBEDDINGS_PATH, MOVIE_EMBEDDING_KEYS_PATH)
 
-    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+    def _check_loaded(self):
         if self.embeddings is None or self.embeddings.size == 0:
             raise ValueError(
                 "No embeddings loaded. Call `load_or_create_embeddings` first."
@@ -68,20 +272,56 @@ class SemanticSearch:
                 "No documents loaded. Call `load_or_create_embeddings` first."
             )
 
-        query_embedding = self.generate_embedding(query)
-
-        similarities = []
-        for i, doc_embedding in enumerate(self.embeddings):
-            similarity = cosine_similarity(query_embedding, doc_embedding)
-            similarities.append((similarity, self.documents[i]))
-
-        similarities.sort(key=lambda x: x[0], reverse=True)
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        self._check_loaded()
+
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        if self.quantized is None:
+            scores = self.embeddings @ query_embedding
+            best = top_k_indices(scores, limit)
+            best_scores = scores[best]
+        else:
+            best, best_scores = self._rescored_top_k(
+                self.quantized, self.embeddings, query_embedding, limit
+            )
+        return self._format_results(best, best_scores)
+
+    def search_many(self, queries, limit=DEFAULT_SEARCH_LIMIT):
+        """`search` for a batch of queries
+
+        The queries are encoded in one batch and, without quantization, scored
+        SEARCH_MANY_BATCH_SIZE at a time with a single matrix product. BLAS sums
+        a matrix product in a different order than `search`'s matrix-vector
+        one, so those scores can differ from it by float32 rounding (about
+        1e-7), which never shows at SCORE_PRECISION. Quantized scores match.
+        """
+        self._check_loaded()
+        if not queries:
+            return []
+
+        query_embeddings = normalize_embeddings(self.generate_embeddings(queries))
+        results = []
+        for start in range(0, len(query_embeddings), SEARCH_MANY_BATCH_SIZE):
+            block = query_embeddings[start : start + SEARCH_MANY_BATCH_SIZE]
+            if self.quantized is None:
+                for scores in block @ self.embeddings.T:
+                    best = top_k_indices(scores, limit)
+                    results.append(self._format_results(best, scores[best]))
+            else:
+                for query_embedding in block:
+                    best, best_scores = self._rescored_top_k(
+                        self.quantized, self.embeddings, query_embedding, limit
+                    )
+                    results.append(self._format_results(best, best_scores))
+        return results
 
+    def _format_results(self, best, best_scores):
         results = []
-        for score, doc in similarities[:limit]:
+        for i, score in zip(best, best_scores):
+            doc = self.documents[i]
             results.append(
                 {
-                    "score": score,
+                    "score": float(score),
                     "title": doc["title"],
                     "description": doc["description"],
                 }
@@ -90,6 +330,168 @@ class SemanticSearch:
         return results
 
 
+def embedding_key(text: str, model_name: str) -> str:
+    """Cache key for the embedding of `text`; changes with the text or the model"""
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def read_keyed_embeddings(
+    embeddings_path: str, keys_path: str
+) -> Optional[tuple[list[str], np.ndarray]]:
+    """A cached (keys, memory-mapped embeddings) pair, or None if unusable"""
+    if not os.path.exists(embeddings_path) or not os.path.exists(keys_path):
+        return None
+    with open(keys_path, "r") as f:
+        cached_keys = json.load(f)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    if len(embeddings) != len(cached_keys):
+        return None
+    return cached_keys, embeddings
+
+
+def write_keyed_embeddings(
+    encode: Callable[[list[str]], np.ndarray],
+    model_name: str,
+    texts: Iterable[str],
+    embeddings_path: str,
+    keys_path: str,
+    previous: Optional[tuple[list[str], np.ndarray]] = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> list[str]:
+    """Encode `texts` into a keyed embedding cache `batch_size` at a time
+
+    Each row is stored with a hash of its text and the model, and rows whose
+    key is in `previous` (from `read_keyed_embeddings`) are copied over
+    instead of being re-encoded. Each batch's vectors are appended to the
+    file as they are encoded, so neither the texts nor the matrix are held
+    for the whole corpus and `texts` may be a stream. Returns the keys.
+    """
+    old_rows = {}
+    if previous is not None:
+        old_keys, old_embeddings = previous
+        old_rows = {key: i for i, key in enumerate(old_keys)}
+
+    # The keys file is what marks the cache as valid, so it goes first on
+    # removal and last on write.
+    _remove(keys_path)
+    keys = []
+    writer = _RowWriter(embeddings_path)
+    for batch in batched(texts, batch_size):
+        batch_keys = [embedding_key(text, model_name) for text in batch]
+        stale = [i for i, key in enumerate(batch_keys) if key not in old_rows]
+        kept = [i for i, key in enumerate(batch_keys) if key in old_rows]
+        if stale:
+            encoded = encode([batch[i] for i in stale])
+            dim = encoded.shape[1]
+        else:
+            dim = old_embeddings.shape[1]
+        embeddings = np.empty((len(batch), dim), dtype=np.float32)
+        if kept:
+            embeddings[kept] = old_embeddings[[old_rows[batch_keys[i]] for i in kept]]
+        if stale:
+            embeddings[stale] = encoded
+        writer.append(embeddings)
+        keys.extend(batch_keys)
+
+    writer.close()
+    remove_quantized(embeddings_path)
+    _save_json(keys_path, keys)
+    return keys
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    # Written aside and swapped in, so searchers that memory-mapped the old
+    # file keep reading a complete array. The side file is per thread, since
+    # cache puts of the same key can race.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class _RowWriter:
+    """Appends float32 rows to a .npy file whose row count isn't known up front
+
+    Rows go to a raw side file; `close` writes the header for the final
+    shape, copies the rows after it and swaps the result in.
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.rows_path = f"{path}.rows.tmp"
+        self.rows = open(self.rows_path, "wb")
+        self.n_rows = 0
+        self.dim = 0
+
+    def append(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        rows = np.ascontiguousarray(rows, dtype=np.float32)
+        self.dim = rows.shape[1]
+        self.rows.write(rows.tobytes())
+        self.n_rows += len(rows)
+
+    def close(self) -> None:
+        self.rows.close()
+        header = {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+            "fortran_order": False,
+            "shape": (self.n_rows, self.dim),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f, open(self.rows_path, "rb") as rows:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(rows, f, INGEST_READ_SIZE)
+        os.remove(self.rows_path)
+        os.replace(tmp_path, self.path)
+
+
+def _chunk_metadata(chunk_movie_index: np.ndarray):
+    """The per-chunk metadata dicts, generated from the chunk movie index"""
+    # Chunks are written movie by movie, so the index is sorted.
+    movies, counts = np.unique(chunk_movie_index, return_counts=True)
+    for movie_idx, total in zip(movies.tolist(), counts.tolist()):
+        for chunk_idx in range(total):
+            yield {
+                "movie_idx": movie_idx,
+                "chunk_idx": chunk_idx,
+                "total_chunks": total,
+            }
+
+
+def _save_chunk_metadata(
+    path: str, chunk_movie_index: np.ndarray, movie_keys: list[str]
+) -> None:
+    # Streamed, since a dict per chunk for a whole catalog is far larger than
+    # the chunk movie index it is generated from. The keys go first so they
+    # can be read back without the chunks.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write('{\n  "movie_keys": [')
+        for i, key in enumerate(movie_keys):
+            f.write(("\n    " if i == 0 else ",\n    ") + json.dumps(key))
+        f.write(f'\n  ],\n  "total_chunks": {len(chunk_movie_index)},\n')
+        f.write('  "chunks": [')
+        for i, chunk in enumerate(_chunk_metadata(chunk_movie_index)):
+            f.write(("\n    " if i == 0 else ",\n    ") + json.dumps(chunk))
+        f.write("\n  ]\n}\n")
+    os.replace(tmp_path, path)
+
+
+def _save_json(path: str, data) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
 def cosine_similarity(vec1, vec2):
     dot_product = np.dot(vec1, vec2)
     norm1 = np.linalg.norm(vec1)
@@ -101,6 +503,14 @@ def cosine_similarity(vec1, vec2):
     return dot_product / (norm1 * norm2)
 
 
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """Scale vectors (or rows of a matrix) to unit length; zero vectors stay zero."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
 def verify_model():
     search_instance = SemanticSearch()
     print(f"Model loaded: {search_instance.model}")
@@ -133,8 +543,8 @@ def embed_query_text(query):
     print(f"Shape: {embedding.shape}")
 
 
-def semantic_search(query, limit=DEFAULT_SEARCH_LIMIT):
-    search_instance = SemanticSearch()
+def semantic_search(query, limit=DEFAULT_SEARCH_LIMIT, quantization=None):
+    search_instance = SemanticSearch(quantization=quantization)
     documents = load_movies()
     search_instance.load_or_create_embeddings(documents)
 
@@ -230,49 +640,162 @@ def semantic_chunk_text(
 
 
 class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
+    def __init__(
+        self, model_name: str = "all-MiniLM-L6-v2", quantization: Optional[str] = None
+    ) -> None:
+        super().__init__(model_name, quantization)
         self.chunk_embeddings = None
+        self.chunk_quantized = None
         self.chunk_metadata = None
-
-    def build_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
+        self.chunk_movie_index = None
+        self.chunk_movies = None
+        self.chunk_segment_starts = None
+        self.chunks_contiguous = True
+        self.ann_index = None
+
+    def _set_chunk_movie_index(self, chunk_movie_index: np.ndarray) -> None:
+        self.chunk_movie_index = np.ascontiguousarray(chunk_movie_index, dtype=np.int32)
+        self.chunk_movies, self.chunk_segment_starts = np.unique(
+            self.chunk_movie_index, return_index=True
+        )
+        self.chunks_contiguous = bool(
+            np.all(self.chunk_movie_index[1:] >= self.chunk_movie_index[:-1])
+        )
+
+    def _max_per_movie(self, chunk_scores: np.ndarray) -> np.ndarray:
+        # Chunks are written movie by movie, so each movie owns a contiguous
+        # run of rows and its best chunk is a single segment reduction.
+        # A 2-D array holds one query per row.
+        if self.chunks_contiguous:
+            return np.maximum.reduceat(chunk_scores, self.chunk_segment_starts, axis=-1)
+        positions = np.searchsorted(self.chunk_movies, self.chunk_movie_index)
+        movie_scores = np.full(
+            chunk_scores.shape[:-1] + (len(self.chunk_movies),),
+            -np.inf,
+            dtype=chunk_scores.dtype,
+        )
+        np.maximum.at(movie_scores, (..., positions), chunk_scores)
+        return movie_scores
+
+    def _chunk_key(self, doc: dict) -> str:
+        text = doc.get("description", "")
+        return embedding_key(
+            f"{DEFAULT_SEMANTIC_CHUNK_SIZE}:{DEFAULT_CHUNK_OVERLAP}:{text}",
+            self.model_name,
+        )
+
+    def build_chunk_embeddings(
+        self,
+        documents: list[dict],
+        previous: Optional[tuple[list[str], np.ndarray, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """Chunk and encode the documents, caching vectors per movie content key
+
+        `previous` is the cached (movie keys, chunk embeddings, chunk movie
+        index). Movies whose key is unchanged keep their chunk rows; only new
+        or edited movies are re-chunked and re-encoded.
+        """
         self.documents = documents
 
         self.document_map = {}
         for doc in documents:
             self.document_map[doc["id"]] = doc
 
-        all_chunks = []
-        chunk_metadata = []
-
-        for idx, doc in enumerate(documents):
-            text = doc.get("description", "")
-            if not text.strip():
-                continue
+        rebuild_ann = os.path.exists(CHUNK_ANN_INDEX_PATH)
+        chunk_movie_index = self.write_chunk_embeddings(documents, previous)
+
+        self.chunk_metadata = list(_chunk_metadata(chunk_movie_index))
+        self.chunk_embeddings, self.chunk_quantized = self._prepare_embeddings(
+            CHUNK_EMBEDDINGS_PATH
+        )
+        self._set_chunk_movie_index(chunk_movie_index)
+        self.ann_index = None
+        if rebuild_ann:
+            self.build_ann_index()
+        return self.chunk_embeddings
 
-            chunks = semantic_chunk(
-                text,
-                max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
-                overlap=DEFAULT_CHUNK_OVERLAP,
+    def write_chunk_embeddings(
+        self,
+        documents: Iterable[dict],
+        previous: Optional[tuple[list[str], np.ndarray, np.ndarray]] = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+    ) -> np.ndarray:
+        """Chunk and encode the documents into the cache `batch_size` at a time
+
+        Like `write_embeddings`, only one batch of chunks and vectors is held
+        at once, so `documents` may be a stream. The ANN index is removed,
+        since its rows would point at the wrong chunks. Returns the chunk
+        movie index.
+        """
+        cached_rows = {}
+        n_old = 0
+        if previous is not None:
+            old_keys, old_embeddings, old_movie_index = previous
+            order = np.argsort(old_movie_index, kind="stable")
+            bounds = np.searchsorted(
+                old_movie_index[order], np.arange(len(old_keys) + 1)
             )
-
-            for i, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                chunk_metadata.append(
-                    {"movie_idx": idx, "chunk_idx": i, "total_chunks": len(chunks)}
-                )
-
-        self.chunk_embeddings = self.model.encode(all_chunks, show_progress_bar=True)
-        self.chunk_metadata = chunk_metadata
-
-        os.makedirs(os.path.dirname(CHUNK_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(CHUNK_EMBEDDINGS_PATH, self.chunk_embeddings)
-        with open(CHUNK_METADATA_PATH, "w") as f:
-            json.dump(
-                {"chunks": chunk_metadata, "total_chunks": len(all_chunks)}, f, indent=2
+            for i, key in enumerate(old_keys):
+                cached_rows.setdefault(key, order[bounds[i] : bounds[i + 1]])
+            n_old = len(old_embeddings)
+
+        # The metadata carries the keys that validate the cache, so it goes
+        # first on removal and last on write.
+        _remove(CHUNK_METADATA_PATH)
+        _remove(CHUNK_ANN_INDEX_PATH)
+        keys = []
+        chunk_counts = []
+        writer = _RowWriter(CHUNK_EMBEDDINGS_PATH)
+        for batch in batched(documents, batch_size):
+            new_chunks = []
+            # Rows index into the old embeddings followed by this batch's
+            # newly encoded ones.
+            rows = []
+            for doc in batch:
+                key = self._chunk_key(doc)
+                if key in cached_rows:
+                    movie_rows = cached_rows[key]
+                else:
+                    text = doc.get("description", "")
+                    chunks = []
+                    if text.strip():
+                        chunks = semantic_chunk(
+                            text,
+                            max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
+                            overlap=DEFAULT_CHUNK_OVERLAP,
+                        )
+                    start = n_old + len(new_chunks)
+                    movie_rows = np.arange(start, start + len(chunks))
+                    new_chunks.extend(chunks)
+                keys.append(key)
+                rows.append(movie_rows)
+            chunk_counts.append(
+                np.array([len(movie_rows) for movie_rows in rows], dtype=np.int64)
             )
 
-        return self.chunk_embeddings
+            rows = np.concatenate(rows).astype(np.int64)
+            if len(rows) == 0:
+                continue
+            from_old = rows < n_old
+            if new_chunks:
+                encoded = self.model.encode(new_chunks)
+                dim = encoded.shape[1]
+            else:
+                dim = old_embeddings.shape[1]
+            embeddings = np.empty((len(rows), dim), dtype=np.float32)
+            if from_old.any():
+                embeddings[from_old] = old_embeddings[rows[from_old]]
+            if new_chunks:
+                embeddings[~from_old] = encoded[rows[~from_old] - n_old]
+            writer.append(embeddings)
+
+        writer.close()
+        counts = np.concatenate([np.zeros(0, dtype=np.int64)] + chunk_counts)
+        chunk_movie_index = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        _save_array(CHUNK_MOVIE_INDEX_PATH, chunk_movie_index)
+        remove_quantized(CHUNK_EMBEDDINGS_PATH)
+        _save_chunk_metadata(CHUNK_METADATA_PATH, chunk_movie_index, keys)
+        return chunk_movie_index
 
     def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
         self.documents = documents
@@ -280,51 +803,202 @@ class ChunkedSemanticSearch(SemanticSearch):
         for doc in documents:
             self.document_map[doc["id"]] = doc
 
-        if os.path.exists(CHUNK_EMBEDDINGS_PATH) and os.path.exists(
+        cache = self._read_chunk_cache()
+        if cache is None:
+            return self.build_chunk_embeddings(documents)
+        chunk_metadata, previous = cache
+
+        keys = [self._chunk_key(doc) for doc in documents]
+        if previous[0] != keys:
+            return self.build_chunk_embeddings(documents, previous)
+
+        self.chunk_embeddings, self.chunk_quantized = self._prepare_embeddings(
+            CHUNK_EMBEDDINGS_PATH
+        )
+        self.chunk_metadata = chunk_metadata
+        self._set_chunk_movie_index(previous[2])
+        self._load_ann_index()
+        return self.chunk_embeddings
+
+    def _read_chunk_cache(
+        self, with_metadata: bool = True
+    ) -> Optional[
+        tuple[Optional[list[dict]], tuple[list[str], np.ndarray, np.ndarray]]
+    ]:
+        """The cached chunk metadata and (movie keys, memory-mapped chunk
+        embeddings, chunk movie index), or None if the cache is unusable
+
+        Without `with_metadata` only the keys are streamed out of the
+        metadata file, skipping the per-chunk dicts that make up most of it.
+        """
+        if not os.path.exists(CHUNK_EMBEDDINGS_PATH) or not os.path.exists(
             CHUNK_METADATA_PATH
         ):
-            self.chunk_embeddings = np.load(CHUNK_EMBEDDINGS_PATH)
+            return None
+
+        chunk_metadata = None
+        # Caches written before movie keys were recorded can't be validated.
+        if with_metadata:
             with open(CHUNK_METADATA_PATH, "r") as f:
                 data = json.load(f)
-                self.chunk_metadata = data["chunks"]
-            return self.chunk_embeddings
-
-        return self.build_chunk_embeddings(documents)
-
-    def search_chunks(self, query: str, limit: int = 10) -> list[dict]:
-        if self.chunk_embeddings is None or self.chunk_metadata is None:
+            if "movie_keys" not in data:
+                return None
+            chunk_metadata, movie_keys = data["chunks"], data["movie_keys"]
+        else:
+            try:
+                movie_keys = list(iter_json_list(CHUNK_METADATA_PATH, "movie_keys"))
+            except ValueError:
+                return None
+
+        if os.path.exists(CHUNK_MOVIE_INDEX_PATH):
+            chunk_movie_index = np.load(CHUNK_MOVIE_INDEX_PATH)
+        elif chunk_metadata is not None:
+            chunk_movie_index = np.array(
+                [chunk["movie_idx"] for chunk in chunk_metadata], dtype=np.int32
+            )
+            _save_array(CHUNK_MOVIE_INDEX_PATH, chunk_movie_index)
+        else:
+            return None
+
+        embeddings = np.load(CHUNK_EMBEDDINGS_PATH, mmap_mode="r")
+        if len(embeddings) != len(chunk_movie_index):
+            return None
+        return chunk_metadata, (movie_keys, embeddings, chunk_movie_index)
+
+    def _load_ann_index(self) -> None:
+        self.ann_index = None
+        if os.path.exists(CHUNK_ANN_INDEX_PATH):
+            ann_index = IVFIndex.load(CHUNK_ANN_INDEX_PATH)
+            if ann_index.n_rows == len(self.chunk_embeddings):
+                self.ann_index = ann_index
+
+    def build_ann_index(self, n_lists: Optional[int] = None) -> IVFIndex:
+        if self.chunk_embeddings is None:
             raise ValueError(
                 "No chunk embeddings loaded. Call load_or_create_chunk_embeddings first."
             )
+        self.ann_index = IVFIndex.build(
+            normalize_embeddings(self.chunk_embeddings), n_lists
+        )
+        self.ann_index.save(CHUNK_ANN_INDEX_PATH)
+        return self.ann_index
+
+    def search_chunks(
+        self,
+        query: str,
+        limit: int = 10,
+        n_probe: Optional[int] = None,
+        exact: bool = False,
+    ) -> list[dict]:
+        self._check_chunks_loaded()
+        if len(self.chunk_embeddings) == 0:
+            return []
+
+        with tracing.span("semantic_search", limit=limit) as span:
+            query_embedding = normalize_embeddings(self.generate_embedding(query))
+            results = self._search_chunks_embedded(query_embedding, limit, n_probe, exact)
+            span.set(results=len(results))
+            return results
+
+    def search_chunks_many(
+        self,
+        queries: list[str],
+        limit: int = 10,
+        n_probe: Optional[int] = None,
+        exact: bool = False,
+    ) -> list[list[dict]]:
+        """`search_chunks` for a batch of queries
+
+        The queries are encoded in one batch. Exact full-precision scoring
+        handles SEARCH_MANY_BATCH_SIZE queries per matrix product; the ANN and
+        quantized paths pick a shortlist per query and score them one by one.
+        """
+        self._check_chunks_loaded()
+        if len(self.chunk_embeddings) == 0:
+            return [[] for _ in queries]
+        if not queries:
+            return []
+
+        query_embeddings = normalize_embeddings(self.generate_embeddings(queries))
+        if self.chunk_quantized is not None or (self.ann_index is not None and not exact):
+            return [
+                self._search_chunks_embedded(query_embedding, limit, n_probe, exact)
+                for query_embedding in query_embeddings
+            ]
 
-        query_embedding = self.generate_embedding(query)
+        results = []
+        for start in range(0, len(query_embeddings), SEARCH_MANY_BATCH_SIZE):
+            block = query_embeddings[start : start + SEARCH_MANY_BATCH_SIZE]
+            movie_scores = self._max_per_movie(block @ self.chunk_embeddings.T)
+            results.extend(self._chunk_results(scores, limit) for scores in movie_scores)
+        return results
 
-        chunk_scores = []
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            similarity = cosine_similarity(query_embedding, chunk_embedding)
-            chunk_scores.append(
-                {
-                    "chunk_idx": i,
-                    "movie_idx": self.chunk_metadata[i]["movie_idx"],
-                    "score": similarity,
-                }
+    def _check_chunks_loaded(self) -> None:
+        if self.chunk_embeddings is None or self.chunk_metadata is None:
+            raise ValueError(
+                "No chunk embeddings loaded. Call load_or_create_chunk_embeddings first."
             )
 
-        movie_scores = {}
-        for chunk_score in chunk_scores:
-            movie_idx = chunk_score["movie_idx"]
-            if (
-                movie_idx not in movie_scores
-                or chunk_score["score"] > movie_scores[movie_idx]
-            ):
-                movie_scores[movie_idx] = chunk_score["score"]
-
-        sorted_movies = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)
-
+    def _search_chunks_embedded(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        n_probe: Optional[int],
+        exact: bool,
+    ) -> list[dict]:
+        with tracing.span(
+            "chunk_scoring",
+            chunks=len(self.chunk_embeddings),
+            ann=self.ann_index is not None and not exact,
+            quantized=self.chunk_quantized is not None,
+        ):
+            chunk_scores = self._chunk_scores(query_embedding, limit, n_probe, exact)
+            return self._chunk_results(self._max_per_movie(chunk_scores), limit)
+
+    def _chunk_scores(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        n_probe: Optional[int],
+        exact: bool,
+    ) -> np.ndarray:
+        candidates = None
+        if self.ann_index is not None and not exact:
+            candidates = self._ann_candidates(query_embedding, limit, n_probe)
+            if candidates is not None:
+                tracing.annotate(candidates=len(candidates))
+        if self.chunk_quantized is not None:
+            chunk_scores = self._rescored_chunk_scores(query_embedding, candidates, limit)
+        elif candidates is None:
+            chunk_scores = self.chunk_embeddings @ query_embedding
+        else:
+            # Chunks outside the probed lists can't win their movie's max.
+            chunk_scores = np.full(len(self.chunk_embeddings), -np.inf, dtype=np.float32)
+            chunk_scores[candidates] = self.chunk_embeddings[candidates] @ query_embedding
+        return chunk_scores
+
+    def _ann_candidates(
+        self, query_embedding: np.ndarray, limit: int, n_probe: Optional[int]
+    ) -> Optional[np.ndarray]:
+        # `limit` counts movies, but the index returns chunk rows and a movie's
+        # chunks tend to share a list, so the probe widens until the rows
+        # cover `limit` distinct movies (or everything would be probed).
+        min_rows = limit * SEARCH_MULTIPLIER
+        while True:
+            candidates = self.ann_index.candidates(query_embedding, n_probe, min_rows)
+            if candidates is None:
+                return None
+            if len(np.unique(self.chunk_movie_index[candidates])) >= limit:
+                return candidates
+            min_rows = 2 * max(min_rows, len(candidates))
+
+    def _chunk_results(self, movie_scores: np.ndarray, limit: int) -> list[dict]:
         results = []
-        for movie_idx, score in sorted_movies[:limit]:
-            if movie_idx is None:
-                continue
+        for i in top_k_indices(movie_scores, limit):
+            movie_idx = self.chunk_movies[i]
+            score = float(movie_scores[i])
+            if score == -np.inf:
+                break
             doc = self.documents[movie_idx]
             results.append(
                 format_search_result(
@@ -337,6 +1011,25 @@ class ChunkedSemanticSearch(SemanticSearch):
 
         return results
 
+    def _rescored_chunk_scores(
+        self, query_embedding: np.ndarray, candidates: Optional[np.ndarray], limit: int
+    ) -> np.ndarray:
+        # Shortlist movies by their best compact-score chunk, then rescore every
+        # chunk of those movies at full precision so their max is exact.
+        coarse = np.full(len(self.chunk_quantized), -np.inf, dtype=np.float32)
+        if candidates is None:
+            coarse[:] = self.chunk_quantized.scores(query_embedding)
+        else:
+            coarse[candidates] = self.chunk_quantized.scores(query_embedding, candidates)
+        coarse_movies = self._max_per_movie(coarse)
+        shortlist = top_k_indices(coarse_movies, limit * QUANTIZED_RESCORE_FACTOR)
+        shortlist = shortlist[coarse_movies[shortlist] > -np.inf]
+
+        rows = np.flatnonzero(np.isin(self.chunk_movie_index, self.chunk_movies[shortlist]))
+        chunk_scores = np.full(len(self.chunk_quantized), -np.inf, dtype=np.float32)
+        chunk_scores[rows] = rescore(self.chunk_embeddings, rows, query_embedding)
+        return chunk_scores
+
 
 def embed_chunks_command() -> np.ndarray:
     movies = load_movies()
@@ -344,9 +1037,38 @@ def embed_chunks_command() -> np.ndarray:
     return searcher.load_or_create_chunk_embeddings(movies)
 
 
-def search_chunked_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+def search_chunked_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    n_probe: Optional[int] = None,
+    exact: bool = False,
+    quantization: Optional[str] = None,
+) -> dict:
+    movies = load_movies()
+    searcher = ChunkedSemanticSearch(quantization=quantization)
+    searcher.load_or_create_chunk_embeddings(movies)
+    results = searcher.search_chunks(query, limit, n_probe, exact)
+    return {"query": query, "results": results}
+
+
+def build_ann_command(n_lists: Optional[int] = None) -> IVFIndex:
     movies = load_movies()
     searcher = ChunkedSemanticSearch()
     searcher.load_or_create_chunk_embeddings(movies)
-    results = searcher.search_chunks(query, limit)
-    return {"query": query, "results": results}
\ No newline at end of file
+    return searcher.build_ann_index(n_lists)
+
+
+def ann_report_command(
+    n_queries: int = 100, k: int = 10, probes: Optional[list[int]] = None
+) -> list[dict]:
+    if not os.path.exists(CHUNK_ANN_INDEX_PATH):
+        raise ValueError("No ANN index found. Run `build_ann` first.")
+    embeddings = normalize_embeddings(np.load(CHUNK_EMBEDDINGS_PATH))
+    index = IVFIndex.load(CHUNK_ANN_INDEX_PATH)
+    # Perturbed chunk vectors stand in for real queries, so the report needs
+    # no model and exercises the same regions of the space as traffic does.
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    noise = rng.normal(scale=0.05, size=(len(rows), embeddings.shape[1]))
+    queries = normalize_embeddings(embeddings[rows] + noise)
+    return recall_report(index, embeddings, queries, k, probes or ANN_REPORT_PROBES)
\ No newline at end of file
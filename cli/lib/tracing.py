@@ -0,0 +1,193 @@
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from .search_utils import TRACE_FORMATS
+
+_enabled = False
+_spans: list[dict] = []
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_origin = time.perf_counter()
+
+
+class _NoopSpan:
+    """What `span` returns while tracing is off: every operation does nothing"""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed, named stage with attributes; spans opened inside it are children"""
+
+    def __init__(self, name: str, attributes: dict) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.id = next(_ids)
+        self.parent: Optional[Span] = None
+        self.start = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.perf_counter()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        record = {
+            "id": self.id,
+            "parent": self.parent.id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start - _origin,
+            "duration": end - self.start,
+            "thread": threading.get_ident(),
+            "attributes": self.attributes,
+        }
+        with _lock:
+            _spans.append(record)
+        return False
+
+
+def span(name: str, **attributes: Any):
+    """Context manager timing `name`; a shared no-op while tracing is off"""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator running each call of the function inside a span called `name`"""
+
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def annotate(**attributes: Any) -> None:
+    """Add attributes to the innermost open span, if tracing"""
+    if _enabled:
+        current = _current.get()
+        if current is not None:
+            current.set(**attributes)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap `fn` so spans it opens on a pool thread nest under the caller's span"""
+    if not _enabled:
+        return fn
+    parent = _current.get()
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def finished_spans() -> list[dict]:
+    with _lock:
+        return list(_spans)
+
+
+def start_trace(path: str, trace_format: str = "json") -> None:
+    """Record spans from now on and write them to `path` when the process exits"""
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"unknown trace format: {trace_format}")
+    enable()
+    atexit.register(write_trace, path, trace_format)
+
+
+def write_trace(path: str, trace_format: str = "json") -> None:
+    """Write the finished spans as a span tree ("json") or Chrome trace events
+
+    Chrome-format files open in chrome://tracing or https://ui.perfetto.dev.
+    """
+    spans = sorted(finished_spans(), key=lambda record: record["start"])
+    if trace_format == "chrome":
+        data = {
+            "traceEvents": [
+                {
+                    "name": record["name"],
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["duration"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": record["thread"],
+                    "args": record["attributes"],
+                }
+                for record in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+    elif trace_format == "json":
+        data = {"spans": _span_tree(spans)}
+    else:
+        raise ValueError(f"unknown trace format: {trace_format}")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, default=repr)
+    os.replace(tmp_path, path)
+
+
+def _span_tree(spans: list[dict]) -> list[dict]:
+    nodes = {
+        record["id"]: {
+            "name": record["name"],
+            "start_ms": record["start"] * 1000,
+            "duration_ms": record["duration"] * 1000,
+            "thread": record["thread"],
+            "attributes": record["attributes"],
+            "children": [],
+        }
+        for record in spans
+    }
+    roots = []
+    for record in spans:
+        parent = nodes.get(record["parent"])
+        (roots if parent is None else parent["children"]).append(nodes[record["id"]])
+    return roots
@@ -1,11 +1,27 @@
 import argparse
+import json
 import math
-from lib.multimodal_search import verify_image_embedding, image_search_command
+from lib.multimodal_search import (
+    batch_image_search_command,
+    image_search_command,
+    verify_image_embedding,
+)
+from lib.search_client import SearchClient, get_server_url
+from lib.search_utils import (
+    DEFAULT_SEARCH_LIMIT,
+    IMAGE_DECODE_WORKERS,
+    IMAGE_ENCODE_BATCH_SIZE,
+)
 
 
 
 def main(rag_summarize=None):
     parser = argparse.ArgumentParser(description="Semantic Search CLI")
+    parser.add_argument(
+        "--server",
+        type=str,
+        help="URL of a running search server (defaults to $SEARCH_SERVER_URL)",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     verify_image_embedding_parser = subparsers.add_parser(
@@ -20,16 +36,67 @@ def main(rag_summarize=None):
 
     image_search_embedding_parser.add_argument("image_path", type=str, help="Path to the image to initiate search")
 
+    batch_image_search_parser = subparsers.add_parser(
+        "batch_image_search", help="Search with every image in files or directories"
+    )
+    batch_image_search_parser.add_argument(
+        "image_paths", type=str, nargs="+", help="Image files or directories of images"
+    )
+    batch_image_search_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Matches per image"
+    )
+    batch_image_search_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=IMAGE_ENCODE_BATCH_SIZE,
+        help="Images per CLIP forward pass",
+    )
+    batch_image_search_parser.add_argument(
+        "--workers",
+        type=int,
+        default=IMAGE_DECODE_WORKERS,
+        help="Threads reading and decoding images",
+    )
+    batch_image_search_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the matches as JSON instead of text",
+    )
+
     args = parser.parse_args()
     match args.command:
         case "verify_image_embedding":
             verify_image_embedding(args.image_path)
         case "image_search":
-            result = image_search_command(args.image_path)
+            server_url = get_server_url(args.server)
+            if server_url:
+                result = SearchClient(server_url).image(args.image_path)["results"]
+            else:
+                result = image_search_command(args.image_path)
             for i, r in enumerate(result, 1):
                 print(f"{i}. {r['title']} (similarity: {math.floor(r['score'] * 10 ** 3) / 10**3})")
                 print(f"   {r['description'][:100]} ...")
                 print()
+        case "batch_image_search":
+            server_url = get_server_url(args.server)
+            if server_url:
+                batch = SearchClient(server_url).images(
+                    args.image_paths, args.limit, args.batch_size, args.workers
+                )["images"]
+            else:
+                batch = batch_image_search_command(
+                    args.image_paths, args.limit, args.batch_size, args.workers
+                )
+            if args.json:
+                print(json.dumps(batch, indent=2))
+                return
+            for entry in batch:
+                print(entry["image"])
+                if "error" in entry:
+                    print(f"  failed: {entry['error']}")
+                    continue
+                for i, r in enumerate(entry["results"], 1):
+                    print(f"  {i}. {r['title']} (similarity: {r['score']:.3f})")
         case _:
             parser.print_help()
 
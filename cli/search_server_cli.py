@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from lib.search_server import serve_command
+from lib.search_utils import SEARCH_SERVER_HOST, SEARCH_SERVER_PORT
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Server CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Load indexes and models once and serve queries over HTTP"
+    )
+    serve_parser.add_argument(
+        "--host",
+        type=str,
+        default=SEARCH_SERVER_HOST,
+        help=f"Address to bind (default={SEARCH_SERVER_HOST})",
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        default=SEARCH_SERVER_PORT,
+        help=f"Port to listen on (default={SEARCH_SERVER_PORT})",
+    )
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "serve":
+            serve_command(args.host, args.port)
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,10 @@
 
 import argparse
 
+from lib.search_utils import QUANTIZATION_MODES
 from lib.semantic_search import (
+    ann_report_command,
+    build_ann_command,
     chunk_text,
     embed_chunks_command,
     embed_query_text,
@@ -42,6 +45,12 @@ def main() -> None:
     search_parser.add_argument(
         "--limit", type=int, default=5, help="Number of results to return"
     )
+    search_parser.add_argument(
+        "--quantization",
+        type=str,
+        choices=QUANTIZATION_MODES,
+        help="Search a compact copy of the embeddings and rescore the shortlist",
+    )
 
     chunk_parser = subparsers.add_parser(
         "chunk", help="Split text into fixed-size chunks with optional overlap"
@@ -85,6 +94,40 @@ def main() -> None:
     search_chunked_parser.add_argument(
         "--limit", type=int, default=5, help="Number of results to return"
     )
+    search_chunked_parser.add_argument(
+        "--n-probe",
+        type=int,
+        help="Number of ANN lists to probe (uses the ANN index when it exists)",
+    )
+    search_chunked_parser.add_argument(
+        "--exact", action="store_true", help="Ignore the ANN index and scan every chunk"
+    )
+    search_chunked_parser.add_argument(
+        "--quantization",
+        type=str,
+        choices=QUANTIZATION_MODES,
+        help="Search a compact copy of the embeddings and rescore the shortlist",
+    )
+
+    build_ann_parser = subparsers.add_parser(
+        "build_ann", help="Build an IVF approximate nearest-neighbour chunk index"
+    )
+    build_ann_parser.add_argument(
+        "--lists", type=int, help="Number of k-means lists (default=sqrt(chunks))"
+    )
+
+    ann_report_parser = subparsers.add_parser(
+        "ann_report", help="Report ANN recall and latency against exhaustive search"
+    )
+    ann_report_parser.add_argument(
+        "--queries", type=int, default=100, help="Number of sample queries"
+    )
+    ann_report_parser.add_argument(
+        "-k", type=int, default=10, help="Number of neighbours to compare"
+    )
+    ann_report_parser.add_argument(
+        "--probes", type=int, nargs="+", help="n_probe values to evaluate"
+    )
 
     args = parser.parse_args()
 
@@ -98,7 +141,7 @@ def main() -> None:
         case "embedquery":
             embed_query_text(args.query)
         case "search":
-            semantic_search(args.query, args.limit)
+            semantic_search(args.query, args.limit, args.quantization)
         case "chunk":
             chunk_text(args.text, args.chunk_size, args.overlap)
         case "semantic_chunk":
@@ -107,12 +150,25 @@ def main() -> None:
             embeddings = embed_chunks_command()
             print(f"Generated {len(embeddings)} chunked embeddings")
         case "search_chunked":
-            result = search_chunked_command(args.query, args.limit)
+            result = search_chunked_command(
+                args.query, args.limit, args.n_probe, args.exact, args.quantization
+            )
             print(f"Query: {result['query']}")
             print("Results:")
             for i, res in enumerate(result["results"], 1):
                 print(f"\n{i}. {res['title']} (score: {res['score']:.4f})")
                 print(f"   {res['document']}...")
+        case "build_ann":
+            index = build_ann_command(args.lists)
+            print(f"Built ANN index with {index.n_lists} lists over {index.n_rows} chunks")
+        case "ann_report":
+            report = ann_report_command(args.queries, args.k, args.probes)
+            print(f"Recall@{args.k} vs exhaustive search ({args.queries} queries):")
+            for row in report:
+                print(
+                    f"  n_probe={row['n_probe']:>4}  recall={row['recall']:.3f}  "
+                    f"latency={row['latency_ms']:.3f} ms"
+                )
         case _:
             parser.print_help()
 
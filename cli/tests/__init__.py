@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The CLI scripts import the package as `lib`, so the tests do too.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
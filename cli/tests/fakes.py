@@ -0,0 +1,100 @@
+"""Stand-ins for the models and the Gemini client, so tests run offline"""
+
+import hashlib
+import time
+
+import numpy as np
+
+from lib.semantic_search import ChunkedSemanticSearch
+
+
+class FakeModel:
+    """Deterministic unit vectors derived from a hash of each text"""
+
+    def __init__(self, dimensions: int = 16) -> None:
+        self.dimensions = dimensions
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        rows = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            rows.append(np.random.default_rng(seed).standard_normal(self.dimensions))
+        embeddings = np.asarray(rows, dtype=np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def slow_loader(seconds: float, model=None):
+    """A `get_sentence_transformer` replacement that takes `seconds` to load"""
+    loaded = {}
+
+    def load(model_name):
+        if model_name not in loaded:
+            time.sleep(seconds)
+            loaded[model_name] = model or FakeModel()
+        return loaded[model_name]
+
+    return load
+
+
+def make_documents(n: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(200)]
+    return [
+        {
+            "id": i + 1,
+            "title": f"Movie {i + 1}",
+            "description": " ".join(rng.choice(words, size=int(rng.integers(5, 40)))),
+        }
+        for i in range(n)
+    ]
+
+
+def chunked_search(
+    documents: list[dict], chunks_per_movie: int = 3, seed: int = 0, model=None
+) -> ChunkedSemanticSearch:
+    """An in-memory chunked searcher over random chunk vectors"""
+    rng = np.random.default_rng(seed)
+    searcher = ChunkedSemanticSearch()
+    if model is not None:
+        searcher.model = model
+    searcher.documents = documents
+    searcher.document_map = {doc["id"]: doc for doc in documents}
+    movie_index = np.repeat(np.arange(len(documents)), chunks_per_movie)
+    embeddings = rng.standard_normal((len(movie_index), 16)).astype(np.float32)
+    searcher.chunk_embeddings = embeddings / np.linalg.norm(
+        embeddings, axis=1, keepdims=True
+    )
+    searcher.chunk_metadata = [
+        {"movie_idx": int(i), "chunk_idx": j % chunks_per_movie}
+        for j, i in enumerate(movie_index)
+    ]
+    searcher._set_chunk_movie_index(movie_index)
+    return searcher
+
+
+
+class FakeAPIError(Exception):
+    """Mimics google.genai's APIError, which carries the HTTP status as `code`"""
+
+    def __init__(self, code: int) -> None:
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeClient:
+    """Gemini client stand-in; `respond(contents)` returns text or raises"""
+
+    def __init__(self, respond) -> None:
+        self.models = self
+        self.respond = respond
+        self.calls = []
+
+    def generate_content(self, model, contents, config=None) -> FakeResponse:
+        self.calls.append(contents)
+        return FakeResponse(self.respond(contents))
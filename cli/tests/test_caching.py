@@ -0,0 +1,73 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from lib import caching
+from lib.caching import DiskCache
+
+
+def directory_bytes(directory: str) -> int:
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".json")]
+    return sum(entry.stat().st_size for entry in entries)
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.value = "x" * 100
+
+    def test_size_stays_under_the_cap(self):
+        cache = DiskCache(self.directory, 3600, 2000)
+        for i in range(200):
+            cache.put(f"key{i}", self.value)
+            self.assertLessEqual(directory_bytes(self.directory), 2000)
+        self.assertEqual(cache.budget.total_bytes(), directory_bytes(self.directory))
+
+    def test_directory_is_only_listed_when_over_the_cap(self):
+        cache = DiskCache(self.directory, 3600, 20000)
+        for i in range(100):
+            cache.put(f"key{i}", self.value)
+        # One scan to learn the size of what is already there, and one each
+        # time the cap is crossed.
+        self.assertLess(cache.budget.scans, 10)
+        self.assertLessEqual(directory_bytes(self.directory), 20000)
+
+    def test_overwrite_and_expiry_keep_the_total_exact(self):
+        cache = DiskCache(self.directory, 3600, 20000)
+        cache.put("a", self.value)
+        cache.put("a", self.value * 2)
+        cache.put("b", self.value)
+        with mock.patch.object(caching.time, "time", return_value=time.time() + 7200):
+            self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.budget.total_bytes(), directory_bytes(self.directory))
+
+    def test_least_recently_read_entries_are_evicted_first(self):
+        cache = DiskCache(self.directory, 3600, 1500)
+        for i in range(10):
+            cache.put(f"key{i}", self.value)
+            # Distinct, increasing mtimes whatever the file system resolution.
+            os.utime(cache._path(f"key{i}"), (1000 + i, 1000 + i))
+        cache.get("key0")
+
+        for i in range(10, 13):
+            cache.put(f"key{i}", self.value)
+
+        self.assertEqual(cache.get("key0"), self.value)
+        self.assertIsNone(cache.get("key1"))
+
+    def test_resyncs_after_another_process_writes(self):
+        cache = DiskCache(self.directory, 3600, 20000)
+        cache.put("a", self.value)
+        other = DiskCache(self.directory, 3600, 20000)
+        other.put("b", self.value)
+        with mock.patch.object(caching, "DISK_CACHE_RESYNC_SECONDS", 0):
+            cache.put("c", self.value)
+        self.assertEqual(cache.budget.total_bytes(), directory_bytes(self.directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
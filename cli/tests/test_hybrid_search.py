@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from lib import segmented_index, semantic_search
+from lib.hybrid_search import HybridSearch
+from lib.search_utils import format_search_result
+
+from .fakes import chunked_search, make_documents, slow_loader
+
+
+class FakeIndex:
+    def __init__(self, documents: list[dict]) -> None:
+        self.documents = documents
+
+    def bm25_search(self, query: str, limit: int, prune: bool = False) -> list[dict]:
+        return [
+            format_search_result(doc["id"], doc["title"], doc["description"], 1.0)
+            for doc in self.documents[:limit]
+        ]
+
+
+class RetrieveTest(unittest.TestCase):
+    def test_model_load_is_not_charged_to_the_semantic_leg(self):
+        documents = make_documents(20)
+        # The load takes longer than the whole leg timeout.
+        with mock.patch.object(
+            semantic_search, "get_sentence_transformer", slow_loader(0.5)
+        ):
+            searcher = HybridSearch.from_components(
+                documents, chunked_search(documents), FakeIndex(documents), 0.2
+            )
+            bm25_results, semantic_results = searcher._retrieve("w1 w2", 5)
+
+        self.assertEqual(len(bm25_results), 5)
+        self.assertEqual(len(semantic_results), 5)
+
+    def test_failed_leg_falls_back_to_the_other(self):
+        documents = make_documents(20)
+        searcher = HybridSearch.from_components(
+            documents, chunked_search(documents), FakeIndex(documents), 0.2
+        )
+        searcher.semantic_search.model = mock.Mock(encode=mock.Mock(side_effect=OSError))
+
+        with mock.patch("sys.stderr"):
+            bm25_results, semantic_results = searcher._retrieve("a query never cached", 5)
+
+        self.assertEqual(len(bm25_results), 5)
+        self.assertEqual(semantic_results, [])
+
+    def test_hung_leg_holds_one_thread(self):
+        documents = make_documents(20)
+        release = threading.Event()
+        calls = []
+
+        class HungSemanticSearch:
+            model = None
+
+            def search_chunks(self, query, limit):
+                calls.append(query)
+                release.wait(10)
+                return FakeIndex(documents).bm25_search(query, limit)
+
+        searcher = HybridSearch.from_components(
+            documents, HungSemanticSearch(), FakeIndex(documents), 0.1
+        )
+        with mock.patch("sys.stderr"):
+            for i in range(4):
+                bm25_results, semantic_results = searcher._retrieve(f"q{i}", 5)
+                self.assertEqual(len(bm25_results), 5)
+                self.assertEqual(semantic_results, [])
+            # Only the first query's leg was ever submitted.
+            self.assertEqual(calls, ["q0"])
+
+            release.set()
+            searcher._overdue["semantic"].result(10)
+            _, semantic_results = searcher._retrieve("q4", 5)
+
+        self.assertEqual(len(semantic_results), 5)
+        self.assertEqual(calls, ["q0", "q4"])
+
+
+class OpenIndexTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        patcher = mock.patch.object(segmented_index, "CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_segment_file_triggers_a_rebuild(self):
+        documents = make_documents(20)
+        searcher = HybridSearch.from_components(documents, None, None)
+        searcher._open_index()
+        # A manifest naming a segment file that is gone, e.g. deleted by hand.
+        segment = {"name": "index-segment-000009.bin", "doc_count": 20, "deleted": []}
+        with open(os.path.join(self.cache_dir, "index_manifest.json"), "w") as f:
+            json.dump({"segments": [segment], "next_segment": 10}, f)
+
+        idx = searcher._open_index()
+
+        self.assertEqual(idx.doc_count, 20)
+        self.assertEqual(len(idx.bm25_search("w1", 5)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
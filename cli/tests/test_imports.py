@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous enough for a slow CI machine; a CLI that imports torch or the
+# Gemini SDK at startup takes seconds.
+IMPORT_BUDGET_SECONDS = 1.0
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "google.genai", "PIL"]
+
+# CLIs whose commands mostly never search, so they shouldn't pay for numpy.
+LIGHT_CLIS = ["augmented_generation_cli", "describe_image_cli", "hybrid_search_cli"]
+
+CLIS = LIGHT_CLIS + [
+    "benchmark_cli",
+    "evaluation_cli",
+    "ingest_cli",
+    "keyword_search_cli",
+    "multimodal_search_cli",
+    "search_server_cli",
+    "semantic_search_cli",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def import_cli(module: str) -> dict:
+    """Import a CLI module in a fresh interpreter; its import time and modules"""
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=CLI_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_clis_import_within_budget_without_heavy_modules(self):
+        for module in CLIS:
+            with self.subTest(module=module):
+                report = import_cli(module)
+                loaded = set(report["modules"])
+                self.assertEqual([m for m in HEAVY_MODULES if m in loaded], [])
+                if module in LIGHT_CLIS:
+                    self.assertNotIn("numpy", loaded)
+                self.assertLess(report["seconds"], IMPORT_BUDGET_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
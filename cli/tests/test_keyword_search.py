@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from lib import keyword_search, tracing
+from lib.keyword_search import InvertedIndex, tokenize_text
+
+VOCABULARY = [f"w{i}x" for i in range(2000)]
+
+
+def zipf_corpus(n: int, seed: int = 0) -> list[dict]:
+    """Documents whose word frequencies fall off like natural text"""
+    rng = np.random.default_rng(seed)
+    p = 1 / np.arange(1, len(VOCABULARY) + 1) ** 1.05
+    p /= p.sum()
+    documents = []
+    for i in range(n):
+        words = rng.choice(len(VOCABULARY), size=int(rng.integers(20, 80)), p=p)
+        documents.append(
+            {
+                "id": i + 1,
+                "title": VOCABULARY[words[0]],
+                "description": " ".join(VOCABULARY[w] for w in words),
+            }
+        )
+    return documents
+
+
+class MaxScoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.idx = InvertedIndex(index_path="unused")
+        cls.idx.build(zipf_corpus(3000))
+        rng = np.random.default_rng(1)
+        # Two common words and two rarer ones, like most real queries.
+        cls.queries = []
+        for _ in range(30):
+            words = [*rng.integers(0, 20, 2), *rng.integers(50, 500, 2)]
+            cls.queries.append(tokenize_text(" ".join(VOCABULARY[w] for w in words)))
+
+    def setUp(self):
+        # Small blocks, so a corpus this size is pruned like a large one.
+        patcher = mock.patch.object(keyword_search, "MAX_SCORE_BLOCK_SIZE", 128)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pruned_results_match_exhaustive(self):
+        live = np.random.default_rng(2).random(self.idx.doc_count) > 0.2
+        for tokens in self.queries:
+            for limit in (1, 10, 100):
+                for mask in (None, live):
+                    exhaustive = self.idx.top_matches(tokens, limit, False, mask)
+                    pruned = self.idx.top_matches(tokens, limit, True, mask)
+                    np.testing.assert_array_equal(pruned[0], exhaustive[0])
+                    np.testing.assert_array_equal(pruned[1], exhaustive[1])
+
+    def test_non_essential_postings_are_skipped(self):
+        postings = postings_scored = 0
+        with mock.patch.object(tracing, "_enabled", True):
+            for tokens in self.queries:
+                with tracing.span("query") as span:
+                    self.idx.top_matches(tokens, 10, prune=True)
+                postings += span.attributes["postings"]
+                postings_scored += span.attributes["postings_scored"]
+
+        self.assertLess(postings_scored, postings / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
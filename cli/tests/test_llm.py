@@ -0,0 +1,131 @@
+import threading
+import unittest
+from unittest import mock
+
+from lib import llm
+from lib.reranking import llm_rerank_individual
+from lib.search_utils import LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES
+
+from .fakes import FakeAPIError, FakeClient
+
+
+def failing(*codes: int, text: str = "ok"):
+    """Raise an error with each of `codes` in turn, then answer `text`"""
+    remaining = list(codes)
+
+    def respond(contents):
+        if remaining:
+            raise FakeAPIError(remaining.pop(0))
+        return text
+
+    return respond
+
+
+class LLMTestCase(unittest.TestCase):
+    def setUp(self):
+        previous = llm._client
+        self.addCleanup(llm.set_client, previous)
+        # No cache, no pacing, and no real sleeping between retries.
+        for patcher in [
+            mock.patch.object(llm, "_cache_bypassed", True),
+            mock.patch.object(llm.rate_limiter, "acquire", return_value=0.0),
+            mock.patch.object(llm.random, "uniform", side_effect=lambda a, b: b),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleeps = []
+        sleep = mock.patch.object(llm.time, "sleep", side_effect=self.sleeps.append)
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def use(self, respond) -> FakeClient:
+        client = FakeClient(respond)
+        llm.set_client(client)
+        return client
+
+
+class GenerateTest(LLMTestCase):
+    def test_retries_rate_limits_and_unavailable_then_succeeds(self):
+        client = self.use(failing(429, 503))
+
+        response = llm.generate("prompt")
+
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_backoff_is_capped(self):
+        self.use(failing(429, 429, 429, 429))
+
+        with mock.patch.object(llm, "LLM_MAX_BACKOFF_SECONDS", 3.0):
+            llm.generate("prompt")
+
+        self.assertEqual(self.sleeps, [1.0, 2.0, 3.0, 3.0])
+
+    def test_gives_up_after_max_retries(self):
+        client = self.use(failing(*[503] * (LLM_MAX_RETRIES + 1)))
+
+        with self.assertRaises(FakeAPIError):
+            llm.generate("prompt")
+        self.assertEqual(len(client.calls), LLM_MAX_RETRIES + 1)
+
+    def test_other_errors_are_not_retried(self):
+        client = self.use(failing(400))
+
+        with self.assertRaises(FakeAPIError):
+            llm.generate("prompt")
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(self.sleeps, [])
+
+
+class RerankIndividualTest(LLMTestCase):
+    documents = [
+        {"id": i, "title": f"Movie {i}", "document": f"plot {i}"} for i in range(8)
+    ]
+
+    def test_failed_item_does_not_fail_the_batch(self):
+        def respond(prompt):
+            if "Movie 3" in prompt:
+                raise FakeAPIError(400)
+            if "Movie 5" in prompt:
+                return "not a number"
+            return prompt.split("Movie ")[1][0]
+
+        self.use(respond)
+
+        results = llm_rerank_individual("query", self.documents, limit=8)
+
+        by_id = {result["id"]: result for result in results}
+        self.assertEqual(len(by_id), 8)
+        for i in (3, 5):
+            self.assertEqual(by_id[i]["individual_score"], 0)
+            self.assertIn("rerank_error", by_id[i])
+        for i in (0, 1, 2, 4, 6, 7):
+            self.assertEqual(by_id[i]["individual_score"], i)
+            self.assertNotIn("rerank_error", by_id[i])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        in_flight = 0
+        peak = 0
+
+        def respond(prompt):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            # time.sleep is patched out, so hold the call open with a wait.
+            threading.Event().wait(0.01)
+            with lock:
+                in_flight -= 1
+            return "5"
+
+        self.use(respond)
+        llm_rerank_individual("query", self.documents * 4, limit=5)
+
+        self.assertLessEqual(peak, LLM_MAX_CONCURRENCY)
+        self.assertGreater(peak, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
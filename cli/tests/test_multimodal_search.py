@@ -0,0 +1,143 @@
+import importlib.util
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from lib import multimodal_search
+from lib.multimodal_search import MultimodalSearch
+from lib.semantic_search import QueryEmbeddingCache
+
+from .fakes import FakeModel, make_documents
+
+
+class FakeImageModel:
+    def encode(self, images, **kwargs) -> np.ndarray:
+        return np.ones((len(images), 8), dtype=np.float32)
+
+
+class TextEmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name in ["CLIP_TEXT_EMBEDDINGS_PATH", "CLIP_TEXT_EMBEDDING_KEYS_PATH"]:
+            path = os.path.join(directory.name, name.lower())
+            patcher = mock.patch.object(multimodal_search, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.model = FakeModel()
+        self.encoded = []
+
+        def encode(texts, **kwargs):
+            self.encoded.extend(texts)
+            return FakeModel.encode(self.model, texts)
+
+        self.model.encode = encode
+
+    def embed(self, documents: list[dict]) -> np.ndarray:
+        searcher = MultimodalSearch()
+        searcher._model = self.model
+        return searcher.load_or_create_text_embeddings(documents)
+
+    def test_only_edited_movies_are_encoded(self):
+        documents = make_documents(30)
+        self.embed(documents)
+        self.assertEqual(len(self.encoded), 30)
+
+        edited = [dict(doc) for doc in documents]
+        edited[7]["description"] = "rewritten"
+        self.encoded.clear()
+        embeddings = self.embed(edited)
+        self.assertEqual(self.encoded, [f"{edited[7]['title']}: rewritten"])
+
+        self.encoded.clear()
+        np.testing.assert_array_equal(self.embed(edited), embeddings)
+        self.assertEqual(self.encoded, [])
+        np.testing.assert_allclose(
+            embeddings,
+            FakeModel().encode([f"{d['title']}: {d['description']}" for d in edited]),
+            rtol=1e-6,
+        )
+
+
+@unittest.skipUnless(importlib.util.find_spec("PIL"), "needs Pillow")
+class EmbedImageTest(unittest.TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = os.path.join(directory.name, "cache")
+        self.image_path = os.path.join(directory.name, "poster.png")
+        Image.new("RGB", (300, 400), (200, 30, 30)).save(self.image_path)
+
+        cache = QueryEmbeddingCache(16, self.cache_dir, max_bytes=1 << 20)
+        patcher = mock.patch.object(multimodal_search, "image_embedding_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.searcher = MultimodalSearch()
+        self.searcher._model = FakeImageModel()
+
+    def cached_files(self) -> list[str]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(".npy")]
+
+    def test_single_image_stays_in_memory_by_default(self):
+        self.searcher.embed_image(self.image_path)
+        self.assertEqual(self.cached_files(), [])
+
+    def test_single_image_persists_when_asked(self):
+        self.searcher.embed_image(self.image_path, persist=True)
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_batches_use_the_disk_tier(self):
+        embeddings, errors = self.searcher.embed_images([self.image_path])
+        self.assertEqual(errors, [None])
+        self.assertEqual(embeddings[0].shape, (8,))
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_concurrent_batches_share_files(self):
+        from PIL import Image
+
+        paths = []
+        for i in range(40):
+            paths.append(os.path.join(os.path.dirname(self.image_path), f"{i}.png"))
+            Image.new("RGB", (64, 64), (i, 0, 0)).save(paths[-1])
+        # No memory tier, and each encode waits for the other call's, so both
+        # miss every poster and write its cache file at the same moment.
+        cache = QueryEmbeddingCache(0, self.cache_dir, max_bytes=1 << 20)
+        barrier = threading.Barrier(2, timeout=10)
+
+        class LockstepModel(FakeImageModel):
+            def encode(self, images, **kwargs):
+                barrier.wait()
+                return super().encode(images, **kwargs)
+
+        results = []
+
+        def embed():
+            searcher = MultimodalSearch()
+            searcher._model = LockstepModel()
+            results.append(searcher.embed_images(paths, batch_size=1))
+
+        with mock.patch.object(multimodal_search, "image_embedding_cache", cache):
+            threads = [threading.Thread(target=embed) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), 2)
+        for embeddings, errors in results:
+            self.assertEqual(errors, [None] * len(paths))
+            for embedding in embeddings:
+                np.testing.assert_array_equal(embedding, np.ones(8))
+        self.assertEqual(len(self.cached_files()), len(paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
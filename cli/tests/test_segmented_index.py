@@ -0,0 +1,150 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from lib import segmented_index
+from lib.keyword_search import InvertedIndex
+from lib.segmented_index import SegmentedIndex
+
+from .fakes import make_documents
+
+QUERIES = ["w1 w2", "w10", "w3 w50 w7", "w199 w0"]
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        patcher = mock.patch.object(segmented_index, "CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.documents = make_documents(60)
+        self.idx = SegmentedIndex()
+        self.idx.build(self.documents[:40])
+        self.idx.add_documents(self.documents[40:])
+        self.idx.delete_documents([3, 45])
+
+    def during_merge(self, change):
+        """Patch the merge so `change` runs while its sections are being built"""
+        merge_sections = segmented_index.merge_sections
+
+        def merge_then_change(*args, **kwargs):
+            result = merge_sections(*args, **kwargs)
+            change()
+            return result
+
+        return mock.patch.object(segmented_index, "merge_sections", merge_then_change)
+
+    def assert_matches(self, documents: list[dict]):
+        expected = InvertedIndex(os.path.join(self.cache_dir, "expected.bin"))
+        expected.build(documents)
+        for query in QUERIES:
+            self.assertEqual(
+                self.idx.bm25_search(query, 10), expected.bm25_search(query, 10), query
+            )
+        self.assertEqual(self.idx.doc_count, len(documents))
+
+    def test_apply_during_merge_is_kept(self):
+        edited = [dict(doc) for doc in self.documents]
+        edited[10]["description"] = "w1 w1 w2 rewritten"
+        edited[50]["description"] = "w10 w10 rewritten"
+        del edited[20]
+        final = [doc for doc in edited if doc["id"] not in (3, 45)]
+
+        # The merge runs on its background thread and waits, halfway through,
+        # for the apply on this thread to finish.
+        merging, applied = threading.Event(), threading.Event()
+
+        def wait_for_apply():
+            merging.set()
+            applied.wait(10)
+
+        with self.during_merge(wait_for_apply):
+            thread = self.idx.start_merge()
+            self.assertTrue(merging.wait(10))
+            self.idx.apply(final)
+            applied.set()
+            thread.join(10)
+
+        self.assertEqual(len(self.idx.segments), 2)
+        self.assert_matches(final)
+
+    def test_rebuild_during_merge_discards_the_merge(self):
+        rebuilt = make_documents(25, seed=1)
+
+        with self.during_merge(lambda: self.idx.build(rebuilt)):
+            self.idx.merge()
+
+        self.assertEqual([s.name for s in self.idx.segments], ["index.bin"])
+        self.assert_matches(rebuilt)
+        leftover = [
+            name
+            for name in os.listdir(self.cache_dir)
+            if name.startswith(segmented_index.SEGMENT_PREFIX)
+        ]
+        self.assertEqual(leftover, [])
+
+
+class TieOrderTest(unittest.TestCase):
+    """Equal scores, e.g. the zero-score padding, keep catalog order"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        patcher = mock.patch.object(segmented_index, "CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.documents = make_documents(60)
+        self.idx = SegmentedIndex()
+        self.idx.build(self.documents)
+
+    def assert_matches(self, idx: SegmentedIndex, documents: list[dict]):
+        expected = InvertedIndex(os.path.join(self.cache_dir, "expected.bin"))
+        expected.build(documents)
+        for query in ["w199", "zzzz", "w1 w2"]:
+            for limit in [30, 100]:
+                self.assertEqual(
+                    idx.bm25_search(query, limit),
+                    expected.bm25_search(query, limit),
+                    (query, limit),
+                )
+
+    def test_edited_and_inserted_documents_keep_their_place(self):
+        edited = [dict(doc) for doc in self.documents]
+        edited[5]["description"] = "w1 w2 rewritten"
+        self.idx.apply(edited)
+        self.assert_matches(self.idx, edited)
+
+        edited.insert(20, {"id": 100, "title": "Inserted", "description": "w2 w9"})
+        del edited[40]
+        self.idx.apply(edited)
+        self.assert_matches(self.idx, edited)
+
+        reloaded = SegmentedIndex()
+        reloaded.load()
+        self.assert_matches(reloaded, edited)
+
+        self.idx.merge()
+        self.assertEqual(len(self.idx.segments), 1)
+        self.assert_matches(self.idx, edited)
+
+    def test_added_documents_go_last(self):
+        added = {"id": 100, "title": "Added", "description": "w3"}
+        self.idx.add_documents([added, {**self.documents[2], "description": "w3"}])
+        self.assert_matches(
+            self.idx,
+            self.documents[:2]
+            + [{**self.documents[2], "description": "w3"}]
+            + self.documents[3:]
+            + [added],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
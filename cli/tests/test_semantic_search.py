@@ -0,0 +1,151 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from lib.ann_index import IVFIndex
+from lib.search_utils import SCORE_PRECISION
+from lib.semantic_search import (
+    QueryEmbeddingCache,
+    SemanticSearch,
+    normalize_embeddings,
+)
+
+from .fakes import FakeModel, chunked_search, make_documents
+
+
+class ChunkANNTest(unittest.TestCase):
+    def setUp(self):
+        self.documents = make_documents(200)
+        self.searcher = chunked_search(self.documents, model=FakeModel())
+        # Each movie's chunks sit close together, so they share an IVF list
+        # and a few lists hold many chunks of few movies.
+        rng = np.random.default_rng(3)
+        movies = rng.standard_normal((len(self.documents), 16))
+        chunks = np.repeat(movies, 10, axis=0) + 0.05 * rng.standard_normal(
+            (len(self.documents) * 10, 16)
+        )
+        self.searcher.chunk_embeddings = normalize_embeddings(chunks).astype(np.float32)
+        self.searcher.chunk_metadata = [{} for _ in range(len(chunks))]
+        self.searcher._set_chunk_movie_index(np.repeat(np.arange(len(movies)), 10))
+        self.searcher.ann_index = IVFIndex.build(self.searcher.chunk_embeddings, 50)
+
+    def test_narrow_probe_still_fills_the_limit(self):
+        for query in ["w1 w2", "w30", "w4 w5 w6"]:
+            results = self.searcher.search_chunks(query, limit=20, n_probe=1)
+            self.assertEqual(len({result["id"] for result in results}), 20)
+
+    def test_wide_probe_matches_exact_search(self):
+        for query in ["w1 w2", "w30"]:
+            self.assertEqual(
+                self.searcher.search_chunks(query, limit=5, n_probe=50),
+                self.searcher.search_chunks(query, limit=5, exact=True),
+            )
+
+
+class SearchManyTest(unittest.TestCase):
+    queries = ["w1 w2", "w30", "w4 w5 w6", "w7", "w8 w9"]
+
+    def setUp(self):
+        self.documents = make_documents(500)
+        rng = np.random.default_rng(5)
+        self.embeddings = rng.standard_normal((500, 16)).astype(np.float32)
+
+    def searcher(self, quantization=None, path=None) -> SemanticSearch:
+        searcher = SemanticSearch("fake", quantization)
+        searcher.model = FakeModel()
+        searcher.documents = self.documents
+        searcher.embeddings, searcher.quantized = searcher._prepare_embeddings(
+            path, self.embeddings
+        )
+        return searcher
+
+    def assert_matches_search(self, searcher):
+        batched = searcher.search_many(self.queries, limit=10)
+        for query, results in zip(self.queries, batched):
+            single = searcher.search(query, limit=10)
+            self.assertEqual(
+                [r["title"] for r in results], [r["title"] for r in single]
+            )
+            for a, b in zip(results, single):
+                # Matrix and matrix-vector products round differently.
+                self.assertAlmostEqual(a["score"], b["score"], delta=1e-6)
+                self.assertEqual(
+                    round(a["score"], SCORE_PRECISION),
+                    round(b["score"], SCORE_PRECISION),
+                )
+
+    def test_matches_search(self):
+        self.assert_matches_search(self.searcher())
+
+    def test_quantized_matches_search(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "embeddings.npy")
+            np.save(path, normalize_embeddings(self.embeddings))
+            self.assert_matches_search(self.searcher("int8", path))
+
+
+class QueryEmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.embedding = np.ones(64, dtype=np.float32)
+
+    def files(self) -> list[str]:
+        return [name for name in os.listdir(self.directory) if name.endswith(".npy")]
+
+    def test_disk_tier_is_bounded(self):
+        cache = QueryEmbeddingCache(4, self.directory, max_bytes=4000)
+        for i in range(100):
+            cache.put(f"key{i}", self.embedding)
+        size = sum(os.path.getsize(os.path.join(self.directory, f)) for f in self.files())
+        self.assertLessEqual(size, 4000)
+        self.assertGreater(len(self.files()), 0)
+
+    def test_memory_only_lookups_skip_the_disk(self):
+        cache = QueryEmbeddingCache(4, self.directory)
+        cache.put("memory", self.embedding, disk=False)
+        self.assertEqual(self.files(), [])
+
+        cache.put("disk", self.embedding)
+        restarted = QueryEmbeddingCache(4, self.directory)
+        self.assertIsNone(restarted.get("disk", disk=False))
+        np.testing.assert_array_equal(restarted.get("disk"), self.embedding)
+        self.assertEqual(restarted.disk_hits, 1)
+
+    def test_concurrent_puts_of_one_key(self):
+        cache = QueryEmbeddingCache(0, self.directory)
+        errors = []
+
+        def hammer():
+            try:
+                for _ in range(100):
+                    cache.put("same", self.embedding)
+                    embedding = cache.get("same")
+                    if embedding is not None:
+                        np.testing.assert_array_equal(embedding, self.embedding)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.directory), ["same.npy"])
+
+    def test_truncated_file_is_a_miss(self):
+        cache = QueryEmbeddingCache(4, self.directory)
+        cache.put("key", self.embedding)
+        path = os.path.join(self.directory, "key.npy")
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+        self.assertIsNone(QueryEmbeddingCache(4, self.directory).get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()